@@ -0,0 +1,491 @@
+"""
+Performance benchmarks for the AI backend.
+
+Usage:
+    python benchmarks.py [--record benchmarks.jsonl] import [--runs 5] [--module main]
+    python benchmarks.py corpus-memory [--workers 4] [--questions 100000]
+    python benchmarks.py top-k [--sizes 10000 100000 1000000] [--queries 50]
+    python benchmarks.py preprocess [--workers 1 2 4 8] [--documents 2000]
+    python benchmarks.py variants [--variants 1000] [--questions 20]
+    python benchmarks.py equations [--runs 5] [--renders 2000]
+    python benchmarks.py layout [--questions 50] [--runs 20]
+
+Results are printed as JSON; with --record they are also appended to a JSON
+Lines history file so regressions can be compared release to release.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Imports the module in a fresh interpreter and reports how long it took
+_IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+app = getattr({module}, "app", None)
+print(elapsed, getattr(app, "version", ""))
+"""
+
+# Time to import the equation handler and render the first equation
+_FIRST_EQUATION_SCRIPT = """
+import time
+start = time.perf_counter()
+import equation_handler
+imported = time.perf_counter() - start
+equation_handler.EquationHandler()._render_equation("quadratic", "medium")
+print(imported, time.perf_counter() - start)
+"""
+
+def benchmark_import(module: str = "main", runs: int = 5) -> Dict[str, Any]:
+    """Measure cold import time of ``module`` over ``runs`` fresh interpreters."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", WARMUP_ON_STARTUP="false")
+    timings: List[float] = []
+    version = ""
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT.format(module=module)],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        version = output[1] if len(output) > 1 else version
+
+    return {
+        "benchmark": "import",
+        "module": module,
+        "version": version,
+        "runs": runs,
+        "median_seconds": round(statistics.median(timings), 4),
+        "min_seconds": round(min(timings), 4),
+        "max_seconds": round(max(timings), 4),
+    }
+
+_QUESTION_TEMPLATES = [
+    "Explain {0} and {1} with reference to {2}.",
+    "What is the difference between {0} and {1}?",
+    "Describe how {0} affects {1} in {2} systems.",
+    "Define {0}. Give an example of {1} applied to {2}.",
+    "Compare {0}, {1} and {2} with suitable diagrams.",
+]
+
+def synthetic_questions(n: int, vocabulary: int = 20000, seed: int = 7) -> List[str]:
+    """Deterministic question-like texts drawing terms from a Zipf-shaped vocabulary."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = ["".join(rng.choice(letters, size=rng.integers(4, 10))) for _ in range(vocabulary)]
+    terms = np.minimum(rng.zipf(1.3, size=(n, 6)) - 1, vocabulary - 1)
+    templates = rng.integers(0, len(_QUESTION_TEMPLATES), size=n)
+    questions = []
+    for row, template in zip(terms, templates):
+        picked = [words[i] for i in row]
+        phrases = [" ".join(picked[0:2]), " ".join(picked[2:4]), " ".join(picked[4:6])]
+        questions.append(_QUESTION_TEMPLATES[template].format(*phrases))
+    return questions
+
+# Opens a corpus (memory mapped, or fully loaded into private memory), answers
+# queries, then reports its memory once every worker is holding the corpus
+_CORPUS_WORKER_SCRIPT = """
+import json, sys
+import numpy as np
+
+def memory():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+from corpus_store import CorpusStore
+import scipy.sparse as sp
+# Import the vectoriser stack first so only the corpus itself is measured
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from similarity_analyzer import preprocess_text
+preprocess_text("warm up the stemmer")
+
+before = memory()
+corpus = CorpusStore(sys.argv[1]).open("benchmark")
+matrix = corpus.matrix
+if sys.argv[2] == "copy":
+    matrix = sp.csr_matrix((np.array(matrix.data), np.array(matrix.indices), np.array(matrix.indptr)),
+                           shape=matrix.shape)
+    corpus.matrix = matrix
+for i in range(int(sys.argv[3])):
+    corpus.max_similarity(corpus.text(i * 997 % len(corpus)))
+print("ready", flush=True)
+sys.stdin.readline()
+after = memory()
+print(json.dumps({key: after.get(key, 0) - before.get(key, 0)
+                  for key in ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean")}), flush=True)
+"""
+
+def benchmark_corpus_memory(workers: int = 4, questions: int = 100000, queries: int = 20,
+                            corpus_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Memory of ``workers`` processes holding one course corpus, memory mapped
+    versus loaded into each process. Linux only (reads /proc/self/smaps_rollup).
+    """
+    from corpus_store import CorpusStore
+
+    corpus_dir = corpus_dir or tempfile.mkdtemp(prefix="corpus-benchmark-")
+    store = CorpusStore(corpus_dir)
+    build_start = time.perf_counter()
+    if store.stats("benchmark") is None or store.stats("benchmark")["questions"] != questions:
+        store.publish("benchmark", synthetic_questions(questions))
+    build_seconds = time.perf_counter() - build_start
+    corpus_bytes = sum(
+        os.path.getsize(os.path.join(store.open("benchmark").path, name))
+        for name in ("data.npy", "indices.npy", "indptr.npy", "texts.bin", "text_offsets.npy", "idf.npy")
+    )
+
+    result: Dict[str, Any] = {
+        "benchmark": "corpus-memory",
+        "workers": workers,
+        "questions": questions,
+        "corpus_mb": round(corpus_bytes / 2 ** 20, 1),
+        "build_seconds": round(build_seconds, 1),
+    }
+    for mode in ("mmap", "copy"):
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", _CORPUS_WORKER_SCRIPT, corpus_dir, mode, str(queries)],
+                cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            assert process.stdout.readline().strip() == "ready"
+        # Every worker now holds the corpus; measure them together so PSS splits shared pages
+        reports = []
+        for process in processes:
+            process.stdin.write("\n")
+            process.stdin.flush()
+            reports.append(json.loads(process.stdout.readline()))
+        for process in processes:
+            process.wait()
+        result[mode] = {
+            "total_pss_mb": round(sum(r["Pss"] for r in reports) / 1024, 1),
+            "total_private_mb": round(sum(r["Private_Clean"] + r["Private_Dirty"] for r in reports) / 1024, 1),
+            "per_worker_rss_mb": round(statistics.mean(r["Rss"] for r in reports) / 1024, 1),
+        }
+    return result
+
+def benchmark_top_k(sizes: List[int], queries: int = 50, k: int = 5,
+                    corpus_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Latency of corpus top-k retrieval through the inverted index, against a
+    full scan of the corpus matrix, for each corpus size.
+    """
+    from corpus_store import CorpusStore
+
+    corpus_dir = corpus_dir or tempfile.mkdtemp(prefix="topk-benchmark-")
+    store = CorpusStore(corpus_dir)
+    questions = synthetic_questions(max(sizes))
+    # Queries reuse parts of stored questions with unseen text, as new papers would
+    rng_questions = synthetic_questions(queries, seed=11)
+    probes = [f"{questions[i * 7919 % len(questions)].split(' and ')[0]} {probe}"
+              for i, probe in enumerate(rng_questions)]
+
+    result: Dict[str, Any] = {"benchmark": "top-k", "k": k, "queries": queries, "sizes": {}}
+    for size in sizes:
+        course = f"benchmark-{size}"
+        if store.stats(course) is None or store.stats(course)["questions"] != size:
+            store.publish(course, questions[:size])
+        corpus = store.open(course)
+
+        timings = {"inverted": [], "scan": []}
+        for probe in probes:
+            vector = corpus.engine.transform([probe])
+            start = time.perf_counter()
+            corpus.inverted_index.top_k(vector, k)
+            timings["inverted"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            scores = (corpus.matrix @ vector.astype("float32").T).toarray().ravel()
+            scores.argpartition(len(scores) - k)
+            timings["scan"].append(time.perf_counter() - start)
+
+        result["sizes"][size] = {
+            name: {"median_ms": round(statistics.median(values) * 1000, 3),
+                   "p95_ms": round(sorted(values)[int(0.95 * (len(values) - 1))] * 1000, 3)}
+            for name, values in timings.items()
+        }
+    return result
+
+def benchmark_preprocess(worker_counts: List[int], documents: int = 2000,
+                         questions_per_paper: int = 30) -> Dict[str, Any]:
+    """Throughput of preprocess_documents over long previous papers, by pool size."""
+    from similarity_analyzer import _preprocess_chunk, create_preprocess_pool, preprocess_documents
+
+    questions = synthetic_questions(documents * questions_per_paper)
+    papers = [" ".join(questions[i:i + questions_per_paper])
+              for i in range(0, len(questions), questions_per_paper)]
+
+    result: Dict[str, Any] = {
+        "benchmark": "preprocess",
+        "documents": len(papers),
+        "avg_document_chars": round(statistics.mean(len(paper) for paper in papers)),
+        "cpu_count": os.cpu_count(),
+        "workers": {},
+    }
+    for workers in worker_counts:
+        pool = create_preprocess_pool(workers) if workers > 1 else None
+        try:
+            # Start every worker (and import the stemmer) before timing
+            if pool is not None:
+                list(pool.map(_preprocess_chunk, [["warm up"]] * workers))
+            else:
+                _preprocess_chunk(["warm up"])
+            start = time.perf_counter()
+            preprocess_documents(papers, pool=pool, workers=workers)
+            elapsed = time.perf_counter() - start
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        result["workers"][workers] = {
+            "seconds": round(elapsed, 3),
+            "documents_per_second": round(len(papers) / elapsed, 1),
+        }
+    return result
+
+def benchmark_variants(variants: int = 1000, questions: int = 20, seed: int = 7) -> Dict[str, Any]:
+    """Time to instance per-student variants of a paper of templated equation questions."""
+    import numpy as np
+    from equation_handler import EQUATION_TEMPLATES, EquationHandler
+    from models import Question
+
+    start = time.perf_counter()
+    for template in EQUATION_TEMPLATES.values():
+        template.function
+    compile_seconds = time.perf_counter() - start
+
+    keys = list(EQUATION_TEMPLATES)
+    rng = np.random.default_rng(seed)
+    paper = []
+    for i in range(questions):
+        equation_type, difficulty = keys[i % len(keys)]
+        latex_strings, _ = EQUATION_TEMPLATES[(equation_type, difficulty)].instantiate(1, rng)
+        paper.append(Question(
+            id=f"q{i + 1}", question_text=f"Solve ${latex_strings[0]}$ for x.",
+            question_type="short_answer", difficulty=difficulty, blooms_level="apply", marks=5,
+            has_equations=True, equation_latex=latex_strings[0], equation_type=equation_type
+        ))
+
+    handler = EquationHandler()
+    start = time.perf_counter()
+    handler.instantiate_variants(paper, variants, seed)
+    elapsed = time.perf_counter() - start
+    return {
+        "benchmark": "variants",
+        "variants": variants,
+        "questions": questions,
+        "compile_seconds": round(compile_seconds, 3),
+        "seconds": round(elapsed, 3),
+        "questions_per_second": round(variants * questions / elapsed),
+    }
+
+def benchmark_equations(runs: int = 5, renders: int = 2000) -> Dict[str, Any]:
+    """
+    Startup cost of the equation handler and the effect of the LaTeX cache.
+
+    Importing equation_handler no longer imports sympy; the first equation
+    pays for it instead, so requests without equations never do.
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", EQUATION_POOL_CACHE="")
+    imports, first_equations = [], []
+    for _ in range(runs):
+        imported, first = map(float, subprocess.run(
+            [sys.executable, "-c", _FIRST_EQUATION_SCRIPT],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout.split())
+        imports.append(imported)
+        first_equations.append(first)
+
+    import random
+    import equation_handler
+    from equation_handler import POOLED_EQUATION_TYPES, DIFFICULTIES, EquationHandler
+
+    handler = EquationHandler()
+    handler.pool.cache_path = ""
+    keys = [(t, d) for t in POOLED_EQUATION_TYPES for d in DIFFICULTIES]
+
+    def render_all(seed: int) -> float:
+        random.seed(seed)
+        start = time.perf_counter()
+        for i in range(renders):
+            handler._render_equation(*keys[i % len(keys)])
+        return time.perf_counter() - start
+
+    cached = equation_handler.equation_latex
+    equation_handler.equation_latex = cached.__wrapped__
+    try:
+        render_all(0)  # import sympy and fill its own caches
+        uncached_seconds = render_all(1)
+    finally:
+        equation_handler.equation_latex = cached
+    cached.cache_clear()
+    cold_seconds = render_all(1)
+    # Same draws again: every parameter set is cached, as once a server has run a while
+    warm_seconds = render_all(1)
+
+    return {
+        "benchmark": "equations",
+        "runs": runs,
+        "import_seconds": round(statistics.median(imports), 4),
+        "import_and_first_equation_seconds": round(statistics.median(first_equations), 4),
+        "renders": renders,
+        "uncached_ms_per_render": round(uncached_seconds / renders * 1000, 4),
+        "cold_cache_ms_per_render": round(cold_seconds / renders * 1000, 4),
+        "warm_cache_ms_per_render": round(warm_seconds / renders * 1000, 4),
+        "latex_cache": cached.cache_info()._asdict(),
+    }
+
+def benchmark_layout(questions: int = 50, runs: int = 20) -> Dict[str, Any]:
+    """Layout build (uncached and cached) and each export renderer, timed separately."""
+    from models import Question, QuestionPaper
+    from paper_layout import DocxRenderer, HTMLRenderer, MissingDependencyError, build_layout, get_layout
+    from pdf_exporter import PDFExporter
+
+    paper = QuestionPaper(
+        id="layout-benchmark", title="Layout Benchmark",
+        header_info={"university_name": "Benchmark University", "department": "Computer Science"},
+        questions=[
+            Question(
+                id=f"q{i}", question_text=f"Explain concept {i} and give an example.",
+                question_type="multiple_choice" if i % 2 else "short_answer",
+                difficulty="medium", blooms_level="understand", marks=2,
+                options=[f"option {i}-{j}" for j in range(4)] if i % 2 else None,
+                correct_answer="1" if i % 2 else f"Answer {i}", explanation=f"Because {i}."
+            )
+            for i in range(questions)
+        ],
+        total_marks=2 * questions,
+        generated_at="2026-01-01T00:00:00"
+    )
+
+    def median_ms(function) -> float:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return round(statistics.median(timings) * 1000, 3)
+
+    layout = get_layout(paper, True, True)
+    renderers = {"pdf": PDFExporter(), "html": HTMLRenderer(), "docx": DocxRenderer()}
+
+    # Re-export after swapping one question: only that question's flowables are rebuilt
+    exporter = PDFExporter()
+    swapped = layout.model_copy(deep=True)
+    swapped.questions[0].text += " (alternative)"
+    exporter.render(layout)
+    reexport_ms = median_ms(lambda: exporter.render(swapped))
+
+    # First-page preview with its short-lived cache disabled
+    exporter.preview_cache_seconds = 0
+    try:
+        exporter.render_preview(layout)
+        preview_ms = median_ms(lambda: exporter.render_preview(layout))
+    except MissingDependencyError:
+        preview_ms = "unavailable"
+    render_ms = {}
+    for name, renderer in renderers.items():
+        try:
+            renderer.render(layout)
+        except MissingDependencyError:
+            render_ms[name] = "unavailable"
+            continue
+        render_ms[name] = median_ms(lambda: renderer.render(layout))
+
+    return {
+        "benchmark": "layout",
+        "questions": questions,
+        "runs": runs,
+        "build_layout_ms": median_ms(lambda: build_layout(paper, True, True)),
+        "cached_layout_ms": median_ms(lambda: get_layout(paper, True, True)),
+        "render_ms": render_ms,
+        "pdf_reexport_one_changed_ms": reexport_ms,
+        "png_first_page_preview_ms": preview_ms,
+    }
+
+def record_result(result: Dict[str, Any], path: str):
+    """Append a benchmark result to a JSON Lines history file."""
+    entry = dict(result, recorded_at=datetime.now().isoformat(), python=sys.version.split()[0])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI backend benchmarks")
+    parser.add_argument("--record", help="append results to this JSON Lines file")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    import_parser = subparsers.add_parser("import", help="cold import time of the API module")
+    import_parser.add_argument("--module", default="main")
+    import_parser.add_argument("--runs", type=int, default=5)
+
+    corpus_parser = subparsers.add_parser("corpus-memory", help="memory of workers sharing a course corpus")
+    corpus_parser.add_argument("--workers", type=int, default=4)
+    corpus_parser.add_argument("--questions", type=int, default=100000)
+    corpus_parser.add_argument("--queries", type=int, default=20)
+    corpus_parser.add_argument("--corpus-dir", help="reuse a corpus directory between runs")
+
+    top_k_parser = subparsers.add_parser("top-k", help="inverted-index top-k latency by corpus size")
+    top_k_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    top_k_parser.add_argument("--queries", type=int, default=50)
+    top_k_parser.add_argument("--k", type=int, default=5)
+    top_k_parser.add_argument("--corpus-dir", help="reuse a corpus directory between runs")
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="preprocessing throughput by worker count")
+    preprocess_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    preprocess_parser.add_argument("--documents", type=int, default=2000)
+
+    variants_parser = subparsers.add_parser("variants", help="per-student paper variant instancing")
+    variants_parser.add_argument("--variants", type=int, default=1000)
+    variants_parser.add_argument("--questions", type=int, default=20)
+
+    equations_parser = subparsers.add_parser("equations", help="equation handler startup and LaTeX cache")
+    equations_parser.add_argument("--runs", type=int, default=5)
+    equations_parser.add_argument("--renders", type=int, default=2000)
+
+    layout_parser = subparsers.add_parser("layout", help="layout build and per-format render time")
+    layout_parser.add_argument("--questions", type=int, default=50)
+    layout_parser.add_argument("--runs", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    if args.benchmark == "import":
+        result = benchmark_import(args.module, args.runs)
+    elif args.benchmark == "corpus-memory":
+        result = benchmark_corpus_memory(args.workers, args.questions, args.queries, args.corpus_dir)
+    elif args.benchmark == "top-k":
+        result = benchmark_top_k(args.sizes, args.queries, args.k, args.corpus_dir)
+    elif args.benchmark == "preprocess":
+        result = benchmark_preprocess(args.workers, args.documents)
+    elif args.benchmark == "variants":
+        result = benchmark_variants(args.variants, args.questions)
+    elif args.benchmark == "equations":
+        result = benchmark_equations(args.runs, args.renders)
+    elif args.benchmark == "layout":
+        result = benchmark_layout(args.questions, args.runs)
+
+    result["wall_seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(result, indent=2))
+    if args.record:
+        record_result(result, args.record)
+    return result
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from similarity_analyzer import HashingSimilarityEngine, InvertedIndex, learn_idf, segment_paper
+
+_COURSE_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+class CourseCorpus:
+    """
+    One published version of a course's previous-question corpus, opened read-only.
+
+    The CSR arrays, IDF table and question texts are memory mapped, so every
+    worker process that opens the same version shares a single page-cache copy.
+    """
+
+    def __init__(self, path: str):
+        import scipy.sparse as sp
+
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        self.version = os.path.basename(path)
+        self.n_features = self.meta["n_features"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.matrix = sp.csr_matrix(
+            (load("data.npy"), load("indices.npy"), load("indptr.npy")),
+            shape=(self.meta["questions"], self.n_features),
+            copy=False
+        )
+        # Versions published before postings were stored fall back to a full scan
+        self.inverted_index = None
+        if os.path.exists(os.path.join(path, "postings_indptr.npy")):
+            self.inverted_index = InvertedIndex(
+                load("postings_indptr.npy"), load("postings_documents.npy"),
+                load("postings_weights.npy"), load("term_max.npy")
+            )
+        self._text_offsets = load("text_offsets.npy")
+        self._texts = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r") \
+            if self._text_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.engine = HashingSimilarityEngine(
+            n_features=self.n_features,
+            idf_path=os.path.join(path, "idf.npy"),
+            cache_size=0
+        )
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def text(self, i: int) -> str:
+        start, end = self._text_offsets[i], self._text_offsets[i + 1]
+        return bytes(self._texts[start:end]).decode("utf-8")
+
+    def scores(self, question: str) -> np.ndarray:
+        """Cosine similarity (0-1) between the question and every stored question."""
+        # Match the stored float32 data so the product never upcasts (copies) the corpus
+        vector = self.engine.transform([question]).astype(np.float32)
+        return (self.matrix @ vector.T).toarray().ravel()
+
+    def search(self, question: str, k: int):
+        """(question ids, cosine scores) of the k best matches, best first."""
+        if self.inverted_index is not None:
+            return self.inverted_index.top_k(self.engine.transform([question]), k)
+        scores = self.scores(question)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return best, scores[best]
+
+    def max_similarity(self, question: str) -> float:
+        """Similarity percentage to the closest stored question."""
+        if not len(self):
+            return 0.0
+        _, scores = self.search(question, 1)
+        return min(float(scores[0]) * 100, 100.0) if len(scores) else 0.0
+
+    def top_k(self, question: str, k: int = 5) -> List[Dict[str, Any]]:
+        """The k most similar stored questions with their similarity percentages."""
+        if not len(self) or k <= 0:
+            return []
+        ids, scores = self.search(question, k)
+        return [
+            {"question_index": int(i), "question_text": self.text(i),
+             "similarity_percentage": min(float(score) * 100, 100.0)}
+            for i, score in zip(ids, scores) if score > 0
+        ]
+
+class CorpusStore:
+    """
+    Per-course similarity corpora persisted on disk.
+
+    Each course directory holds immutable versions (CSR arrays, IDF table,
+    question texts) and a CURRENT file naming the live one. Publishing writes
+    a new version and swaps CURRENT with os.replace, so readers in any worker
+    see either the old or the new corpus, never a partial one. Versions are
+    opened with memory mapping and cached per process. Publishes to one course
+    are serialised with a file lock, so concurrent additions from any worker
+    each build on the previous one.
+    """
+
+    def __init__(self, root: Optional[str] = None, keep_versions: int = 2, check_interval: float = 2.0):
+        self.root = root or os.getenv("CORPUS_DIR", "corpora")
+        self.keep_versions = keep_versions
+        self.check_interval = check_interval
+        self._open: Dict[str, CourseCorpus] = {}
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _course_dir(self, course: str) -> str:
+        """The course's directory under root; ValueError for a code that cannot name one."""
+        name = _COURSE_RE.sub("_", course)
+        # "", "." and ".." survive sanitising but would name root or its parent
+        if not name.strip("."):
+            raise ValueError(f"Invalid course code: {course!r}")
+        path = os.path.join(self.root, name)
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.root):
+            raise ValueError(f"Invalid course code: {course!r}")
+        return path
+
+    @contextmanager
+    def _publish_lock(self, course: str):
+        """Exclusive per-course lock held across processes while a version is published."""
+        course_dir = self._course_dir(course)
+        os.makedirs(course_dir, exist_ok=True)
+        fd = os.open(os.path.join(course_dir, "publish.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                import fcntl
+            except ImportError:
+                # No flock (Windows): publishes are not serialised across processes
+                fcntl = None
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def _remember(self, course: str, corpus: CourseCorpus):
+        with self._lock:
+            self._open[course] = corpus
+            self._checked[course] = time.monotonic()
+
+    def current_version(self, course: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self._course_dir(course), "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def open(self, course: str) -> Optional[CourseCorpus]:
+        """The live corpus for a course, or None if none was published."""
+        now = time.monotonic()
+        with self._lock:
+            corpus = self._open.get(course)
+            if corpus is not None and now - self._checked.get(course, 0.0) < self.check_interval:
+                return corpus
+
+        try:
+            version = self.current_version(course)
+        except ValueError:
+            # A code that cannot name a course directory has nothing published
+            return None
+        if version is None:
+            return None
+        if corpus is None or corpus.version != version:
+            corpus = CourseCorpus(os.path.join(self._course_dir(course), version))
+        self._remember(course, corpus)
+        return corpus
+
+    def publish(self, course: str, questions: List[str], n_features: Optional[int] = None) -> str:
+        """Write ``questions`` as a new corpus version and make it live. Returns the version."""
+        if not questions:
+            raise ValueError("No questions to publish")
+        with self._publish_lock(course):
+            return self._publish(course, questions, n_features)
+
+    def _publish(self, course: str, questions: List[str], n_features: Optional[int]) -> str:
+        course_dir = self._course_dir(course)
+        os.makedirs(course_dir, exist_ok=True)
+        version = f"v{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(course_dir, version)
+        # Written under a name _prune ignores and renamed into place, so a
+        # failed publish leaves no partial version behind
+        staging = os.path.join(course_dir, f".staging-{version}")
+        os.makedirs(staging)
+        try:
+            self._write_version(staging, course, questions, n_features)
+            os.rename(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        # Atomic swap: readers see the old or the new version, never a mix
+        tmp = os.path.join(course_dir, f"CURRENT.{uuid.uuid4().hex}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(course_dir, "CURRENT"))
+        self._prune(course_dir, version)
+        self._remember(course, CourseCorpus(path))
+        return version
+
+    def _write_version(self, path: str, course: str, questions: List[str], n_features: Optional[int]):
+        """Write the arrays, texts and metadata of one corpus version into ``path``."""
+        idf_path = os.path.join(path, "idf.npy")
+        idf = learn_idf(questions, idf_path, n_features=n_features)
+        engine = HashingSimilarityEngine(n_features=len(idf), idf_path=idf_path, cache_size=0)
+        matrix = engine.transform(questions)
+
+        # scipy keeps int32 index arrays unless they overflow; matching it avoids
+        # a private copy of indptr/indices in every worker
+        index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+        np.save(os.path.join(path, "data.npy"), matrix.data.astype(np.float32))
+        np.save(os.path.join(path, "indices.npy"), matrix.indices.astype(index_dtype))
+        np.save(os.path.join(path, "indptr.npy"), matrix.indptr.astype(index_dtype))
+
+        for name, array in InvertedIndex.postings_arrays(matrix).items():
+            if name in ("indptr", "documents"):
+                array = array.astype(index_dtype)
+            np.save(os.path.join(path, name if name == "term_max" else f"postings_{name}") + ".npy", array)
+
+        encoded = [question.encode("utf-8") for question in questions]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        np.save(os.path.join(path, "text_offsets.npy"), offsets)
+        with open(os.path.join(path, "texts.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "course": course,
+                "engine": "hashing",
+                "n_features": len(idf),
+                "questions": len(questions),
+                "created_at": time.time(),
+            }, f)
+
+    def publish_papers(self, course: str, papers: List[str]) -> str:
+        """Segment whole papers into questions and publish them."""
+        questions = [body for paper in papers for _, body in segment_paper(paper)]
+        return self.publish(course, questions)
+
+    def add_papers(self, course: str, papers: List[str]) -> str:
+        """Publish a new version holding the current questions plus those in ``papers``."""
+        added = [body for paper in papers for _, body in segment_paper(paper)]
+        if not added:
+            raise ValueError("No questions to publish")
+        with self._publish_lock(course):
+            # The live version read under the lock, never the cached one, which
+            # may be up to check_interval old or superseded by another worker
+            version = self.current_version(course)
+            corpus = CourseCorpus(os.path.join(self._course_dir(course), version)) if version else None
+            existing = [corpus.text(i) for i in range(len(corpus))] if corpus is not None else []
+            return self._publish(course, existing + added, corpus.n_features if corpus else None)
+
+    def _prune(self, course_dir: str, live: str):
+        """Delete old versions; open memory maps keep their data until closed."""
+        versions = sorted(
+            (name for name in os.listdir(course_dir)
+             if name.startswith("v") and os.path.isdir(os.path.join(course_dir, name))),
+            key=lambda name: os.path.getmtime(os.path.join(course_dir, name))
+        )
+        for name in versions[:-self.keep_versions]:
+            if name != live:
+                shutil.rmtree(os.path.join(course_dir, name), ignore_errors=True)
+
+    def stats(self, course: str) -> Optional[Dict[str, Any]]:
+        corpus = self.open(course)
+        if corpus is None:
+            return None
+        return {"version": corpus.version, "questions": len(corpus), "n_features": corpus.n_features}
@@ -1,10 +1,411 @@
+import bisect
+import json
+import os
 import re
-import sympy as sp
-from sympy import symbols, latex, simplify, expand, factor
-from typing import List, Dict, Optional
+import string
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, List, Dict, Optional, Tuple
 import random
 
-from models import Question
+import numpy as np
+
+from models import Question, QuestionType
+
+def _sympy():
+    """sympy, imported on the first equation rather than at startup (~0.5 s)."""
+    import sympy
+    return sympy
+
+# Indexed by the random choice in _generate_trigonometric_equation
+TRIGONOMETRIC_FORMS = {
+    'easy': ['sin(x)', 'cos(x)', 'tan(x)'],
+    'medium': ['sin(2*x) + cos(x)', 'sin(x)**2 + cos(x)**2'],
+    'hard': ['sin(x) * cos(x) + tan(x)', 'sin(x + pi/4)'],
+}
+
+def _build_equation(form: str, *params):
+    sp = _sympy()
+    x = sp.symbols('x')
+    if form == 'linear':
+        # c x on the right only for hard equations (c = 0 otherwise)
+        c, a, b, d = params
+        return sp.Eq(a*x + b, c*x + d)
+    if form == 'quadratic':
+        a, b, c = params
+        return sp.Eq(a*x**2 + b*x + c, 0)
+    if form == 'calculus':
+        return {'easy': x**2 + 3*x + 1, 'medium': sp.sin(x**2) + sp.exp(x), 'hard': x**3 * sp.sin(x)}[params[0]]
+    if form == 'trigonometric':
+        difficulty, choice, k = params
+        return sp.Eq(sp.sympify(TRIGONOMETRIC_FORMS[difficulty][choice]), k)
+    if form == 'power':
+        a, y = params
+        return sp.Eq(a**x, y)
+    if form == 'exponential':
+        a, b, c, y = params
+        return sp.Eq(a * sp.exp(b*x) + c, y)
+    if form == 'logarithmic':
+        a, k, b, y = params
+        return sp.Eq(a * sp.log(k*x) + b, y)
+    raise ValueError(f"unknown equation form: {form}")
+
+@lru_cache(maxsize=int(os.getenv("LATEX_CACHE_SIZE", "16384")))
+def equation_latex(form: str, *params) -> str:
+    """
+    LaTeX for an equation form and its parameters, which fix the expression's
+    structure. Memoized on them, so a repeat skips building the sympy
+    expression (the slow part) as well as sympy.latex.
+    """
+    expression = _sympy().latex(_build_equation(form, *params))
+    if form == 'calculus':
+        return (r"\int " + expression + " dx") if params[0] == 'hard' else (r"\frac{d}{dx}(" + expression + ")")
+    return expression
+
+# Equation types rendered through sympy; the others are picked from fixed lists
+POOLED_EQUATION_TYPES = ['linear', 'quadratic', 'trigonometric', 'exponential', 'logarithmic', 'calculus']
+DIFFICULTIES = ['easy', 'medium', 'hard']
+
+# Keyword weights per equation type. Specific terms outweigh generic ones, so
+# "the mean of the derivative" is calculus rather than statistics.
+EQUATION_KEYWORDS: Dict[str, Dict[str, float]] = {
+    'calculus': {'derivative': 3, 'differentiate': 3, 'integral': 3, 'integrate': 3,
+                 'differential': 3, 'calculus': 3, 'limit': 1},
+    'quadratic': {'quadratic': 3, 'parabola': 2},
+    'linear': {'linear': 2},
+    'exponential': {'exponential': 3},
+    'logarithmic': {'logarithm': 3, 'logarithmic': 3, 'log': 2, 'ln': 2},
+    'trigonometric': {'trigonometry': 3, 'trigonometric': 3, 'sine': 2, 'cosine': 2, 'tangent': 2,
+                      'sin': 2, 'cos': 2, 'tan': 2},
+    'physics': {'force': 1, 'velocity': 2, 'acceleration': 2, 'energy': 1, 'momentum': 2, 'pressure': 1},
+    'chemistry': {'chemistry': 3, 'chemical': 2, 'reaction': 1, 'ph': 2, 'concentration': 1},
+    'statistics': {'statistics': 3, 'statistical': 3, 'probability': 2, 'variance': 2,
+                   'standard deviation': 3, 'mean': 1},
+}
+
+class EquationTypeClassifier:
+    """
+    Weighted keyword classifier for the equation type a question calls for.
+
+    All keywords are compiled once into a single word-boundary alternation, so a
+    text is scanned in one pass and "ph" no longer matches inside "graph".
+    Plurals ("derivatives", "limits") count as the keyword.
+    """
+
+    def __init__(self, keywords: Optional[Dict[str, Dict[str, float]]] = None, default: str = 'linear'):
+        keywords = keywords or EQUATION_KEYWORDS
+        self.default = default
+        self.types = list(keywords)
+        self._weights: Dict[str, Tuple[str, float]] = {
+            keyword: (equation_type, weight)
+            for equation_type, weights in keywords.items() for keyword, weight in weights.items()
+        }
+        # Longest first, so "standard deviation" wins over any shorter overlap
+        alternation = '|'.join(
+            re.escape(keyword).replace(r'\ ', r'\s+')
+            for keyword in sorted(self._weights, key=len, reverse=True)
+        )
+        self._pattern = re.compile(rf"\b({alternation})(?:e?s)?\b")
+
+    def _keyword(self, match: 're.Match') -> str:
+        return ' '.join(match.group(1).split())
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Summed keyword weight per equation type (types without matches are omitted)."""
+        scores: Dict[str, float] = {}
+        for match in self._pattern.finditer(text.lower()):
+            equation_type, weight = self._weights[self._keyword(match)]
+            scores[equation_type] = scores.get(equation_type, 0) + weight
+        return scores
+
+    def _best(self, scores: Dict[str, float]) -> str:
+        if not scores:
+            return self.default
+        # Ties go to the type listed first in the keyword table
+        return max(self.types, key=lambda equation_type: scores.get(equation_type, 0))
+
+    def classify(self, text: str) -> str:
+        return self._best(self.scores(text))
+
+    def classify_batch(self, texts: List[str]) -> List[str]:
+        """Classify a whole paper's questions with a single scan over their joined text."""
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+        scores: List[Dict[str, float]] = [{} for _ in texts]
+        for match in self._pattern.finditer('\n'.join(texts).lower()):
+            equation_type, weight = self._weights[self._keyword(match)]
+            question_scores = scores[bisect.bisect_right(starts, match.start()) - 1]
+            question_scores[equation_type] = question_scores.get(equation_type, 0) + weight
+        return [self._best(question_scores) for question_scores in scores]
+
+equation_type_classifier = EquationTypeClassifier()
+
+class EquationPool:
+    """
+    Pre-rendered LaTeX equations per (equation type, difficulty).
+
+    Each entry is one independent draw from the generator, and every entry is
+    handed out once, so drawing from the pool is statistically the same as
+    calling the generator. When a pool drops below half full it is refilled in
+    a background thread; an empty pool falls back to rendering inline.
+
+    Unused entries can be saved to a cache file and loaded at the next start.
+    Loading claims the file by renaming it, so workers started together never
+    hand out the same equations.
+    """
+
+    def __init__(self, generate: Callable[[str, str], str], size: Optional[int] = None,
+                 cache_path: Optional[str] = None):
+        self.generate = generate
+        self.size = size if size is not None else int(os.getenv("EQUATION_POOL_SIZE", "64"))
+        self.cache_path = cache_path if cache_path is not None else os.getenv(
+            "EQUATION_POOL_CACHE", "equation_pool.json"
+        )
+        self._pools: Dict[Tuple[str, str], Deque[str]] = {
+            (equation_type, difficulty): deque()
+            for equation_type in POOLED_EQUATION_TYPES for difficulty in DIFFICULTIES
+        }
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._pools
+
+    def draw(self, equation_type: str, difficulty: str) -> str:
+        """Take one equation, rendering inline only if the pool is empty."""
+        key = (equation_type, difficulty)
+        pool = self._pools[key]
+        try:
+            equation = pool.popleft()
+        except IndexError:
+            equation = self.generate(equation_type, difficulty)
+        if len(pool) < self.size // 2:
+            self._refill_in_background(key)
+        return equation
+
+    def fill(self, key: Tuple[str, str]):
+        pool = self._pools[key]
+        while len(pool) < self.size:
+            pool.append(self.generate(*key))
+
+    def fill_all(self):
+        """Fill every pool (blocking); used at warm-up."""
+        for key in self._pools:
+            self.fill(key)
+
+    def _refill_in_background(self, key: Tuple[str, str]):
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+
+        def refill():
+            try:
+                self.fill(key)
+            finally:
+                with self._lock:
+                    self._refilling.discard(key)
+
+        threading.Thread(target=refill, name=f"equation-pool-{key[0]}-{key[1]}", daemon=True).start()
+
+    def load(self) -> int:
+        """Claim and load the cache file. Returns the number of equations loaded."""
+        if not self.cache_path:
+            return 0
+        claimed = f"{self.cache_path}.{os.getpid()}"
+        try:
+            os.replace(self.cache_path, claimed)
+        except FileNotFoundError:
+            return 0
+        try:
+            with open(claimed, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        finally:
+            os.remove(claimed)
+
+        loaded = 0
+        for name, equations in cached.items():
+            key = tuple(name.split("/", 1))
+            if key in self._pools:
+                self._pools[key].extend(equations)
+                loaded += len(equations)
+        return loaded
+
+    def save(self):
+        """Write the unused equations to the cache file for the next start."""
+        if not self.cache_path:
+            return
+        cached = {f"{equation_type}/{difficulty}": list(pool)
+                  for (equation_type, difficulty), pool in self._pools.items() if pool}
+        tmp = f"{self.cache_path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(tmp, self.cache_path)
+
+class _LatexFormatter(string.Formatter):
+    """
+    str.format laying out integer coefficients the way sympy.latex does.
+
+    ``{a:*x}`` is the leading term a x ("3 x", "x", "- x"), and ``{a:*}`` a
+    coefficient for the text after it ("3 ", "", "- "). ``{b:+x}`` is a
+    further term (" + 3 x", " - x") and ``{c:+}`` a constant (" + 5",
+    " - 5"); both vanish when the value is 0. "^2" in a suffix renders as
+    "^{2}", since braces cannot appear in a format spec.
+    """
+
+    def format_field(self, value, format_spec):
+        if not format_spec or format_spec[0] not in "*+":
+            return super().format_field(value, format_spec)
+        suffix = re.sub(r"\^(\w+)", r"^{\1}", format_spec[1:])
+        if format_spec[0] == "+":
+            if value == 0:
+                return ""
+            sign = " - " if value < 0 else " + "
+        else:
+            sign = "- " if value < 0 else ""
+        magnitude = abs(value)
+        if not suffix:
+            # A constant keeps its value; a bare coefficient of 1 is dropped
+            return f"{sign}{magnitude}" if format_spec[0] == "+" else \
+                sign + ("" if magnitude == 1 else f"{magnitude} ")
+        return sign + (suffix if magnitude == 1 else f"{magnitude} {suffix}")
+
+_latex_formatter = _LatexFormatter()
+
+class EquationTemplate:
+    """
+    An equation with integer parameters, instantiated in bulk.
+
+    ``latex`` is a str.format template over the parameters, using the
+    coefficient specs of _LatexFormatter so it reads exactly like sympy's
+    output, ``answers`` are sympy expressions for the solutions in terms of them, and ``parameters``
+    gives each one's inclusive range, the same ranges the random generators
+    use. The answers are compiled once with sympy.lambdify, so a batch of
+    instances is drawn and solved with a handful of NumPy operations.
+    """
+
+    def __init__(self, latex: str, answers: List[str], parameters: Dict[str, Tuple[int, int]],
+                 variable: str = 'x'):
+        self.latex = latex
+        self.answers = answers
+        self.parameters = parameters
+        self.variable = variable
+        self._function = None
+
+    @property
+    def function(self):
+        if self._function is None:
+            sp = _sympy()
+            names = list(self.parameters)
+            self._function = sp.lambdify(
+                sp.symbols(names), [sp.sympify(answer) for answer in self.answers], 'numpy'
+            )
+        return self._function
+
+    def _solve(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            answers = self.function(*values.values())
+        return np.vstack([np.broadcast_to(np.asarray(answer, dtype=float), len(next(iter(values.values()))))
+                          for answer in answers])
+
+    def instantiate(self, n: int, rng: Optional[np.random.Generator] = None, max_rounds: int = 20):
+        """
+        Draw ``n`` instances. Returns (LaTeX strings, answers) where answers has
+        one row per solution and one column per instance.
+
+        Draws without a real, finite solution (a zero denominator, a negative
+        discriminant) are redrawn.
+        """
+        rng = rng or np.random.default_rng()
+        values = {name: rng.integers(low, high + 1, n) for name, (low, high) in self.parameters.items()}
+        answers = self._solve(values)
+        for _ in range(max_rounds):
+            invalid = np.flatnonzero(~np.isfinite(answers).all(axis=0))
+            if not len(invalid):
+                break
+            redraw = {name: rng.integers(low, high + 1, len(invalid))
+                      for name, (low, high) in self.parameters.items()}
+            for name, column in redraw.items():
+                values[name][invalid] = column
+            answers[:, invalid] = self._solve(redraw)
+
+        rows = zip(*(column.tolist() for column in values.values()))
+        names = list(values)
+        latex_strings = [_latex_formatter.format(self.latex, **dict(zip(names, row))) for row in rows]
+        return latex_strings, answers
+
+    def format_answers(self, answers: np.ndarray) -> List[str]:
+        """Answer text per instance, from the answers returned by ``instantiate``."""
+        finite = np.isfinite(answers).all(axis=0).tolist()
+        return [
+            ', '.join(f"{self.variable} = {value:.4g}" for value in dict.fromkeys(values)) if ok else ''
+            for values, ok in zip(answers.round(6).T.tolist(), finite)
+        ]
+
+# Templates for the sympy-rendered equations, over the generators' parameter ranges
+EQUATION_TEMPLATES: Dict[Tuple[str, str], EquationTemplate] = {
+    ('linear', 'easy'): EquationTemplate(
+        "{a:*x} + {b} = 0", ["-b/a"], {'a': (1, 5), 'b': (1, 10)}),
+    ('linear', 'medium'): EquationTemplate(
+        "{a:*x} + {b} = {c}", ["(c - b)/a"], {'a': (2, 8), 'b': (5, 15), 'c': (1, 20)}),
+    ('linear', 'hard'): EquationTemplate(
+        "{a:*x} + {b} = {c:*x} + {d}", ["(d - b)/(a - c)"],
+        {'a': (3, 10), 'b': (2, 12), 'c': (1, 15), 'd': (5, 25)}),
+    ('quadratic', 'easy'): EquationTemplate(
+        "x^{{2}}{b:+x}{c:+} = 0",
+        ["(-b - sqrt(b**2 - 4*a*c))/(2*a)", "(-b + sqrt(b**2 - 4*a*c))/(2*a)"],
+        {'a': (1, 1), 'b': (-5, 5), 'c': (-10, 10)}),
+    ('quadratic', 'medium'): EquationTemplate(
+        "{a:*x^2}{b:+x}{c:+} = 0",
+        ["(-b - sqrt(b**2 - 4*a*c))/(2*a)", "(-b + sqrt(b**2 - 4*a*c))/(2*a)"],
+        {'a': (1, 3), 'b': (-8, 8), 'c': (-15, 15)}),
+    ('quadratic', 'hard'): EquationTemplate(
+        "{a:*x^2}{b:+x}{c:+} = 0",
+        ["(-b - sqrt(b**2 - 4*a*c))/(2*a)", "(-b + sqrt(b**2 - 4*a*c))/(2*a)"],
+        {'a': (2, 5), 'b': (-12, 12), 'c': (-25, 25)}),
+    ('exponential', 'easy'): EquationTemplate(
+        "{a}^{{x}} = {y}", ["log(y)/log(a)"], {'a': (2, 5), 'y': (8, 32)}),
+    ('exponential', 'medium'): EquationTemplate(
+        "{a:*}e^{{{b:*x}}} = {y}", ["log(y/a)/b"], {'a': (2, 4), 'b': (1, 3), 'y': (20, 100)}),
+    ('exponential', 'hard'): EquationTemplate(
+        "{a:*}e^{{{b:*x}}} + {c} = {y}", ["log((y - c)/a)/b"],
+        {'a': (2, 5), 'b': (1, 3), 'c': (1, 4), 'y': (50, 200)}),
+    ('logarithmic', 'easy'): EquationTemplate(
+        r"\log{{\left(x \right)}} = {y}", ["exp(y)"], {'y': (1, 5)}),
+    ('logarithmic', 'medium'): EquationTemplate(
+        r"\log{{\left({a:*x} \right)}} = {y}", ["exp(y)/a"], {'a': (2, 5), 'y': (2, 8)}),
+    ('logarithmic', 'hard'): EquationTemplate(
+        r"{a:*}\log{{\left(x \right)}} + {b} = {y}", ["exp((y - b)/a)"],
+        {'a': (2, 5), 'b': (1, 3), 'y': (5, 15)}),
+}
+
+def _without_equation_entry(text: str) -> str:
+    return "\n".join(line for line in text.split("\n") if not line.startswith("Equation: "))
+
+def equation_answer_update(question: Question, answer: str) -> Dict[str, Any]:
+    """
+    The fields to update so a question's answer key carries its equation's solution.
+
+    MCQ and true/false answers are option keys, so the solution goes in the
+    explanation; a list of key points gets it as its first entry and a text
+    answer as its last line. An earlier "Equation: ..." entry is replaced.
+    """
+    entry = f"Equation: {answer}"
+    if question.question_type in (QuestionType.MULTIPLE_CHOICE, QuestionType.TRUE_FALSE):
+        explanation = _without_equation_entry(question.explanation or "")
+        return {'explanation': f"{explanation}\n{entry}" if explanation else entry}
+    if isinstance(question.correct_answer, list):
+        return {'correct_answer': [entry] + [
+            point for point in question.correct_answer if not point.startswith("Equation: ")
+        ]}
+    text = _without_equation_entry(question.correct_answer or "")
+    return {'correct_answer': f"{text}\n{entry}" if text else entry}
 
 class EquationHandler:
     def __init__(self):
@@ -20,6 +421,12 @@ class EquationHandler:
             'chemistry': ['pH = -log[H+]', 'PV = nRT', 'ΔG = ΔH - TΔS'],
             'statistics': ['μ = Σx/n', 'σ² = Σ(x-μ)²/n']
         }
+        self.pool = EquationPool(self._render_equation)
+        self.pool.load()
+
+    def warm_up(self):
+        """Fill the equation pools so the first requests do not render with sympy."""
+        self.pool.fill_all()
 
     async def add_equation_to_question(self, question: Question) -> Question:
         """Add an appropriate equation to a question based on its content."""
@@ -41,54 +448,55 @@ class EquationHandler:
             question.question_text = modified_text
             question.has_equations = True
             question.equation_latex = equation_latex
+            question.equation_type = equation_type
         
         return question
 
+    def instantiate_variants(self, questions: List[Question], n_variants: int,
+                             seed: Optional[int] = None) -> List[List[Question]]:
+        """
+        Build ``n_variants`` numerically different copies of a paper's questions.
+
+        Questions whose equation has a template get a fresh instance of it in
+        every variant, with the solution in the answer key as
+        equation_answer_update() places it; the rest are shared unchanged. No
+        LLM calls are made.
+        """
+        rng = np.random.default_rng(seed)
+        columns = []
+        for question in questions:
+            template = EQUATION_TEMPLATES.get((question.equation_type, question.difficulty.value))
+            if template is None or not question.equation_latex or question.equation_latex not in question.question_text:
+                columns.append([question] * n_variants)
+                continue
+            latex_strings, answers = template.instantiate(n_variants, rng)
+            columns.append([
+                question.model_copy(update={
+                    'id': f"{question.id}-v{i + 1}",
+                    'question_text': question.question_text.replace(question.equation_latex, equation_latex),
+                    'equation_latex': equation_latex,
+                    **equation_answer_update(question, answer),
+                })
+                for i, (equation_latex, answer) in enumerate(zip(latex_strings, template.format_answers(answers)))
+            ])
+        return [list(variant) for variant in zip(*columns)] if columns else [[] for _ in range(n_variants)]
+
     def _determine_equation_type(self, question_text: str) -> str:
         """Determine the type of equation to generate based on question content."""
-        text_lower = question_text.lower()
-        
-        # Keywords mapping to equation types
-        keyword_mapping = {
-            'derivative': 'calculus',
-            'integral': 'calculus',
-            'differential': 'calculus',
-            'limit': 'calculus',
-            'quadratic': 'quadratic',
-            'linear': 'linear',
-            'exponential': 'exponential',
-            'logarithm': 'logarithmic',
-            'log': 'logarithmic',
-            'sin': 'trigonometric',
-            'cos': 'trigonometric',
-            'tan': 'trigonometric',
-            'trigonometry': 'trigonometric',
-            'force': 'physics',
-            'velocity': 'physics',
-            'acceleration': 'physics',
-            'energy': 'physics',
-            'momentum': 'physics',
-            'pressure': 'physics',
-            'chemistry': 'chemistry',
-            'reaction': 'chemistry',
-            'ph': 'chemistry',
-            'concentration': 'chemistry',
-            'statistics': 'statistics',
-            'probability': 'statistics',
-            'mean': 'statistics',
-            'variance': 'statistics',
-            'standard deviation': 'statistics'
-        }
-        
-        for keyword, eq_type in keyword_mapping.items():
-            if keyword in text_lower:
-                return eq_type
-        
-        # Default to linear equations
-        return 'linear'
+        return equation_type_classifier.classify(question_text)
+
+    def determine_equation_types(self, question_texts: List[str]) -> List[str]:
+        """Determine the equation type for every question of a paper at once."""
+        return equation_type_classifier.classify_batch(question_texts)
 
     def _generate_equation(self, equation_type: str, difficulty: str) -> str:
         """Generate a LaTeX equation based on type and difficulty."""
+        if (equation_type, difficulty) in self.pool:
+            return self.pool.draw(equation_type, difficulty)
+        return self._render_equation(equation_type, difficulty)
+
+    def _render_equation(self, equation_type: str, difficulty: str) -> str:
+        """Render a fresh random equation of the given type and difficulty."""
         
         try:
             if equation_type == 'linear':
@@ -117,24 +525,18 @@ class EquationHandler:
 
     def _generate_linear_equation(self, difficulty: str) -> str:
         """Generate linear equations."""
-        x = symbols('x')
-        
         if difficulty == 'easy':
             a, b = random.randint(1, 5), random.randint(1, 10)
-            eq = sp.Eq(a*x + b, 0)
+            return equation_latex('linear', 0, a, b, 0)
         elif difficulty == 'medium':
             a, b, c = random.randint(2, 8), random.randint(5, 15), random.randint(1, 20)
-            eq = sp.Eq(a*x + b, c)
+            return equation_latex('linear', 0, a, b, c)
         else:  # hard
             a, b, c, d = random.randint(3, 10), random.randint(2, 12), random.randint(1, 15), random.randint(5, 25)
-            eq = sp.Eq(a*x + b, c*x + d)
-        
-        return latex(eq)
+            return equation_latex('linear', c, a, b, d)
 
     def _generate_quadratic_equation(self, difficulty: str) -> str:
         """Generate quadratic equations."""
-        x = symbols('x')
-        
         if difficulty == 'easy':
             a, b, c = 1, random.randint(-5, 5), random.randint(-10, 10)
         elif difficulty == 'medium':
@@ -142,65 +544,41 @@ class EquationHandler:
         else:  # hard
             a, b, c = random.randint(2, 5), random.randint(-12, 12), random.randint(-25, 25)
         
-        eq = sp.Eq(a*x**2 + b*x + c, 0)
-        return latex(eq)
+        return equation_latex('quadratic', a, b, c)
 
     def _generate_calculus_equation(self, difficulty: str) -> str:
         """Generate calculus equations."""
-        x = symbols('x')
-        
-        if difficulty == 'easy':
-            # Simple derivative
-            expr = x**2 + 3*x + 1
-            return r"\frac{d}{dx}(" + latex(expr) + ")"
-        elif difficulty == 'medium':
-            # Chain rule or product rule
-            expr = sp.sin(x**2) + sp.exp(x)
-            return r"\frac{d}{dx}(" + latex(expr) + ")"
-        else:  # hard
-            # Integration or complex derivative
-            expr = x**3 * sp.sin(x)
-            return r"\int " + latex(expr) + " dx"
+        # Simple derivative, chain/product rule, or integration
+        return equation_latex('calculus', difficulty if difficulty in ('easy', 'medium') else 'hard')
 
     def _generate_trigonometric_equation(self, difficulty: str) -> str:
         """Generate trigonometric equations."""
-        x = symbols('x')
-        
-        equations = {
-            'easy': [sp.sin(x), sp.cos(x), sp.tan(x)],
-            'medium': [sp.sin(2*x) + sp.cos(x), sp.sin(x)**2 + sp.cos(x)**2],
-            'hard': [sp.sin(x) * sp.cos(x) + sp.tan(x), sp.sin(x + sp.pi/4)]
-        }
-        
-        expr = random.choice(equations.get(difficulty, equations['easy']))
-        return latex(sp.Eq(expr, random.randint(-1, 1)))
+        difficulty = difficulty if difficulty in ('medium', 'hard') else 'easy'
+        choice = random.randrange(len(TRIGONOMETRIC_FORMS[difficulty]))
+        return equation_latex('trigonometric', difficulty, choice, random.randint(-1, 1))
 
     def _generate_exponential_equation(self, difficulty: str) -> str:
         """Generate exponential equations."""
-        x = symbols('x')
-        
         if difficulty == 'easy':
             a = random.randint(2, 5)
-            return latex(sp.Eq(a**x, random.randint(8, 32)))
+            return equation_latex('power', a, random.randint(8, 32))
         elif difficulty == 'medium':
             a, b = random.randint(2, 4), random.randint(1, 3)
-            return latex(sp.Eq(a * sp.exp(b*x), random.randint(20, 100)))
+            return equation_latex('exponential', a, b, 0, random.randint(20, 100))
         else:  # hard
             a, b, c = random.randint(2, 5), random.randint(1, 3), random.randint(1, 4)
-            return latex(sp.Eq(a * sp.exp(b*x) + c, random.randint(50, 200)))
+            return equation_latex('exponential', a, b, c, random.randint(50, 200))
 
     def _generate_logarithmic_equation(self, difficulty: str) -> str:
         """Generate logarithmic equations."""
-        x = symbols('x')
-        
         if difficulty == 'easy':
-            return latex(sp.Eq(sp.log(x), random.randint(1, 5)))
+            return equation_latex('logarithmic', 1, 1, 0, random.randint(1, 5))
         elif difficulty == 'medium':
             a = random.randint(2, 5)
-            return latex(sp.Eq(sp.log(a*x), random.randint(2, 8)))
+            return equation_latex('logarithmic', 1, a, 0, random.randint(2, 8))
         else:  # hard
             a, b = random.randint(2, 5), random.randint(1, 3)
-            return latex(sp.Eq(a * sp.log(x) + b, random.randint(5, 15)))
+            return equation_latex('logarithmic', a, 1, b, random.randint(5, 15))
 
     def _generate_physics_equation(self, difficulty: str) -> str:
         """Generate physics equations."""
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from similarity_analyzer import process_pool_context
+
+_FUNCTIONS = r"sin|cos|tan|log|ln|exp|sqrt"
+# \sin^{2}{(x)} -> (sin(x))**(2); runs after \left/\right and \frac are rewritten
+_FUNCTION_POWER_RE = re.compile(rf"\\({_FUNCTIONS})\^\{{([^{{}}]*)\}}\s*(\{{[^{{}}]*\}}|\([^()]*\))")
+_COMMAND_RE = re.compile(rf"\\({_FUNCTIONS}|pi)\b")
+_DERIVATIVE_RE = re.compile(r"^\\frac\{d\}\{dx\}\s*(.*)$")
+_DIFFERENTIAL_RE = re.compile(r"\s*d\s*x\s*$")
+
+def _braced(text: str, start: int) -> Tuple[str, int]:
+    """Content of the brace group opening at ``start`` and the index after it."""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i], i + 1
+    raise ValueError("unbalanced braces")
+
+def _expand_fractions(text: str) -> str:
+    while True:
+        start = text.find(r"\frac{")
+        if start < 0:
+            return text
+        numerator, end = _braced(text, start + 5)
+        if end >= len(text) or text[end] != "{":
+            raise ValueError("malformed \\frac")
+        denominator, end = _braced(text, end)
+        text = f"{text[:start]}(({_expand_fractions(numerator)})/({_expand_fractions(denominator)})){text[end:]}"
+
+def latex_to_expression(latex: str) -> Tuple[str, str]:
+    """
+    Translate the LaTeX produced by EquationHandler into sympy syntax.
+
+    Returns (kind, expression): kind is "solve" for an equation in x,
+    "diff" for d/dx(...) and "integrate" for an indefinite integral in x.
+    Only string rewriting happens here, so it is safe to run in the API
+    process; anything outside this small grammar raises ValueError.
+    """
+    text = latex.strip().strip("$").strip()
+    for command, replacement in ((r"\left", ""), (r"\right", ""), (r"\cdot", "*"), (r"\,", " ")):
+        text = text.replace(command, replacement)
+
+    kind = "solve"
+    derivative = _DERIVATIVE_RE.match(text)
+    if derivative:
+        kind, text = "diff", derivative.group(1)
+    elif text.startswith(r"\int"):
+        kind, text = "integrate", _DIFFERENTIAL_RE.sub("", text[len(r"\int"):])
+
+    text = _expand_fractions(text)
+    text = _FUNCTION_POWER_RE.sub(r"(\1\3)**(\2)", text)
+    text = _COMMAND_RE.sub(r" \1", text)
+    text = text.replace("^", "**").replace("{", "(").replace("}", ")")
+    if "\\" in text or not text.strip():
+        raise ValueError(f"unsupported LaTeX: {latex!r}")
+    if (kind == "solve") != (text.count("=") == 1):
+        raise ValueError(f"not a single equation in x: {latex!r}")
+    return kind, " ".join(text.split())
+
+def canonical_key(latex: str) -> str:
+    """Cache key shared by equations that differ only in LaTeX spacing."""
+    kind, expression = latex_to_expression(latex)
+    return f"{kind}:{expression.replace(' ', '')}"
+
+def _format_value(value) -> str:
+    import sympy as sp
+
+    exact = sp.sstr(value)
+    if value.is_Rational:
+        return exact
+    return f"{exact} ≈ {float(sp.N(value)):.4g}"
+
+def solve_latex(latex: str) -> Optional[str]:
+    """
+    Solve, differentiate or integrate an equation and describe the result.
+
+    Runs in a solver worker process: parse_expr evaluates its input and sympy
+    can take unbounded time, so neither happens in the API process.
+    """
+    import sympy as sp
+    from sympy.parsing.sympy_parser import (
+        parse_expr, standard_transformations, implicit_multiplication_application, convert_xor
+    )
+
+    kind, expression = latex_to_expression(latex)
+    x = sp.Symbol("x")
+    names = {"x": x, "e": sp.E, "pi": sp.pi, "ln": sp.log}
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+
+    def parse(text):
+        return parse_expr(text, local_dict=names, transformations=transformations)
+
+    if kind == "solve":
+        lhs, rhs = expression.split("=")
+        equation = parse(lhs) - parse(rhs)
+        if equation.free_symbols != {x}:
+            return None
+        solutions = [s for s in sp.solve(equation, x) if s.is_real is not False]
+        if not solutions:
+            return "True for all x" if sp.simplify(equation) == 0 else "No real solution"
+        return ", ".join(f"x = {_format_value(s)}" for s in solutions)
+
+    function = parse(expression)
+    if not function.free_symbols <= {x}:
+        return None
+    if kind == "diff":
+        return f"d/dx = {sp.sstr(sp.diff(function, x))}"
+    result = sp.integrate(function, x)
+    if result.has(sp.Integral):
+        return None
+    return f"{sp.sstr(result)} + C"
+
+class EquationSolver:
+    """
+    Computes answers for generated equations in a pool of worker processes.
+
+    Each solve gets a timeout; a worker that exceeds it is killed and the pool
+    replaced, since a hung sympy call cannot be interrupted. Tasks lost with the
+    old pool are retried once. Results, including failures, are cached by
+    canonical expression.
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 cache_size: Optional[int] = None):
+        self.workers = workers or int(os.getenv("SOLVER_WORKERS", "2"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("SOLVER_TIMEOUT_SECONDS", "5"))
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("SOLVER_CACHE_SIZE", "1024"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"solved": 0, "failed": 0, "timeouts": 0, "cache_hits": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=process_pool_context())
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        """Kill a pool's workers (a hung solve ignores shutdown) and stop handing it out."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # No public API stops a running task; the executor keeps its processes here
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+
+    def warm_up(self):
+        """Start the workers and import sympy in them (blocking)."""
+        self._get_pool().submit(solve_latex, "x = 1").result()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def solve(self, latex: str) -> Optional[str]:
+        """The answer for an equation, or None if it cannot be solved in time."""
+        try:
+            key = canonical_key(latex)
+        except ValueError:
+            return None
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return self._cache[key]
+
+        answer = None
+        for _ in range(2):
+            try:
+                pool = self._get_pool()
+            except Exception:
+                # Workers could not be started; not cached, a later call may succeed
+                self.stats["failed"] += 1
+                return None
+            try:
+                answer = await asyncio.wait_for(asyncio.wrap_future(pool.submit(solve_latex, latex)), self.timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                self._discard(pool)
+            except BrokenProcessPool:
+                # Lost along with a worker killed for another task's timeout
+                self._discard(pool)
+                continue
+            except Exception:
+                pass
+            break
+        self.stats["solved" if answer is not None else "failed"] += 1
+
+        with self._lock:
+            self._cache[key] = answer
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return answer
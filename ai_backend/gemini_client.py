@@ -1,11 +1,32 @@
+import asyncio
+import json
 import os
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 
 try:
     from google import generativeai
 except Exception:
     generativeai = None
 
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_GEMINI_MODEL = "gemini-1.5-flash"
+
+# LangChain message types mapped onto the roles used by the Gemini REST API
+_ROLE_MAP = {
+    "system": "system",
+    "human": "user",
+    "user": "user",
+    "ai": "model",
+    "assistant": "model",
+    "model": "model",
+}
+
 def configure(api_key: str):
     """
     Configure the Gemini / Google Generative AI client.
@@ -27,11 +48,7 @@ def chat_completion(messages: List[Dict[str, str]], model: str = "models/chat-bi
         raise RuntimeError("google-generative-ai is not installed. pip install google-generative-ai")
 
     # Convert to the API format expected by google.generativeai (role/content)
-    api_messages = []
-    for m in messages:
-        role = m.get("role", "user")
-        content = m.get("content") if "content" in m else m.get("text", "")
-        api_messages.append({"role": role, "content": content})
+    api_messages = [{"role": role, "content": content} for role, content in _message_pairs(messages)]
 
     # Use chat completions API
     resp = generativeai.chat.completions.create(
@@ -60,4 +77,173 @@ def chat_completion(messages: List[Dict[str, str]], model: str = "models/chat-bi
     except Exception:
         pass
 
-    return str(resp)
\ No newline at end of file
+    return str(resp)
+
+
+def _message_pairs(messages: List[Any]) -> Tuple[Tuple[str, str], ...]:
+    """Normalise dict messages or LangChain messages into (role, content) pairs."""
+    pairs = []
+    for m in messages:
+        if isinstance(m, dict):
+            role = m.get("role", "user")
+            content = m.get("content") if "content" in m else m.get("text", "")
+        else:
+            role = getattr(m, "type", "user")
+            content = getattr(m, "content", "")
+        pairs.append((role, content if isinstance(content, str) else str(content)))
+    return tuple(pairs)
+
+@lru_cache(maxsize=256)
+def _build_contents(pairs: Tuple[Tuple[str, str], ...]) -> Tuple[Optional[Dict[str, Any]], Tuple[Dict[str, Any], ...]]:
+    """
+    Convert (role, content) pairs into a Gemini systemInstruction and contents list.
+    Cached so repeated prompts (retries, regenerations) skip the conversion.
+    """
+    system_parts = []
+    contents = []
+    for role, content in pairs:
+        api_role = _ROLE_MAP.get(role, "user")
+        if api_role == "system":
+            system_parts.append({"text": content})
+        else:
+            contents.append({"role": api_role, "parts": [{"text": content}]})
+    system_instruction = {"parts": system_parts} if system_parts else None
+    return system_instruction, tuple(contents)
+
+def _extract_text(data: Dict[str, Any]) -> str:
+    """Pull the generated text out of a generateContent response body."""
+    candidates = data.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+class GeminiResponse:
+    """Chat response exposing ``content`` like a LangChain AIMessage."""
+
+    def __init__(self, content: str, usage_metadata: Optional[Dict[str, int]] = None):
+        self.content = content
+        self.usage_metadata = usage_metadata or {}
+
+class AsyncGeminiClient:
+    """
+    Async Gemini chat client with a persistent HTTP session.
+
+    Exposes ``ainvoke``/``astream`` so it can be used wherever the question
+    generator expects a LangChain chat model. When httpx is not installed but
+    the sync SDK is, calls are offloaded to a worker thread instead.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None,
+                 temperature: float = 0.7, max_tokens: int = 2000,
+                 timeout: float = 60.0, max_connections: int = 20):
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("OPENAI_API_KEY")
+        self.model = model or os.getenv("GEMINI_MODEL") or DEFAULT_GEMINI_MODEL
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+
+    @property
+    def uses_thread_pool(self) -> bool:
+        """True when requests go through the sync SDK in a worker thread."""
+        return httpx is None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=GEMINI_API_BASE,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={"x-goog-api-key": self.api_key or ""},
+            )
+        return self._client
+
+    def _model_path(self, model: Optional[str]) -> str:
+        name = model or self.model
+        return name if name.startswith("models/") else f"models/{name}"
+
+    def _payload(self, messages: List[Any], temperature: Optional[float] = None,
+                 max_tokens: Optional[int] = None, json_mode: bool = False) -> Dict[str, Any]:
+        system_instruction, contents = _build_contents(_message_pairs(messages))
+        generation_config = {
+            "temperature": self.temperature if temperature is None else temperature,
+            "maxOutputTokens": self.max_tokens if max_tokens is None else max_tokens,
+        }
+        if json_mode:
+            generation_config["responseMimeType"] = "application/json"
+        payload = {"contents": list(contents), "generationConfig": generation_config}
+        if system_instruction:
+            payload["systemInstruction"] = system_instruction
+        return payload
+
+    async def ainvoke(self, messages: List[Any], model: Optional[str] = None,
+                      temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                      json_mode: bool = False, **kwargs) -> GeminiResponse:
+        """Send a chat request and return the full response."""
+        if self.uses_thread_pool:
+            pairs = _message_pairs(messages)
+            text = await asyncio.to_thread(
+                chat_completion,
+                [{"role": role, "content": content} for role, content in pairs],
+                model or self.model
+            )
+            return GeminiResponse(text)
+
+        if not self.api_key:
+            raise RuntimeError("No API key provided for Gemini (GEMINI_API_KEY).")
+
+        response = await self._get_client().post(
+            f"/{self._model_path(model)}:generateContent",
+            json=self._payload(messages, temperature, max_tokens, json_mode)
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Gemini request failed ({response.status_code}): {response.text[:200]}")
+
+        data = response.json()
+        usage = data.get("usageMetadata") or {}
+        return GeminiResponse(
+            _extract_text(data),
+            {
+                "input_tokens": usage.get("promptTokenCount", 0),
+                "output_tokens": usage.get("candidatesTokenCount", 0),
+                "total_tokens": usage.get("totalTokenCount", 0),
+            }
+        )
+
+    async def astream(self, messages: List[Any], model: Optional[str] = None,
+                      temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                      json_mode: bool = False, **kwargs) -> AsyncIterator[str]:
+        """Yield response text chunks as the model produces them."""
+        if self.uses_thread_pool:
+            # The sync SDK has no incremental API; emit the whole reply as one chunk
+            response = await self.ainvoke(messages, model, temperature, max_tokens, json_mode)
+            yield response.content
+            return
+
+        if not self.api_key:
+            raise RuntimeError("No API key provided for Gemini (GEMINI_API_KEY).")
+
+        async with self._get_client().stream(
+            "POST",
+            f"/{self._model_path(model)}:streamGenerateContent",
+            params={"alt": "sse"},
+            json=self._payload(messages, temperature, max_tokens, json_mode)
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise RuntimeError(f"Gemini stream failed ({response.status_code}): {body[:200]!r}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                text = _extract_text(json.loads(line[5:]))
+                if text:
+                    yield text
+
+    async def aclose(self):
+        """Close the underlying HTTP session."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
@@ -1,24 +1,86 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Union
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 from dotenv import load_dotenv
 
-from question_generator import QuestionGeneratorGraph
-from pdf_exporter import PDFExporter
+from question_generator import QuestionGeneratorGraph, PaperGenerationError
+from similarity_analyzer import shutdown_preprocess_pool
 from models import (
     QuestionGenerationRequest,
     QuestionPaper,
-    AlternativeQuestionRequest
+    AlternativeQuestionRequest,
+    SimilarityEngine,
+    ExportFormat
 )
-from .gemini_client import configure as gemini_config, chat_completion
+import gemini_client
+from gemini_client import configure as gemini_config, chat_completion
 
 load_dotenv()
 
-app = FastAPI(title="IntelliExam AI Backend", version="1.0.0")
+# Heavy components (LangChain, LangGraph, scikit-learn, sympy, ReportLab) are
+# created on first use; the lifespan warmup builds them in the background so
+# the server accepts requests immediately after start.
+question_generator = QuestionGeneratorGraph()
+_pdf_exporter = None
+
+def get_pdf_exporter():
+    global _pdf_exporter
+    if _pdf_exporter is None:
+        from pdf_exporter import PDFExporter
+        _pdf_exporter = PDFExporter()
+    return _pdf_exporter
+
+def get_renderer(export_format: ExportFormat):
+    """PDF reuses the shared exporter; DOCX and HTML renderers are stateless."""
+    if export_format == ExportFormat.PDF:
+        return get_pdf_exporter()
+    from paper_layout import DocxRenderer, HTMLRenderer
+    return DocxRenderer() if export_format == ExportFormat.DOCX else HTMLRenderer()
+
+async def stream_pdf_response(question_paper: QuestionPaper, include_answers: bool,
+                              include_explanations: bool) -> StreamingResponse:
+    """Render a paper to a spooled file, then stream it to the client in chunks."""
+    from paper_layout import get_layout
+    from pdf_exporter import iter_file_chunks
+    
+    layout = get_layout(question_paper, include_answers, include_explanations)
+    spool = await asyncio.to_thread(get_pdf_exporter().spool, layout)
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    return StreamingResponse(
+        iter_file_chunks(spool),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename=question_paper_{question_paper.id}.pdf",
+            "Content-Length": str(size)
+        }
+    )
+
+def warm_up():
+    question_generator.warm_up()
+    get_pdf_exporter()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup = None
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+        warmup = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await question_generator.aclose()
+    await asyncio.to_thread(shutdown_preprocess_pool)
+    if _pdf_exporter is not None:
+        from pdf_exporter import shutdown_export_pool
+        await asyncio.to_thread(shutdown_export_pool)
+
+app = FastAPI(title="IntelliExam AI Backend", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -29,13 +91,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the question generator and PDF exporter
-question_generator = QuestionGeneratorGraph()
-pdf_exporter = PDFExporter()
-
-# Prefer GEMINI_API_KEY; fall back to OPENAI_API_KEY if present for transition
+# Prefer GEMINI_API_KEY; fall back to OPENAI_API_KEY if present for transition.
+# The sync SDK is optional: the async Gemini client talks to the REST API directly.
 gemini_key = os.getenv("GEMINI_API_KEY") or os.getenv("OPENAI_API_KEY")
-gemini_config(gemini_key)
+if gemini_key and gemini_client.generativeai is not None:
+    gemini_config(gemini_key)
 
 @app.get("/")
 async def root():
@@ -47,6 +107,21 @@ async def generate_questions(request: QuestionGenerationRequest):
     try:
         question_paper = await question_generator.generate_question_paper(request)
         return question_paper
+    except PaperGenerationError as e:
+        # Completed questions are checkpointed; the client can resume with paper_id
+        raise HTTPException(status_code=500, detail={"error": str(e), "paper_id": e.paper_id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/resume-generation/{paper_id}", response_model=QuestionPaper)
+async def resume_generation(paper_id: str):
+    """Resume a checkpointed question paper from its last completed question."""
+    try:
+        return await question_generator.resume_question_paper(paper_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No checkpoint found for paper {paper_id}")
+    except PaperGenerationError as e:
+        raise HTTPException(status_code=500, detail={"error": str(e), "paper_id": e.paper_id})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -60,11 +135,18 @@ async def generate_alternative_question(request: AlternativeQuestionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/analyze-similarity")
-async def analyze_similarity(question: str, previous_papers: List[str]):
-    """Analyze similarity between a question and previous papers."""
+async def analyze_similarity(question: str, previous_papers: List[str],
+                             engine: SimilarityEngine = SimilarityEngine.TFIDF, top_k: int = 5,
+                             course_code: Optional[str] = None):
+    """Analyze similarity between a question and the questions in previous papers."""
     try:
-        similarity_score = await question_generator.calculate_similarity(question, previous_papers)
-        return {"similarity_percentage": similarity_score}
+        analyzer = question_generator.similarity_analyzer
+        matches = await analyzer.find_similar_questions(question, previous_papers, top_k, engine.value)
+        similarity_score = await question_generator.calculate_similarity(question, previous_papers, engine.value)
+        result = {"similarity_percentage": similarity_score, "top_matches": matches}
+        if course_code:
+            result["course_matches"] = await analyzer.top_k_similar(question, top_k, course_code)
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -76,22 +158,151 @@ async def export_question_paper_pdf(
 ):
     """Export question paper to PDF format."""
     try:
-        pdf_bytes = await pdf_exporter.export_question_paper(
-            question_paper, 
-            include_answers, 
-            include_explanations
-        )
-        
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=question_paper_{question_paper.id}.pdf"
-            }
+        return await stream_pdf_response(question_paper, include_answers, include_explanations)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/export/{export_format}")
+async def export_question_paper(
+    export_format: ExportFormat,
+    question_paper: QuestionPaper,
+    include_answers: bool = False,
+    include_explanations: bool = False
+):
+    """Export a question paper as PDF, DOCX or HTML from its cached layout."""
+    from paper_layout import MissingDependencyError, get_layout
+    
+    if export_format == ExportFormat.PDF:
+        try:
+            return await stream_pdf_response(question_paper, include_answers, include_explanations)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
+        renderer = get_renderer(export_format)
+        layout = get_layout(question_paper, include_answers, include_explanations)
+        content = await asyncio.to_thread(renderer.render, layout)
+    except MissingDependencyError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return Response(
+        content=content,
+        media_type=renderer.media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=question_paper_{question_paper.id}.{renderer.extension}"
+        }
+    )
+
+@app.post("/preview")
+async def preview_question_paper(
+    question_paper: QuestionPaper,
+    first_page: int = Query(1, ge=1),
+    last_page: Optional[int] = Query(None, ge=1),
+    scale: float = Query(1.0, gt=0, le=4),
+    include_answers: bool = False,
+    include_explanations: bool = False
+):
+    """PNG preview of a page range (the first page by default) while a paper is edited."""
+    from paper_layout import MissingDependencyError, get_layout
+    
+    last_page = last_page or first_page
+    max_pages = int(os.getenv("MAX_PREVIEW_PAGES", "10"))
+    if not 0 <= last_page - first_page < max_pages:
+        raise HTTPException(status_code=400, detail=f"Preview between 1 and {max_pages} consecutive pages")
+    
+    exporter = get_pdf_exporter()
+    try:
+        layout = get_layout(question_paper, include_answers, include_explanations)
+        png = await asyncio.to_thread(exporter.render_preview, layout, first_page, last_page, scale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except MissingDependencyError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return Response(content=png, media_type="image/png")
+
+@app.post("/export-sets")
+async def export_question_paper_sets(
+    question_paper: QuestionPaper,
+    seeds: List[int] = Query(..., description="One seed per set (Set A, B, ...)"),
+    include_answers: bool = False,
+    include_explanations: bool = False
+):
+    """Export shuffled exam sets of a question paper as a streamed ZIP of PDFs."""
+    if not 1 <= len(seeds) <= 26:
+        raise HTTPException(status_code=400, detail="Between 1 and 26 seeds are required")
+    try:
+        chunks = await get_pdf_exporter().export_sets(question_paper, seeds, include_answers, include_explanations)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=question_paper_{question_paper.id}_sets.zip"
+        }
+    )
+
+@app.post("/paper-variants", response_model=List[QuestionPaper])
+async def generate_paper_variants(question_paper: QuestionPaper, variants: int = 30, seed: Optional[int] = None):
+    """
+    Per-student copies of a paper with freshly instanced equations and their
+    answers. Questions without a templated equation are shared; no LLM calls.
+    """
+    max_variants = int(os.getenv("MAX_PAPER_VARIANTS", "5000"))
+    if not 1 <= variants <= max_variants:
+        raise HTTPException(status_code=400, detail=f"variants must be between 1 and {max_variants}")
+    try:
+        question_sets = await asyncio.to_thread(
+            question_generator.equation_handler.instantiate_variants,
+            question_paper.questions, variants, seed
         )
+        return [
+            question_paper.model_copy(update={"id": f"{question_paper.id}-v{i + 1}", "questions": questions})
+            for i, questions in enumerate(question_sets)
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/corpora/{course_code}")
+async def publish_course_corpus(course_code: str, previous_papers: List[str], replace: bool = False):
+    """Add previous papers to a course's persisted similarity corpus (or replace it)."""
+    if not any(paper.strip() for paper in previous_papers):
+        raise HTTPException(status_code=400, detail="previous_papers must contain at least one question")
+    store = question_generator.corpus_store
+    try:
+        publish = store.publish_papers if replace else store.add_papers
+        version = await asyncio.to_thread(publish, course_code, previous_papers)
+        # Publishing refreshed this worker's cached corpus; the new version wins regardless
+        return {"course_code": course_code, **store.stats(course_code), "version": version}
+    except ValueError as e:
+        # An invalid course code, or papers without a question to index
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/corpora/{course_code}")
+async def course_corpus_stats(course_code: str):
+    """Version and size of a course's live similarity corpus."""
+    stats = question_generator.corpus_store.stats(course_code)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No corpus published for course {course_code}")
+    return stats
+
+@app.get("/model-routes/stats")
+async def model_route_stats():
+    """Per-route latency, token and estimated cost statistics for LLM calls."""
+    return question_generator.model_router.get_stats()
+
+@app.get("/output-parser/stats")
+async def output_parser_stats():
+    """Counts of LLM response parse failures and repairs, by type."""
+    return question_generator.output_parser.get_stats()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "ai_backend"}
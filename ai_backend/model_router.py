@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from models import QuestionType, DifficultyLevel, BloomsTaxonomy
+
+DEFAULT_ROUTES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routes.json")
+
+class ModelRoute(BaseModel):
+    name: str = "default"
+    # Empty lists match any value
+    question_types: List[QuestionType] = []
+    difficulties: List[DifficultyLevel] = []
+    blooms_levels: List[BloomsTaxonomy] = []
+    # Either a model name or a {provider: model} mapping
+    model: Optional[Union[str, Dict[str, str]]] = None
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    # Ask the provider for a JSON-only response (OpenAI json_object / Gemini JSON mime type)
+    json_mode: bool = False
+    # Estimated USD cost per 1,000 tokens, used for the route statistics
+    cost_per_1k_tokens: float = 0.0
+
+    def matches(self, question_type: Optional[QuestionType], difficulty: Optional[DifficultyLevel],
+                blooms_level: Optional[BloomsTaxonomy]) -> bool:
+        """Check whether this route applies to the given question specification."""
+        for allowed, value in ((self.question_types, question_type),
+                               (self.difficulties, difficulty),
+                               (self.blooms_levels, blooms_level)):
+            if allowed and value not in allowed:
+                return False
+        return True
+
+    def invoke_kwargs(self, provider: str) -> Dict[str, Any]:
+        """Keyword overrides to pass to the chat backend's ainvoke()."""
+        kwargs = {}
+        model = self.model.get(provider) if isinstance(self.model, dict) else self.model
+        if model:
+            kwargs["model"] = model
+        if self.max_tokens is not None:
+            kwargs["max_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            kwargs["temperature"] = self.temperature
+        if self.json_mode:
+            if provider == "gemini":
+                kwargs["json_mode"] = True
+            else:
+                kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+class ModelRouter:
+    """
+    Picks model, max_tokens and temperature per (question type, difficulty, Bloom level).
+
+    Routes are read from a JSON file (MODEL_ROUTES_FILE) and the first matching
+    route wins; settings a route leaves out come from the file's ``default``
+    entry. The file is re-read when its modification time changes, so the
+    table can be tuned without restarting the service.
+    """
+
+    def __init__(self, routes_file: Optional[str] = None, reload_interval: float = 2.0):
+        self.routes_file = routes_file or os.getenv("MODEL_ROUTES_FILE", DEFAULT_ROUTES_FILE)
+        self.reload_interval = reload_interval
+        self.default_route = ModelRoute()
+        self.routes: List[ModelRoute] = []
+        self.last_error: Optional[str] = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.reload()
+
+    def reload(self, force: bool = False) -> bool:
+        """Reload the routing table if the file changed. Returns True when reloaded."""
+        try:
+            mtime = os.path.getmtime(self.routes_file)
+        except OSError:
+            return False
+
+        if not force and mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.routes_file, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            defaults = config.get("default", {})
+            default_route = ModelRoute(**{**defaults, "name": "default"})
+            # Routes inherit any setting they do not override from the default
+            routes = [ModelRoute(**{**defaults, **route}) for route in config.get("routes", [])]
+        except Exception as e:
+            # Keep serving the previous table if the new file is invalid
+            self.last_error = str(e)
+            self._mtime = mtime
+            return False
+
+        with self._lock:
+            self.default_route = default_route
+            self.routes = routes
+            self._mtime = mtime
+            self.last_error = None
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.reload_interval:
+            self._last_check = now
+            self.reload()
+
+    def route(self, question_type: Optional[QuestionType] = None,
+              difficulty: Optional[DifficultyLevel] = None,
+              blooms_level: Optional[BloomsTaxonomy] = None) -> ModelRoute:
+        """Return the first route matching the question specification."""
+        self._maybe_reload()
+        for route in self.routes:
+            if route.matches(question_type, difficulty, blooms_level):
+                return route
+        return self.default_route
+
+    def record(self, route: ModelRoute, latency: float,
+               usage: Optional[Dict[str, Any]] = None, error: bool = False):
+        """Record latency, token usage and estimated cost for a call made on a route."""
+        usage = usage or {}
+        input_tokens = usage.get("input_tokens", 0) or 0
+        output_tokens = usage.get("output_tokens", 0) or 0
+        total_tokens = usage.get("total_tokens") or (input_tokens + output_tokens)
+
+        with self._lock:
+            stats = self._stats.setdefault(route.name, {
+                "calls": 0,
+                "errors": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "estimated_cost": 0.0,
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["estimated_cost"] += total_tokens / 1000 * route.cost_per_1k_tokens
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-route call statistics including average latency."""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                result[name] = dict(stats)
+                result[name]["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+            return result
@@ -24,6 +24,15 @@ class BloomsTaxonomy(str, Enum):
     EVALUATE = "evaluate"
     CREATE = "create"
 
+class SimilarityEngine(str, Enum):
+    TFIDF = "tfidf"        # TF-IDF fitted per request
+    HASHING = "hashing"    # Feature hashing, bounded memory for large corpora
+
+class ExportFormat(str, Enum):
+    PDF = "pdf"
+    DOCX = "docx"    # Requires python-docx
+    HTML = "html"
+
 class Question(BaseModel):
     id: str
     question_text: str
@@ -38,6 +47,16 @@ class Question(BaseModel):
     program_outcome: Optional[str] = None
     has_equations: bool = False
     equation_latex: Optional[str] = None
+    equation_type: Optional[str] = None  # Equation family, used to build per-student variants
+
+class QuestionSpec(BaseModel):
+    index: int
+    question_type: QuestionType
+    difficulty: DifficultyLevel
+    blooms_level: BloomsTaxonomy
+    course_outcome: Optional[str] = None
+    program_outcome: Optional[str] = None
+    focus: Optional[str] = None  # Sub-topic suggested by an LLM plan
 
 class QuestionGenerationRequest(BaseModel):
     subject: str
@@ -58,10 +77,15 @@ class QuestionGenerationRequest(BaseModel):
     
     # Similarity control
     similarity_threshold: float = Field(ge=0, le=100, default=70)
+    # Within-paper duplicates are scored in the unweighted hashing space, on a
+    # different scale from previous-paper similarity; None uses DUPLICATE_THRESHOLD
+    duplicate_threshold: Optional[float] = Field(ge=0, le=100, default=None)
     previous_papers: List[str] = []
+    similarity_engine: SimilarityEngine = SimilarityEngine.TFIDF
     
     # Additional options
     include_equations: bool = False
+    use_llm_plan: bool = False  # Ask the LLM to plan per-question sub-topics
     marks_per_question: Dict[QuestionType, int] = {}
     
     # Header information for PDF
@@ -0,0 +1,196 @@
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+from pydantic import BaseModel, ValidationError
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_OPEN_FENCE_RE = re.compile(r"^```(?:json|JSON)?\s*")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+class OutputParseError(ValueError):
+    """Raised when an LLM response cannot be turned into the expected JSON object."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+def strip_code_fences(text: str) -> str:
+    """Return the body of the first markdown code fence, or the text unchanged."""
+    match = _FENCE_RE.search(text)
+    if match:
+        return match.group(1).strip()
+    # An unterminated fence (truncated reply) still has an opening marker
+    return _OPEN_FENCE_RE.sub("", text.strip()).strip()
+
+def _extract_json_block(text: str) -> str:
+    """Cut the text down to the outermost JSON object or array."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise OutputParseError("no_json", "No JSON object found in response")
+    start = min(starts)
+    closing = "}" if text[start] == "{" else "]"
+    end = text.rfind(closing)
+    return text[start:end + 1] if end > start else text[start:]
+
+def _close_partial_json(text: str) -> str:
+    """
+    Complete a truncated JSON document by closing open strings, arrays and objects.
+    Dangling keys (cut mid-name or before their value) and trailing commas left
+    by the truncation are dropped.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    previous = ""
+    # Where the current key (with its leading comma) starts while its value is missing
+    key_start = None
+    comma = 0
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch.isspace():
+            continue
+        if ch == '"':
+            in_string = True
+            if stack and stack[-1] == "}" and previous in "{,":
+                key_start = comma if previous == "," else i
+            else:
+                key_start = None
+        elif ch != ":":
+            key_start = None
+            if ch in "{[":
+                stack.append("}" if ch == "{" else "]")
+            elif ch in "}]" and stack:
+                stack.pop()
+            elif ch == ",":
+                comma = i
+        previous = ch
+
+    if key_start is not None:
+        repaired = text[:key_start]
+    else:
+        repaired = text + ('"' if in_string else "")
+    # Drop a trailing comma whose next item was cut off
+    repaired = re.sub(r',\s*$', '', repaired.rstrip())
+    return repaired + "".join(reversed(stack))
+
+class LLMOutputParser:
+    """
+    Tolerant JSON parsing for LLM responses.
+
+    Handles markdown fences, surrounding prose, trailing commas, smart quotes and
+    truncated output before giving up, and counts repairs and failures by type so
+    the generator can see why fallbacks happen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.failures: Dict[str, int] = {}
+        self.repairs: Dict[str, int] = {}
+
+    def _count(self, counter: Dict[str, int], kind: str):
+        with self._lock:
+            counter[kind] = counter.get(kind, 0) + 1
+
+    def record_failure(self, kind: str):
+        """Count a failure detected by the caller (e.g. a semantic schema check)."""
+        self._count(self.failures, kind)
+
+    def parse_json(self, text: Optional[str], required_fields: Sequence[str] = ()) -> Dict[str, Any]:
+        """Parse an LLM response into a dict, repairing common formatting problems."""
+        if not text or not text.strip():
+            raise OutputParseError("empty", "Empty response")
+
+        candidate = strip_code_fences(text)
+        if candidate != text.strip():
+            self._count(self.repairs, "code_fence")
+
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            data = self._repair(candidate)
+
+        if isinstance(data, list) and data and isinstance(data[0], dict):
+            # Some models wrap a single object in an array
+            self._count(self.repairs, "array_wrapped")
+            data = data[0]
+        if not isinstance(data, dict):
+            raise OutputParseError("not_object", "Response JSON is not an object")
+
+        missing = [field for field in required_fields if field not in data]
+        if missing:
+            raise OutputParseError("missing_fields", f"Missing fields: {', '.join(missing)}")
+        return data
+
+    def _repair(self, text: str) -> Any:
+        block = _extract_json_block(text)
+        if block != text:
+            self._count(self.repairs, "surrounding_text")
+
+        attempts = [
+            ("trailing_comma", lambda s: _TRAILING_COMMA_RE.sub(r"\1", s)),
+            ("smart_quotes", lambda s: _TRAILING_COMMA_RE.sub(r"\1", s.translate(_SMART_QUOTES))),
+            ("truncated", lambda s: _TRAILING_COMMA_RE.sub(r"\1", _close_partial_json(s.translate(_SMART_QUOTES)))),
+        ]
+        try:
+            return json.loads(block)
+        except json.JSONDecodeError:
+            pass
+        for kind, fix in attempts:
+            try:
+                data = json.loads(fix(block))
+            except json.JSONDecodeError:
+                continue
+            self._count(self.repairs, kind)
+            return data
+        raise OutputParseError("invalid_json", "Response is not valid JSON")
+
+    def parse(self, text: Optional[str], required_fields: Sequence[str] = ()) -> Optional[Dict[str, Any]]:
+        """Like parse_json but returns None on failure after counting it."""
+        try:
+            return self.parse_json(text, required_fields)
+        except OutputParseError as e:
+            self.record_failure(e.kind)
+            return None
+
+    def validate(self, model: Type[BaseModel], **fields) -> Optional[BaseModel]:
+        """Build a pydantic model from parsed fields, counting schema failures."""
+        try:
+            return model(**fields)
+        except (ValidationError, TypeError, ValueError):
+            self.record_failure("schema")
+            return None
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Counts of parse failures and successful repairs, by type."""
+        with self._lock:
+            return {"failures": dict(self.failures), "repairs": dict(self.repairs)}
+
+def normalize_mcq_answer(answer: Any, options: List[str]) -> Optional[str]:
+    """Map an MCQ answer given as an index, letter or option text to an index string."""
+    if isinstance(answer, bool) or answer is None:
+        return None
+    if isinstance(answer, int):
+        return str(answer) if 0 <= answer < len(options) else None
+
+    text = str(answer).strip()
+    if text.isdigit():
+        return text if int(text) < len(options) else None
+    for i, option in enumerate(options):
+        if str(option).strip().lower() == text.lower():
+            return str(i)
+    # "B", "b)", "(C)", "D. some text"
+    letter = re.match(r"^\(?([A-Da-d])(?:[\).:]|$)|^([A-D])\s", text)
+    if letter:
+        index = ord((letter.group(1) or letter.group(2)).upper()) - 65
+        return str(index) if index < len(options) else None
+    return None
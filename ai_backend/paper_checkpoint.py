@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import QuestionGenerationRequest
+
+class PaperCheckpointStore:
+    """
+    Append-only SQLite log of paper generation progress.
+
+    Every node appends a small delta (a candidate question, a validation result,
+    a similarity score) instead of re-serialising the whole state, so writes stay
+    cheap. Replaying a paper's events rebuilds enough state to resume it.
+    """
+
+    def __init__(self, path: Optional[str] = None, retention_hours: Optional[float] = None):
+        self.path = path or os.getenv("CHECKPOINT_DB", "checkpoints.sqlite3")
+        self.retention_hours = retention_hours if retention_hours is not None else float(
+            os.getenv("CHECKPOINT_RETENTION_HOURS", "72")
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS papers (
+                paper_id TEXT PRIMARY KEY,
+                request TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                paper_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_paper ON events (paper_id, seq);
+        """)
+        self.prune()
+
+    def start(self, paper_id: str, request: QuestionGenerationRequest):
+        """Register a new paper with its request."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO papers (paper_id, request, status, updated_at) VALUES (?, ?, ?, ?)",
+                (paper_id, request.model_dump_json(), "running", time.time())
+            )
+
+    def append(self, paper_id: str, kind: str, payload: Dict[str, Any]):
+        """Append one delta to the paper's event log."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (paper_id, kind, payload) VALUES (?, ?, ?)",
+                (paper_id, kind, json.dumps(payload))
+            )
+
+    def set_status(self, paper_id: str, status: str):
+        """Mark a paper as running, failed or complete."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE papers SET status = ?, updated_at = ? WHERE paper_id = ?",
+                (status, time.time(), paper_id)
+            )
+
+    def load(self, paper_id: str) -> Optional[Tuple[QuestionGenerationRequest, str, List[Tuple[str, Dict[str, Any]]]]]:
+        """Return (request, status, events) for a paper, or None if it is unknown."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT request, status FROM papers WHERE paper_id = ?", (paper_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            events = self._conn.execute(
+                "SELECT kind, payload FROM events WHERE paper_id = ? ORDER BY seq", (paper_id,)
+            ).fetchall()
+
+        request = QuestionGenerationRequest.model_validate_json(row[0])
+        return request, row[1], [(kind, json.loads(payload)) for kind, payload in events]
+
+    def prune(self):
+        """Drop papers (and their events) not updated within the retention window."""
+        cutoff = time.time() - self.retention_hours * 3600
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM events WHERE paper_id IN (SELECT paper_id FROM papers WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            self._conn.execute("DELETE FROM papers WHERE updated_at < ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,337 @@
+import hashlib
+import html
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from models import QuestionPaper, Question, QuestionType
+
+class MissingDependencyError(RuntimeError):
+    """An optional package a renderer needs (python-docx, pypdfium2) is not installed."""
+
+class HeaderBlock(BaseModel):
+    university_name: str
+    department: str
+    set_label: Optional[str] = None
+    # Course information table, four columns per row (label, value, label, value)
+    rows: List[List[str]]
+
+class OptionLine(BaseModel):
+    label: str
+    text: str
+    correct: bool = False
+
+class QuestionBlock(BaseModel):
+    number: int
+    heading: str
+    text: str
+    options: List[OptionLine] = []
+    # Short options (True/False) share one line
+    inline_options: bool = False
+    # Writing space left below the question, in points
+    answer_space: int = 0
+    explanation: Optional[str] = None
+
+class AnswerRow(BaseModel):
+    question: str
+    question_type: str
+    answer: str
+    marks: str
+
+class PaperLayout(BaseModel):
+    """
+    Format-neutral layout of a question paper: what goes on the page, in order.
+
+    Built once per paper and option set; the PDF, DOCX and HTML renderers only
+    map these blocks to their own primitives. Text is plain (not markup).
+    """
+    title: str
+    header: HeaderBlock
+    instructions_title: str = "INSTRUCTIONS:"
+    instructions: List[str]
+    questions: List[QuestionBlock]
+    answer_key: Optional[List[AnswerRow]] = None
+
+def format_answer(question: Question) -> str:
+    """The answer as shown in the answer key table."""
+    if question.question_type == QuestionType.MULTIPLE_CHOICE:
+        if question.correct_answer and question.options:
+            try:
+                idx = int(question.correct_answer)
+                if 0 <= idx < len(question.options):
+                    return f"{chr(65 + idx)}) {question.options[idx][:30]}..."
+            except (TypeError, ValueError):
+                pass
+        return question.correct_answer or "Not specified"
+
+    elif question.question_type == QuestionType.TRUE_FALSE:
+        return question.correct_answer.title() if question.correct_answer else "True"
+
+    elif isinstance(question.correct_answer, list):
+        return "; ".join(question.correct_answer[:3]) + ("..." if len(question.correct_answer) > 3 else "")
+
+    elif isinstance(question.correct_answer, str):
+        return question.correct_answer[:50] + ("..." if len(question.correct_answer) > 50 else "")
+
+    else:
+        return "See detailed solution"
+
+def _question_block(number: int, question: Question, include_answers: bool,
+                    include_explanations: bool) -> QuestionBlock:
+    heading = f"Q{number}. [{question.marks} Mark{'s' if question.marks > 1 else ''}]"
+    if question.difficulty:
+        heading += f" (Difficulty: {question.difficulty.value.title()})"
+    if question.blooms_level:
+        heading += f" (Bloom's: {question.blooms_level.value.title()})"
+
+    text = question.question_text
+    if question.has_equations and question.equation_latex:
+        # Equations are shown as LaTeX source until they are rendered to images
+        text = text.replace(f"${question.equation_latex}$", f"[EQUATION: {question.equation_latex}]")
+
+    options = []
+    inline_options = False
+    if question.question_type == QuestionType.MULTIPLE_CHOICE and question.options:
+        options = [
+            OptionLine(label=chr(65 + j), text=str(option),
+                       correct=include_answers and str(j) == str(question.correct_answer))
+            for j, option in enumerate(question.options)
+        ]
+    elif question.question_type == QuestionType.TRUE_FALSE:
+        correct = (question.correct_answer or 'true').lower()
+        options = [
+            OptionLine(label="A", text="True", correct=include_answers and correct == 'true'),
+            OptionLine(label="B", text="False", correct=include_answers and correct != 'true'),
+        ]
+        inline_options = True
+
+    answer_space = 0
+    if not include_answers:
+        if question.question_type in [QuestionType.SHORT_ANSWER, QuestionType.FILL_BLANKS]:
+            answer_space = 30
+        elif question.question_type in [QuestionType.LONG_ANSWER, QuestionType.SUBJECTIVE]:
+            answer_space = 60
+        else:
+            answer_space = 15
+
+    return QuestionBlock(
+        number=number,
+        heading=heading,
+        text=text,
+        options=options,
+        inline_options=inline_options,
+        answer_space=answer_space,
+        explanation=question.explanation if include_explanations and question.explanation else None,
+    )
+
+def build_layout(question_paper: QuestionPaper, include_answers: bool = False,
+                 include_explanations: bool = False, date: Optional[str] = None) -> PaperLayout:
+    """Walk the paper once and lay it out as format-neutral blocks."""
+    header_info = question_paper.header_info
+    date = date or datetime.now().strftime('%d/%m/%Y')
+    header = HeaderBlock(
+        university_name=header_info.get('university_name', 'University Name'),
+        department=header_info.get('department', 'Department Name'),
+        set_label=header_info.get('set'),
+        rows=[
+            ['Course Name:', header_info.get('course_name', 'Course Name'),
+             'Course Code:', header_info.get('course_code', 'COURSE-001')],
+            ['Subject:', header_info.get('subject', 'Subject'),
+             'Topic:', header_info.get('topic', 'Topic')],
+            ['Duration:', header_info.get('exam_duration', '3 Hours'),
+             'Max Marks:', header_info.get('max_marks', '100')],
+            ['Date:', date,
+             'Time:', '___________'],
+        ],
+    )
+    instructions = [
+        f"This question paper contains {len(question_paper.questions)} questions.",
+        f"Total marks: {question_paper.total_marks}",
+        "Answer all questions.",
+        "Read each question carefully before answering.",
+        "Write your answers clearly and legibly.",
+        "Use of calculators is permitted where applicable.",
+    ]
+    questions = [
+        _question_block(i, question, include_answers, include_explanations)
+        for i, question in enumerate(question_paper.questions, 1)
+    ]
+    answer_key = None
+    if include_answers:
+        answer_key = [
+            AnswerRow(
+                question=f"Q{i}",
+                question_type=question.question_type.value.replace('_', ' ').title(),
+                answer=format_answer(question),
+                marks=str(question.marks),
+            )
+            for i, question in enumerate(question_paper.questions, 1)
+        ]
+    return PaperLayout(
+        title=question_paper.title,
+        header=header,
+        instructions=instructions,
+        questions=questions,
+        answer_key=answer_key,
+    )
+
+# Layouts by paper content, options and date, least recently used first
+_layout_cache: "OrderedDict[str, PaperLayout]" = OrderedDict()
+_layout_lock = threading.Lock()
+
+def get_layout(question_paper: QuestionPaper, include_answers: bool = False,
+               include_explanations: bool = False) -> PaperLayout:
+    """Cached build_layout: exporting the same paper to several formats walks it once."""
+    date = datetime.now().strftime('%d/%m/%Y')
+    digest = hashlib.sha256(question_paper.model_dump_json().encode("utf-8")).hexdigest()
+    key = f"{digest}:{int(include_answers)}{int(include_explanations)}:{date}"
+    with _layout_lock:
+        if key in _layout_cache:
+            _layout_cache.move_to_end(key)
+            return _layout_cache[key]
+
+    layout = build_layout(question_paper, include_answers, include_explanations, date)
+    with _layout_lock:
+        _layout_cache[key] = layout
+        while len(_layout_cache) > int(os.getenv("LAYOUT_CACHE_SIZE", "32")):
+            _layout_cache.popitem(last=False)
+    return layout
+
+_HTML_STYLE = """
+body { font-family: Helvetica, Arial, sans-serif; max-width: 48em; margin: 2em auto; }
+h1, h2 { text-align: center; }
+table { border-collapse: collapse; width: 100%; margin-bottom: 1.5em; }
+td, th { border: 1px solid #000; padding: 0.3em 0.5em; }
+.header td:nth-child(odd) { font-weight: bold; }
+.instructions { font-style: italic; color: #555; }
+.question .heading { font-weight: bold; margin-bottom: 0.3em; }
+.question .text { margin-left: 1.5em; }
+.options { list-style: none; margin-left: 2em; padding: 0; }
+.correct { font-weight: bold; }
+.answer-key { page-break-before: always; }
+"""
+
+class HTMLRenderer:
+    """Renders a PaperLayout as a standalone HTML document."""
+
+    media_type = "text/html"
+    extension = "html"
+
+    def render(self, layout: PaperLayout) -> bytes:
+        e = html.escape
+        header = layout.header
+        parts = [
+            "<!DOCTYPE html>",
+            f"<html><head><meta charset=\"utf-8\"><title>{e(layout.title)}</title>",
+            f"<style>{_HTML_STYLE}</style></head><body>",
+            f"<h1>{e(header.university_name)}</h1>",
+            f"<h2>{e(header.department)}</h2>",
+        ]
+        if header.set_label:
+            parts.append(f"<h2>SET {e(header.set_label)}</h2>")
+        parts.append("<table class=\"header\">")
+        parts.extend("<tr>" + "".join(f"<td>{e(cell)}</td>" for cell in row) + "</tr>" for row in header.rows)
+        parts.append("</table>")
+
+        parts.append(f"<div class=\"instructions\"><b>{e(layout.instructions_title)}</b><ol>")
+        parts.extend(f"<li>{e(line)}</li>" for line in layout.instructions)
+        parts.append("</ol></div>")
+
+        for block in layout.questions:
+            parts.append("<div class=\"question\">")
+            parts.append(f"<div class=\"heading\">{e(block.heading)}</div>")
+            parts.append(f"<div class=\"text\">{e(block.text)}</div>")
+            if block.options:
+                parts.append("<ul class=\"options\">")
+                for option in block.options:
+                    text = f"{e(option.label)}) {e(option.text)}"
+                    parts.append(f"<li class=\"correct\">{text} &larr; CORRECT</li>" if option.correct
+                                 else f"<li>{text}</li>")
+                parts.append("</ul>")
+            if block.answer_space:
+                parts.append(f"<div style=\"height: {block.answer_space}pt\"></div>")
+            if block.explanation:
+                parts.append(f"<p class=\"instructions\"><b>Explanation:</b> {e(block.explanation)}</p>")
+            parts.append("</div>")
+
+        if layout.answer_key is not None:
+            parts.append("<div class=\"answer-key\"><h2>ANSWER KEY</h2><table>")
+            parts.append("<tr><th>Question</th><th>Type</th><th>Correct Answer</th><th>Marks</th></tr>")
+            parts.extend(
+                f"<tr><td>{e(row.question)}</td><td>{e(row.question_type)}</td>"
+                f"<td>{e(row.answer)}</td><td>{e(row.marks)}</td></tr>"
+                for row in layout.answer_key
+            )
+            parts.append("</table></div>")
+        parts.append("</body></html>")
+        return "\n".join(parts).encode("utf-8")
+
+class DocxRenderer:
+    """Renders a PaperLayout as a Word document (requires python-docx)."""
+
+    media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    extension = "docx"
+
+    def render(self, layout: PaperLayout) -> bytes:
+        try:
+            from docx import Document
+            from docx.enum.text import WD_ALIGN_PARAGRAPH
+            from docx.shared import Pt
+        except ImportError as e:
+            raise MissingDependencyError("DOCX export requires python-docx (pip install python-docx)") from e
+
+        document = Document()
+        header = layout.header
+        for text in [header.university_name, header.department] + (
+                [f"SET {header.set_label}"] if header.set_label else []):
+            paragraph = document.add_paragraph()
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run = paragraph.add_run(text)
+            run.bold = True
+            run.font.size = Pt(16)
+
+        table = document.add_table(rows=len(header.rows), cols=4)
+        table.style = "Table Grid"
+        for row, cells in zip(header.rows, table.rows):
+            for i, (value, cell) in enumerate(zip(row, cells.cells)):
+                cell.text = value
+                if i % 2 == 0:
+                    cell.paragraphs[0].runs[0].bold = True
+
+        document.add_paragraph().add_run(layout.instructions_title).bold = True
+        for line in layout.instructions:
+            document.add_paragraph(line, style="List Number")
+
+        for block in layout.questions:
+            document.add_paragraph().add_run(block.heading).bold = True
+            document.add_paragraph(block.text)
+            for option in block.options:
+                paragraph = document.add_paragraph(style="List Bullet")
+                run = paragraph.add_run(f"{option.label}) {option.text}" + (" ← CORRECT" if option.correct else ""))
+                run.bold = option.correct
+            if block.answer_space:
+                document.add_paragraph().paragraph_format.space_after = Pt(block.answer_space)
+            if block.explanation:
+                paragraph = document.add_paragraph()
+                paragraph.add_run("Explanation: ").bold = True
+                paragraph.add_run(block.explanation).italic = True
+
+        if layout.answer_key is not None:
+            document.add_page_break()
+            document.add_paragraph().add_run("ANSWER KEY").bold = True
+            table = document.add_table(rows=1, cols=4)
+            table.style = "Table Grid"
+            for cell, title in zip(table.rows[0].cells, ["Question", "Type", "Correct Answer", "Marks"]):
+                cell.text = title
+            for row in layout.answer_key:
+                for cell, value in zip(table.add_row().cells, [row.question, row.question_type, row.answer, row.marks]):
+                    cell.text = value
+
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return buffer.getvalue()
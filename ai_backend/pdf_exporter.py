@@ -1,7 +1,19 @@
+import asyncio
+import copy
+import hashlib
 import io
+import json
 import os
-from typing import List, Dict
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, AsyncIterator, Iterator, List, Dict, Optional, Sequence, Tuple
 from datetime import datetime
+from xml.sax.saxutils import escape
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -12,11 +24,159 @@ from reportlab.pdfgen import canvas
 from reportlab.platypus.tableofcontents import TableOfContents
 
 from models import QuestionPaper, Question, QuestionType
+from paper_layout import (
+    AnswerRow, HeaderBlock, MissingDependencyError, PaperLayout, QuestionBlock, build_layout, get_layout
+)
+from similarity_analyzer import process_pool_context
+
+def _mcq_index(question: Question) -> Optional[int]:
+    try:
+        return int(str(question.correct_answer))
+    except (TypeError, ValueError):
+        return None
+
+def shuffle_question_paper(question_paper: QuestionPaper, seed: int, label: str) -> QuestionPaper:
+    """
+    One exam set: questions in a seeded random order, and MCQ options shuffled
+    with the correct answer remapped to the option's new position.
+    """
+    rng = random.Random(seed)
+    questions = list(question_paper.questions)
+    rng.shuffle(questions)
+
+    shuffled = []
+    for question in questions:
+        if question.question_type == QuestionType.MULTIPLE_CHOICE and question.options:
+            order = list(range(len(question.options)))
+            rng.shuffle(order)
+            update = {"options": [question.options[i] for i in order]}
+            correct = _mcq_index(question)
+            if correct is not None and 0 <= correct < len(order):
+                update["correct_answer"] = str(order.index(correct))
+            question = question.model_copy(update=update)
+        shuffled.append(question)
+
+    header_info = dict(question_paper.header_info, set=label)
+    return question_paper.model_copy(update={
+        "id": f"{question_paper.id}-set-{label}",
+        "header_info": header_info,
+        "questions": shuffled,
+    })
+
+# Exporter per export worker process, so styles and cached headers are built once per worker
+_worker_exporter = None
+
+def _init_export_worker():
+    global _worker_exporter
+    _worker_exporter = PDFExporter()
+
+def _render_set(question_paper: QuestionPaper, seed: int, label: str,
+                include_answers: bool, include_explanations: bool) -> bytes:
+    paper = shuffle_question_paper(question_paper, seed, label)
+    return _worker_exporter.build_pdf(paper, include_answers, include_explanations)
+
+_export_pool: Optional[ProcessPoolExecutor] = None
+
+def get_export_pool() -> ProcessPoolExecutor:
+    """Process pool rendering exam sets, created on first use."""
+    global _export_pool
+    if _export_pool is None:
+        workers = int(os.getenv("EXPORT_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+        _export_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=process_pool_context(),
+            initializer=_init_export_worker
+        )
+    return _export_pool
+
+def shutdown_export_pool():
+    global _export_pool
+    if _export_pool is not None:
+        _export_pool.shutdown(wait=False, cancel_futures=True)
+        _export_pool = None
+
+class _ZipChunks(io.RawIOBase):
+    """Write-only sink that hands zipfile's output back in chunks."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# Page margins, and the width paragraphs wrap to inside the frame (6pt padding each side)
+_MARGINS = {"rightMargin": 72, "leftMargin": 72, "topMargin": 72, "bottomMargin": 18}
+_FRAME_WIDTH = A4[0] - _MARGINS["leftMargin"] - _MARGINS["rightMargin"] - 12
+
+def iter_file_chunks(file: IO[bytes], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Read a file from its current position in chunks, closing it at the end."""
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+class _WrappedParagraph(Paragraph):
+    """Paragraph that keeps its line breaks across builds at the same width."""
+
+    _wrapped_width = None
+
+    def wrap(self, availWidth, availHeight):
+        # Line breaking depends only on the width; the height only matters to split(),
+        # which drops blPara when it pushes the paragraph to the next page
+        if availWidth == self._wrapped_width and hasattr(self, "blPara"):
+            return self.width, self.height
+        size = super().wrap(availWidth, availHeight)
+        if size[0] == availWidth:
+            self._wrapped_width = availWidth
+        return size
+
+class _PreviewDocTemplate(SimpleDocTemplate):
+    """Lays out only the first ``max_pages`` pages and drops the rest of the story."""
+
+    def __init__(self, *args, max_pages: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_pages = max_pages
+
+    def handle_flowable(self, flowables):
+        if self.page > self.max_pages:
+            # A page past the preview has begun: nothing left to lay out
+            del flowables[:]
+            return
+        super().handle_flowable(flowables)
 
 class PDFExporter:
+    media_type = "application/pdf"
+    extension = "pdf"
+
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
+        # Header flowables by header content; they are never split, so every
+        # build (including every exam set) can reuse them
+        self._header_cache: "OrderedDict[tuple, List]" = OrderedDict()
+        # Parsed and wrapped flowables by question block content, so re-exporting a
+        # paper after swapping one question only rebuilds that question. Builds get
+        # shallow copies: layout leaves per-build state on the flowables it places.
+        self._question_cache: "OrderedDict[str, List]" = OrderedDict()
+        self.question_cache_size = int(os.getenv("PDF_QUESTION_CACHE_SIZE", "2048"))
+        self.question_cache_stats = {"hits": 0, "misses": 0}
+        self._cache_lock = threading.Lock()
+        # Preview PNGs by layout and page range, kept briefly while a paper is edited
+        self._preview_cache: "OrderedDict[tuple, Tuple[float, bytes]]" = OrderedDict()
+        self.preview_cache_seconds = float(os.getenv("PREVIEW_CACHE_SECONDS", "30"))
 
     def _setup_custom_styles(self):
         """Setup custom styles for the PDF."""
@@ -86,80 +246,214 @@ class PDFExporter:
                                   include_answers: bool = False,
                                   include_explanations: bool = False) -> bytes:
         """Export question paper to PDF and return as bytes."""
-        
-        # Create a BytesIO buffer
+        return self.build_pdf(question_paper, include_answers, include_explanations)
+
+    def build_pdf(self, question_paper: QuestionPaper,
+                  include_answers: bool = False,
+                  include_explanations: bool = False) -> bytes:
+        """Render a question paper to PDF bytes (blocking)."""
+        return self.render(get_layout(question_paper, include_answers, include_explanations))
+
+    def render(self, layout: PaperLayout, max_pages: Optional[int] = None) -> bytes:
+        """Render a paper layout to PDF bytes (blocking), optionally only its first pages."""
         buffer = io.BytesIO()
+        self.render_to(layout, buffer, max_pages)
+        return buffer.getvalue()
+
+    def spool(self, layout: PaperLayout) -> IO[bytes]:
+        """
+        Render a paper layout to a temporary file, rewound for reading (blocking).
+
+        The file stays in memory up to PDF_SPOOL_MAX_MB and spills to disk
+        beyond it, so a large paper is held once, not copied into a response
+        body. The caller closes it (iter_file_chunks does).
+        """
+        max_size = int(float(os.getenv("PDF_SPOOL_MAX_MB", "8")) * 1024 * 1024)
+        spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+        try:
+            self.render_to(layout, spool)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    def render_to(self, layout: PaperLayout, output: IO[bytes], max_pages: Optional[int] = None):
+        """Write a paper layout as PDF to a binary file object (blocking)."""
         
         # Create the PDF document
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=18
-        )
+        if max_pages is None:
+            doc = SimpleDocTemplate(output, pagesize=A4, **_MARGINS)
+        else:
+            doc = _PreviewDocTemplate(output, pagesize=A4, max_pages=max_pages, **_MARGINS)
         
         # Build the story (content)
         story = []
         
         # Add header
-        story.extend(self._create_header(question_paper))
+        story.extend(self._create_header(layout.header))
         
         # Add instructions
-        story.extend(self._create_instructions(question_paper))
+        story.extend(self._create_instructions(layout))
         
         # Add questions
-        story.extend(self._create_questions_section(
-            question_paper.questions, 
-            include_answers, 
-            include_explanations
-        ))
+        # A preview needs only the questions that can reach its last page
+        max_height = max_pages * doc.height if max_pages is not None else None
+        story.extend(self._create_questions_section(layout.questions, max_height))
         
         # Add footer information
-        if include_answers:
+        if layout.answer_key is not None:
             story.append(PageBreak())
-            story.extend(self._create_answer_key(question_paper.questions))
+            story.extend(self._create_answer_key(layout.answer_key))
         
         # Build the PDF
         doc.build(story)
-        
-        # Get the PDF bytes
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
-        
-        return pdf_bytes
 
-    def _create_header(self, question_paper: QuestionPaper) -> List:
+    def render_preview(self, layout: PaperLayout, first_page: int = 1,
+                       last_page: Optional[int] = None, scale: float = 1.0) -> bytes:
+        """
+        PNG of a page range (blocking), pages stacked top to bottom.
+
+        Layout stops after ``last_page``, so a preview of the first page of a
+        long paper never breaks the rest of it into pages. Needs the optional
+        pypdfium2 package; raises MissingDependencyError without it and
+        ValueError if the paper has fewer than ``first_page`` pages.
+        """
+        last_page = last_page or first_page
+        key = (
+            hashlib.sha256(layout.model_dump_json().encode("utf-8")).hexdigest(),
+            first_page, last_page, scale
+        )
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._preview_cache.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+        
+        try:
+            import pypdfium2
+        except ImportError as e:
+            raise MissingDependencyError("Page previews require the pypdfium2 package (pip install pypdfium2)") from e
+        from PIL import Image
+        
+        pdf = pypdfium2.PdfDocument(self.render(layout, max_pages=last_page))
+        try:
+            if first_page > len(pdf):
+                raise ValueError(f"The paper has only {len(pdf)} page(s)")
+            pages = [
+                pdf[i].render(scale=scale).to_pil()
+                for i in range(first_page - 1, min(last_page, len(pdf)))
+            ]
+        finally:
+            pdf.close()
+        
+        image = pages[0]
+        if len(pages) > 1:
+            image = Image.new("RGB", (max(p.width for p in pages), sum(p.height for p in pages)), "white")
+            top = 0
+            for page in pages:
+                image.paste(page, (0, top))
+                top += page.height
+        buffer = io.BytesIO()
+        # Fast compression: encoding dominates the preview at the default level
+        image.save(buffer, format="PNG", compress_level=1)
+        png = buffer.getvalue()
+        
+        with self._cache_lock:
+            self._preview_cache[key] = (now + self.preview_cache_seconds, png)
+            # Drop expired entries, then the oldest beyond a small bound
+            for stale in [k for k, (expires, _) in self._preview_cache.items() if expires <= now]:
+                del self._preview_cache[stale]
+            while len(self._preview_cache) > 64:
+                self._preview_cache.popitem(last=False)
+        return png
+
+    async def export_sets(self, question_paper: QuestionPaper, seeds: Sequence[int],
+                          include_answers: bool = False,
+                          include_explanations: bool = False) -> AsyncIterator[bytes]:
+        """
+        A ZIP of exam sets (Set A, B, ...), one per seed, each with its own
+        question order and MCQ option order, as an iterator of chunks.
+
+        Sets are rendered in parallel in the export process pool and written to
+        the archive in order as they finish; manifest.json records every set's
+        seed, question order and objective answer key. Set A is awaited before
+        returning, so a pool that cannot start or a paper that cannot be
+        rendered raises here rather than midway through a streamed response.
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_export_pool()
+        labels = [chr(65 + i) for i in range(len(seeds))]
+        futures = [
+            loop.run_in_executor(pool, _render_set, question_paper, seed, label,
+                                 include_answers, include_explanations)
+            for seed, label in zip(seeds, labels)
+        ]
+        try:
+            first = await futures[0]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return self._stream_sets(question_paper, seeds, labels, first, futures)
+
+    async def _stream_sets(self, question_paper: QuestionPaper, seeds: Sequence[int], labels: List[str],
+                           first: bytes, futures: List[asyncio.Future]) -> AsyncIterator[bytes]:
+        sink = _ZipChunks()
+        try:
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for i, (label, future) in enumerate(zip(labels, futures)):
+                    archive.writestr(f"set_{label}.pdf", first if i == 0 else await future)
+                    yield sink.drain()
+                archive.writestr("manifest.json", json.dumps(self._sets_manifest(question_paper, seeds, labels), indent=2))
+            yield sink.drain()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _sets_manifest(self, question_paper: QuestionPaper, seeds: Sequence[int], labels: List[str]) -> Dict:
+        sets = []
+        for seed, label in zip(seeds, labels):
+            paper = shuffle_question_paper(question_paper, seed, label)
+            answer_key = {}
+            for i, question in enumerate(paper.questions, 1):
+                if question.question_type == QuestionType.MULTIPLE_CHOICE and _mcq_index(question) is not None:
+                    answer_key[f"Q{i}"] = chr(65 + _mcq_index(question))
+                elif question.question_type == QuestionType.TRUE_FALSE and question.correct_answer:
+                    answer_key[f"Q{i}"] = str(question.correct_answer).title()
+            sets.append({
+                "set": label,
+                "seed": seed,
+                "question_ids": [question.id for question in paper.questions],
+                "answer_key": answer_key,
+            })
+        return {"paper_id": question_paper.id, "sets": sets}
+
+    def _create_header(self, header: HeaderBlock) -> List:
         """Create the header section of the question paper."""
+        key = (header.university_name, header.department, tuple(map(tuple, header.rows)))
+        if key in self._header_cache:
+            self._header_cache.move_to_end(key)
+        else:
+            self._header_cache[key] = self._build_header(header)
+            if len(self._header_cache) > 32:
+                self._header_cache.popitem(last=False)
+        story = list(self._header_cache[key])
+        if header.set_label:
+            story.insert(2, Paragraph(f"SET {escape(header.set_label)}", self.styles['CustomHeader']))
+        return story
+
+    def _build_header(self, header: HeaderBlock) -> List:
         story = []
-        header_info = question_paper.header_info
         
         # University name
-        story.append(Paragraph(
-            header_info.get('university_name', 'University Name'),
-            self.styles['UniversityName']
-        ))
+        story.append(Paragraph(escape(header.university_name), self.styles['UniversityName']))
         
         # Department
-        story.append(Paragraph(
-            header_info.get('department', 'Department Name'),
-            self.styles['CustomHeader']
-        ))
+        story.append(Paragraph(escape(header.department), self.styles['CustomHeader']))
         
         # Course information table
-        course_data = [
-            ['Course Name:', header_info.get('course_name', 'Course Name'),
-             'Course Code:', header_info.get('course_code', 'COURSE-001')],
-            ['Subject:', header_info.get('subject', 'Subject'),
-             'Topic:', header_info.get('topic', 'Topic')],
-            ['Duration:', header_info.get('exam_duration', '3 Hours'),
-             'Max Marks:', header_info.get('max_marks', '100')],
-            ['Date:', datetime.now().strftime('%d/%m/%Y'),
-             'Time:', '___________']
-        ]
-        
-        course_table = Table(course_data, colWidths=[1.5*inch, 2*inch, 1.5*inch, 1.5*inch])
+        course_table = Table(header.rows, colWidths=[1.5*inch, 2*inch, 1.5*inch, 1.5*inch])
         course_table.setStyle(TableStyle([
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
             ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
@@ -174,97 +468,96 @@ class PDFExporter:
         
         return story
 
-    def _create_instructions(self, question_paper: QuestionPaper) -> List:
+    def _create_instructions(self, layout: PaperLayout) -> List:
         """Create the instructions section."""
         story = []
         
-        instructions_text = f"""
-        <b>INSTRUCTIONS:</b><br/>
-        1. This question paper contains {len(question_paper.questions)} questions.<br/>
-        2. Total marks: {question_paper.total_marks}<br/>
-        3. Answer all questions.<br/>
-        4. Read each question carefully before answering.<br/>
-        5. Write your answers clearly and legibly.<br/>
-        6. Use of calculators is permitted where applicable.<br/>
-        """
+        lines = "".join(f"{i}. {escape(line)}<br/>" for i, line in enumerate(layout.instructions, 1))
+        instructions_text = f"<b>{escape(layout.instructions_title)}</b><br/>{lines}"
         
         story.append(Paragraph(instructions_text, self.styles['Instructions']))
         story.append(Spacer(1, 15))
         
         return story
 
-    def _create_questions_section(self, questions: List[Question], 
-                                include_answers: bool = False,
-                                include_explanations: bool = False) -> List:
-        """Create the questions section."""
+    def _create_questions_section(self, questions: List[QuestionBlock],
+                                  max_height: Optional[float] = None) -> List:
+        """
+        Create the questions section, reusing the flowables of unchanged questions.
+
+        With ``max_height``, stops once the wrapped heights exceed it: spacing
+        and page breaks only add to them, so later questions would fall past it.
+        """
         story = []
-        
-        for i, question in enumerate(questions, 1):
-            # Question number and marks
-            q_header = f"Q{i}. [{question.marks} Mark{'s' if question.marks > 1 else ''}]"
-            if question.difficulty:
-                q_header += f" (Difficulty: {question.difficulty.value.title()})"
-            if question.blooms_level:
-                q_header += f" (Bloom's: {question.blooms_level.value.title()})"
-            
-            story.append(Paragraph(q_header, self.styles['QuestionNumber']))
+        height = 0.0
+        
+        for block in questions:
+            if max_height is not None and height > max_height:
+                break
+            key = hashlib.sha256(block.model_dump_json().encode("utf-8")).hexdigest()
+            with self._cache_lock:
+                flowables = self._question_cache.get(key)
+                if flowables is not None:
+                    self._question_cache.move_to_end(key)
+                    self.question_cache_stats["hits"] += 1
             
-            # Question text
-            question_text = question.question_text
+            if flowables is None:
+                flowables = self._build_question(block)
+                with self._cache_lock:
+                    self.question_cache_stats["misses"] += 1
+                    self._question_cache[key] = flowables
+                    while len(self._question_cache) > self.question_cache_size:
+                        self._question_cache.popitem(last=False)
             
-            # Handle equations in question text
-            if question.has_equations and question.equation_latex:
-                # For now, we'll include the LaTeX as text
-                # In a production system, you'd want to render the LaTeX to an image
-                question_text = question_text.replace(f"${question.equation_latex}$", 
-                                                    f"[EQUATION: {question.equation_latex}]")
-            
-            story.append(Paragraph(question_text, self.styles['QuestionText']))
-            
-            # Add options for MCQ and True/False
-            if question.question_type == QuestionType.MULTIPLE_CHOICE and question.options:
-                for j, option in enumerate(question.options):
-                    option_letter = chr(65 + j)  # A, B, C, D
-                    option_text = f"{option_letter}) {option}"
-                    
-                    # Highlight correct answer if including answers
-                    if include_answers and str(j) == str(question.correct_answer):
-                        option_text = f"<b>{option_text}</b> ← CORRECT"
-                    
-                    story.append(Paragraph(option_text, self.styles['OptionText']))
-            
-            elif question.question_type == QuestionType.TRUE_FALSE:
-                tf_options = "A) True     B) False"
-                if include_answers:
-                    correct = question.correct_answer.lower() if question.correct_answer else 'true'
-                    if correct == 'true':
-                        tf_options = "<b>A) True ← CORRECT</b>     B) False"
-                    else:
-                        tf_options = "A) True     <b>B) False ← CORRECT</b>"
+            story.extend(copy.copy(flowable) for flowable in flowables)
+            height += sum(flowable.height for flowable in flowables)
+        
+        return story
+
+    def _build_question(self, block: QuestionBlock) -> List:
+        story = []
+        
+        # Question number and marks
+        story.append(_WrappedParagraph(escape(block.heading), self.styles['QuestionNumber']))
+        
+        # Question text
+        story.append(_WrappedParagraph(escape(block.text), self.styles['QuestionText']))
+        
+        # Add options for MCQ and True/False
+        if block.inline_options:
+            tf_options = "     ".join(
+                f"<b>{o.label}) {escape(o.text)} ← CORRECT</b>" if o.correct else f"{o.label}) {escape(o.text)}"
+                for o in block.options
+            )
+            story.append(_WrappedParagraph(tf_options, self.styles['OptionText']))
+        else:
+            for option in block.options:
+                option_text = f"{option.label}) {escape(option.text)}"
                 
-                story.append(Paragraph(tf_options, self.styles['OptionText']))
-            
-            # Add space for answer if not including answers
-            if not include_answers:
-                if question.question_type in [QuestionType.SHORT_ANSWER, QuestionType.FILL_BLANKS]:
-                    story.append(Spacer(1, 30))
-                elif question.question_type in [QuestionType.LONG_ANSWER, QuestionType.SUBJECTIVE]:
-                    story.append(Spacer(1, 60))
-                else:
-                    story.append(Spacer(1, 15))
-            
-            # Add explanation if requested
-            if include_explanations and question.explanation:
-                story.append(Paragraph(
-                    f"<b>Explanation:</b> {question.explanation}",
-                    self.styles['Instructions']
-                ))
-            
-            story.append(Spacer(1, 10))
+                # Highlight correct answer if including answers
+                if option.correct:
+                    option_text = f"<b>{option_text}</b> ← CORRECT"
+                
+                story.append(_WrappedParagraph(option_text, self.styles['OptionText']))
+        
+        # Add space for answer if not including answers
+        if block.answer_space:
+            story.append(Spacer(1, block.answer_space))
         
+        # Add explanation if requested
+        if block.explanation:
+            story.append(_WrappedParagraph(
+                f"<b>Explanation:</b> {escape(block.explanation)}",
+                self.styles['Instructions']
+            ))
+        
+        story.append(Spacer(1, 10))
+        
+        for flowable in story:
+            flowable.wrap(_FRAME_WIDTH, A4[1])
         return story
 
-    def _create_answer_key(self, questions: List[Question]) -> List:
+    def _create_answer_key(self, rows: List[AnswerRow]) -> List:
         """Create answer key section."""
         story = []
         
@@ -273,15 +566,7 @@ class PDFExporter:
         
         # Create answer table
         answer_data = [['Question', 'Type', 'Correct Answer', 'Marks']]
-        
-        for i, question in enumerate(questions, 1):
-            answer = self._format_answer_for_table(question)
-            answer_data.append([
-                f"Q{i}",
-                question.question_type.value.replace('_', ' ').title(),
-                answer,
-                str(question.marks)
-            ])
+        answer_data.extend([row.question, row.question_type, row.answer, row.marks] for row in rows)
         
         answer_table = Table(answer_data, colWidths=[0.8*inch, 1.5*inch, 3*inch, 0.8*inch])
         answer_table.setStyle(TableStyle([
@@ -298,30 +583,6 @@ class PDFExporter:
         
         return story
 
-    def _format_answer_for_table(self, question: Question) -> str:
-        """Format the answer for display in the answer table."""
-        if question.question_type == QuestionType.MULTIPLE_CHOICE:
-            if question.correct_answer and question.options:
-                try:
-                    idx = int(question.correct_answer)
-                    if 0 <= idx < len(question.options):
-                        return f"{chr(65 + idx)}) {question.options[idx][:30]}..."
-                except:
-                    pass
-            return question.correct_answer or "Not specified"
-        
-        elif question.question_type == QuestionType.TRUE_FALSE:
-            return question.correct_answer.title() if question.correct_answer else "True"
-        
-        elif isinstance(question.correct_answer, list):
-            return "; ".join(question.correct_answer[:3]) + ("..." if len(question.correct_answer) > 3 else "")
-        
-        elif isinstance(question.correct_answer, str):
-            return question.correct_answer[:50] + ("..." if len(question.correct_answer) > 50 else "")
-        
-        else:
-            return "See detailed solution"
-
     async def export_with_custom_header(self, question_paper: QuestionPaper,
                                       custom_header: Dict[str, str],
                                       include_answers: bool = False) -> bytes:
@@ -370,7 +631,7 @@ class PDFExporter:
             generated_at=datetime.now().isoformat()
         )
         
-        story.extend(self._create_header(template_paper))
+        story.extend(self._create_header(build_layout(template_paper).header))
         
         # Add sample content
         story.append(Paragraph("Sample Question Format:", self.styles['QuestionNumber']))
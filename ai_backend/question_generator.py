@@ -1,147 +1,348 @@
 import asyncio
+import hashlib
 import json
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import re
 
-from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from models import (
     QuestionGenerationRequest, QuestionPaper, Question, 
-    AlternativeQuestionRequest, QuestionType, DifficultyLevel, BloomsTaxonomy
+    AlternativeQuestionRequest, QuestionType, DifficultyLevel, BloomsTaxonomy, QuestionSpec
 )
-from similarity_analyzer import SimilarityAnalyzer
-from equation_handler import EquationHandler
-from .gemini_client import chat_completion
+from similarity_analyzer import SimilarityAnalyzer, PaperSimilarityTracker
+from gemini_client import AsyncGeminiClient
+from model_router import ModelRouter
+from output_parser import LLMOutputParser, normalize_mcq_answer
+from question_schedule import build_question_schedule
+from paper_checkpoint import PaperCheckpointStore
 import os
 
+# LangChain, LangGraph and sympy are imported on first use so that importing
+# this module (and starting the API) stays fast; see warm_up().
+
+def _chat_prompt(messages):
+    """Build a ChatPromptTemplate, importing LangChain on first use."""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages(messages)
+
+class PaperGenerationError(Exception):
+    """Paper generation failed; completed questions are checkpointed under ``paper_id``."""
+
+    def __init__(self, paper_id: str, message: str):
+        super().__init__(message)
+        self.paper_id = paper_id
+
 class QuestionGeneratorState(BaseModel):
     request: QuestionGenerationRequest
+    paper_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     generated_questions: List[Question] = []
     current_question_index: int = 0
+    question_specs: List[QuestionSpec] = []
     similarity_scores: Dict[str, float] = {}
     validation_results: Dict[str, Any] = {}
     final_paper: Optional[QuestionPaper] = None
+    # Candidates recovered from a checkpoint that already passed their checks
+    resumed_tasks: Dict[int, "QuestionTaskState"] = {}
+
+class QuestionTaskState(BaseModel):
+    """State of the per-question sub-graph: one scheduled spec and its current candidate."""
+    request: QuestionGenerationRequest
+    spec: QuestionSpec
+    candidate: Optional[Question] = None
+    attempts: int = 0
+    validation: Dict[str, Any] = {}
+    similarity_score: float = 0.0
+    # Highest similarity to a question already accepted into the same paper
+    duplicate_score: float = 0.0
+    paper_id: Optional[str] = None
+
+QuestionGeneratorState.model_rebuild()
 
 class QuestionGeneratorGraph:
-    def __init__(self):
-        self.llm = ChatOpenAI(
+    def __init__(self, llm: Optional[Any] = None, checkpoint_store: Optional[PaperCheckpointStore] = None):
+        # Any chat backend exposing ``ainvoke`` returning an object with ``content``
+        self.provider = os.getenv("LLM_PROVIDER", "openai").lower()
+        self._llm = llm
+        self.model_router = ModelRouter()
+        self.output_parser = LLMOutputParser()
+        # LLM plans keyed by request fingerprint, least recently used first
+        self._plan_cache: "OrderedDict[str, List[QuestionSpec]]" = OrderedDict()
+        self._plan_cache_size = int(os.getenv("PLAN_CACHE_SIZE", "128"))
+        self.similarity_analyzer = SimilarityAnalyzer()
+        # Accepted-question matrices of the papers currently being generated
+        self._paper_trackers: Dict[str, PaperSimilarityTracker] = {}
+        # Persisted previous-question corpora, looked up by course code
+        self.corpus_store = self.similarity_analyzer.corpus_store
+        self._equation_handler = None
+        # Answers for generated equations are computed in worker processes
+        self.solve_equations = os.getenv("SOLVE_EQUATIONS", "true").lower() == "true"
+        self._equation_solver = None
+        # Attempts per question before the last candidate is accepted as is
+        self.max_question_attempts = int(os.getenv("MAX_QUESTION_ATTEMPTS", "3"))
+        # Questions generated concurrently, each in its own sub-graph run
+        self.generation_batch_size = int(os.getenv("GENERATION_BATCH_SIZE", "4"))
+        # Default limit on similarity to questions already accepted into the paper
+        self.duplicate_threshold = float(os.getenv("DUPLICATE_THRESHOLD", "80"))
+        self._question_graph = None
+        # Set CHECKPOINT_DB to an empty value to disable checkpointing
+        if checkpoint_store is None and os.getenv("CHECKPOINT_DB", "checkpoints.sqlite3"):
+            checkpoint_store = PaperCheckpointStore()
+        self.checkpoints = checkpoint_store
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = self._create_llm()
+        return self._llm
+
+    @property
+    def equation_handler(self):
+        if self._equation_handler is None:
+            from equation_handler import EquationHandler
+            self._equation_handler = EquationHandler()
+        return self._equation_handler
+
+    @property
+    def equation_solver(self):
+        if self._equation_solver is None:
+            from equation_solver import EquationSolver
+            self._equation_solver = EquationSolver()
+        return self._equation_solver
+
+    @property
+    def question_graph(self):
+        if self._question_graph is None:
+            self._question_graph = self._build_question_graph()
+        return self._question_graph
+
+    def warm_up(self):
+        """
+        Construct the lazily created components ahead of the first request.
+
+        Blocking (imports and object construction), so run it in a worker thread.
+        """
+        self.llm
+        self.equation_handler.warm_up()
+        if self.solve_equations:
+            self.equation_solver.warm_up()
+        self.question_graph
+        self.similarity_analyzer.warm_up()
+        _chat_prompt([("system", "warm up")])
+
+    def _duplicate_threshold(self, request: QuestionGenerationRequest) -> float:
+        if request.duplicate_threshold is not None:
+            return request.duplicate_threshold
+        return self.duplicate_threshold
+
+    async def _checkpoint(self, paper_id: Optional[str], kind: str, payload: Dict[str, Any]):
+        """Append a progress delta for the paper, if checkpointing is enabled."""
+        if self.checkpoints is not None and paper_id:
+            # SQLite writes block; keep them off the event loop shared by the batch
+            await asyncio.to_thread(self.checkpoints.append, paper_id, kind, payload)
+
+    def _create_llm(self):
+        """Create the chat backend selected by LLM_PROVIDER (openai or gemini)."""
+        if self.provider == "gemini":
+            return AsyncGeminiClient(
+                temperature=0.7,
+                max_tokens=2000,
+                timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+            )
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
             model="gpt-4o-mini",
             temperature=0.7,
-            max_tokens=2000
+            max_tokens=2000,
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
         )
-        self.similarity_analyzer = SimilarityAnalyzer()
-        self.equation_handler = EquationHandler()
-        self.graph = self._build_graph()
 
-    def _build_graph(self) -> StateGraph:
-        """Build the LangGraph workflow for question generation."""
-        workflow = StateGraph(QuestionGeneratorState)
+    async def aclose(self):
+        """Release network resources held by the chat backend and save the equation pool."""
+        close = getattr(self._llm, "aclose", None)
+        if close:
+            await close()
+        if self._equation_handler is not None:
+            await asyncio.to_thread(self._equation_handler.pool.save)
+        if self._equation_solver is not None:
+            self._equation_solver.shutdown()
+
+    async def _ainvoke(self, messages: List[Any], question_type: Optional[QuestionType] = None,
+                       difficulty: Optional[DifficultyLevel] = None,
+                       blooms_level: Optional[BloomsTaxonomy] = None):
+        """Call the chat backend with the routed model settings and record route stats."""
+        route = self.model_router.route(question_type, difficulty, blooms_level)
+        start = time.perf_counter()
+        try:
+            response = await self.llm.ainvoke(messages, **route.invoke_kwargs(self.provider))
+        except Exception:
+            self.model_router.record(route, time.perf_counter() - start, error=True)
+            raise
+        self.model_router.record(route, time.perf_counter() - start, getattr(response, "usage_metadata", None))
+        return response
+
+    def _build_question_graph(self):
+        """
+        Build the LangGraph sub-graph that produces a single accepted question.
+
+        Each question runs as its own bounded invocation, so the number of
+        supersteps per run depends only on max_question_attempts and papers of
+        any size stay within the recursion limit.
+        """
+        from langgraph.graph import StateGraph, END
+
+        workflow = StateGraph(QuestionTaskState)
         
         # Define nodes
-        workflow.add_node("plan_generation", self._plan_generation)
         workflow.add_node("generate_question", self._generate_question)
         workflow.add_node("validate_question", self._validate_question)
         workflow.add_node("check_similarity", self._check_similarity)
-        workflow.add_node("finalize_paper", self._finalize_paper)
         
         # Define edges
-        workflow.set_entry_point("plan_generation")
-        workflow.add_edge("plan_generation", "generate_question")
+        workflow.set_entry_point("generate_question")
         workflow.add_edge("generate_question", "validate_question")
         workflow.add_edge("validate_question", "check_similarity")
         
-        # Conditional routing based on similarity check
+        # Conditional routing based on validation and similarity
         workflow.add_conditional_edges(
             "check_similarity",
             self._should_regenerate,
             {
                 "regenerate": "generate_question",
-                "continue": "finalize_paper",
-                "next_question": "generate_question"
+                "accept": END
             }
         )
         
-        workflow.add_edge("finalize_paper", END)
-        
         return workflow.compile()
 
+    @property
+    def _question_recursion_limit(self) -> int:
+        # Three supersteps per attempt, plus headroom for the start/end steps
+        return 3 * max(1, self.max_question_attempts) + 2
+
     async def _plan_generation(self, state: QuestionGeneratorState) -> QuestionGeneratorState:
-        """Plan the question generation strategy."""
+        """Produce the per-question spec list, using the LLM only when requested."""
         request = state.request
-        
-        # Create a generation plan
-        plan_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert educator creating a comprehensive question generation plan.
-            Based on the requirements, create a detailed strategy for generating questions that:
-            1. Follow Bloom's taxonomy distribution
-            2. Meet difficulty requirements
-            3. Cover course and program outcomes
-            4. Maintain appropriate similarity thresholds
-            
-            Return a JSON plan with question specifications."""),
-            ("human", f"""Create a question generation plan for:
-            Subject: {request.subject}
+
+        if not state.question_specs:
+            state.question_specs = build_question_schedule(request)
+
+        if not request.use_llm_plan:
+            state.validation_results["plan"] = {"source": "deterministic"}
+            return state
+
+        fingerprint = self._request_fingerprint(request)
+        cached = self._plan_cache.get(fingerprint)
+        if cached is not None:
+            self._plan_cache.move_to_end(fingerprint)
+            state.question_specs = [spec.model_copy() for spec in cached]
+            state.validation_results["plan"] = {"source": "cache", "fingerprint": fingerprint}
+            return state
+
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        base_specs = state.question_specs
+        # Plain messages: the distributions contain braces that a prompt template would misread
+        plan_messages = [
+            SystemMessage(content="""You are an expert educator planning a question paper.
+            You are given one specification per question (type, difficulty, Bloom's level and
+            outcomes). Assign each question a distinct, specific sub-topic from the syllabus so the
+            paper covers the syllabus without repetition. Keep every other field unchanged.
+
+            Return JSON: {"questions": [{"index": 0, "focus": "..."}, ...]}"""),
+            HumanMessage(content=f"""Subject: {request.subject}
             Topic: {request.topic}
-            Total Questions: {request.total_questions}
-            Question Types: {request.question_types}
-            Difficulty Distribution: {request.difficulty_distribution}
-            Bloom's Distribution: {request.blooms_distribution}
-            Course Outcomes: {request.course_outcomes}
-            Program Outcomes: {request.program_outcomes}
+            Syllabus: {request.syllabus_content[:1500]}
             Include Equations: {request.include_equations}
+            Question specifications:
+            {json.dumps([spec.model_dump(mode="json", exclude={"focus"}) for spec in base_specs])}
             """)
-        ])
-        
-        response = await self.llm.ainvoke(plan_prompt.format_messages())
-        # Process the plan (simplified for now)
-        state.validation_results["plan"] = response.content
-        
+        ]
+
+        response = await self._ainvoke(plan_messages)
+        plan_data = self.output_parser.parse(response.content, ("questions",))
+        specs = self._apply_plan(base_specs, plan_data)
+
+        if plan_data is not None:
+            self._plan_cache[fingerprint] = specs
+            if len(self._plan_cache) > self._plan_cache_size:
+                self._plan_cache.popitem(last=False)
+
+        state.question_specs = [spec.model_copy() for spec in specs]
+        state.validation_results["plan"] = {
+            "source": "llm" if plan_data is not None else "deterministic",
+            "fingerprint": fingerprint
+        }
         return state
 
-    async def _generate_question(self, state: QuestionGeneratorState) -> QuestionGeneratorState:
-        """Generate a single question based on current requirements."""
+    def _apply_plan(self, base_specs: List[QuestionSpec], plan_data: Optional[Dict[str, Any]]) -> List[QuestionSpec]:
+        """Merge the sub-topics of an LLM plan into the deterministic specs."""
+        specs = [spec.model_copy() for spec in base_specs]
+        if not plan_data or not isinstance(plan_data.get("questions"), list):
+            return specs
+
+        for position, entry in enumerate(plan_data["questions"]):
+            if not isinstance(entry, dict):
+                continue
+            index = entry.get("index", position)
+            focus = entry.get("focus")
+            if isinstance(index, int) and 0 <= index < len(specs) and isinstance(focus, str) and focus.strip():
+                specs[index].focus = focus.strip()
+        return specs
+
+    def _request_fingerprint(self, request: QuestionGenerationRequest) -> str:
+        """Hash of the request fields that influence the generation plan."""
+        plan_fields = request.model_dump(mode="json", include={
+            "subject", "topic", "syllabus_content", "total_questions", "question_types",
+            "difficulty_distribution", "blooms_distribution", "course_outcomes",
+            "program_outcomes", "include_equations"
+        })
+        return hashlib.sha256(json.dumps(plan_fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def _generate_question(self, state: QuestionTaskState) -> QuestionTaskState:
+        """Generate a candidate question for the scheduled specification."""
         request = state.request
-        current_index = state.current_question_index
-        
-        if current_index >= request.total_questions:
-            return state
-        
-        # Determine question type for current index
-        question_type = self._get_next_question_type(request, current_index)
-        difficulty = self._get_next_difficulty(request, current_index)
-        blooms_level = self._get_next_blooms_level(request, current_index)
+        spec = state.spec
+        question_type = spec.question_type
+        difficulty = spec.difficulty
+        blooms_level = spec.blooms_level
         
         # Generate question based on type
         if question_type == QuestionType.MULTIPLE_CHOICE:
-            question = await self._generate_mcq(request, difficulty, blooms_level)
+            question = await self._generate_mcq(request, difficulty, blooms_level, spec.focus)
         elif question_type == QuestionType.TRUE_FALSE:
-            question = await self._generate_true_false(request, difficulty, blooms_level)
+            question = await self._generate_true_false(request, difficulty, blooms_level, spec.focus)
         elif question_type == QuestionType.SHORT_ANSWER:
-            question = await self._generate_short_answer(request, difficulty, blooms_level)
+            question = await self._generate_short_answer(request, difficulty, blooms_level, spec.focus)
         elif question_type == QuestionType.LONG_ANSWER:
-            question = await self._generate_long_answer(request, difficulty, blooms_level)
+            question = await self._generate_long_answer(request, difficulty, blooms_level, spec.focus)
         else:
-            question = await self._generate_subjective(request, difficulty, blooms_level)
+            question = await self._generate_subjective(request, difficulty, blooms_level, spec.focus)
+        question.course_outcome = spec.course_outcome
+        question.program_outcome = spec.program_outcome
         
         # Handle equations if needed
         if request.include_equations and self._should_include_equation(question_type, difficulty):
             question = await self.equation_handler.add_equation_to_question(question)
         
-        state.generated_questions.append(question)
-        state.current_question_index += 1
+        state.candidate = question
+        state.attempts += 1
+        await self._checkpoint(state.paper_id, "candidate", {
+            "index": spec.index,
+            "question": question.model_dump(mode="json")
+        })
         
         return state
 
     async def _generate_mcq(self, request: QuestionGenerationRequest, 
-                           difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy) -> Question:
+                           difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy,
+                           focus: Optional[str] = None) -> Question:
         """Generate a multiple choice question."""
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _chat_prompt([
             ("system", f"""You are an expert educator creating multiple choice questions.
             Generate a high-quality MCQ that:
             - Tests {blooms_level.value} level of Bloom's taxonomy
@@ -157,34 +358,42 @@ class QuestionGeneratorGraph:
             Topic: {request.topic}
             Syllabus: {request.syllabus_content[:500]}...
             Difficulty: {difficulty.value}
-            Bloom's Level: {blooms_level.value}
+            Bloom's Level: {blooms_level.value}{self._focus_line(focus)}
             """)
         ])
         
-        response = await self.llm.ainvoke(prompt.format_messages())
+        response = await self._ainvoke(prompt.format_messages(), QuestionType.MULTIPLE_CHOICE, difficulty, blooms_level)
         
-        try:
-            question_data = json.loads(response.content)
-            question = Question(
-                id=str(uuid.uuid4()),
-                question_text=question_data["question_text"],
-                question_type=QuestionType.MULTIPLE_CHOICE,
-                difficulty=difficulty,
-                blooms_level=blooms_level,
-                marks=request.marks_per_question.get(QuestionType.MULTIPLE_CHOICE, 2),
-                options=question_data["options"],
-                correct_answer=str(question_data["correct_answer"]),
-                explanation=question_data.get("explanation", "")
-            )
-            return question
-        except:
-            # Fallback question if JSON parsing fails
+        question_data = self.output_parser.parse(response.content, ("question_text", "options", "correct_answer"))
+        if question_data is None:
+            # Fallback question if the response could not be parsed
+            return self._create_fallback_mcq(request, difficulty, blooms_level)
+
+        options = question_data["options"]
+        correct_answer = normalize_mcq_answer(question_data["correct_answer"], options) if isinstance(options, list) else None
+        if not isinstance(options, list) or len(options) != 4 or correct_answer is None:
+            self.output_parser.record_failure("schema")
             return self._create_fallback_mcq(request, difficulty, blooms_level)
 
+        question = self.output_parser.validate(
+            Question,
+            id=str(uuid.uuid4()),
+            question_text=question_data["question_text"],
+            question_type=QuestionType.MULTIPLE_CHOICE,
+            difficulty=difficulty,
+            blooms_level=blooms_level,
+            marks=request.marks_per_question.get(QuestionType.MULTIPLE_CHOICE, 2),
+            options=[str(option) for option in options],
+            correct_answer=correct_answer,
+            explanation=question_data.get("explanation", "")
+        )
+        return question or self._create_fallback_mcq(request, difficulty, blooms_level)
+
     async def _generate_subjective(self, request: QuestionGenerationRequest,
-                                 difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy) -> Question:
+                                 difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy,
+                                 focus: Optional[str] = None) -> Question:
         """Generate a subjective question."""
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _chat_prompt([
             ("system", f"""You are an expert educator creating subjective questions.
             Generate a high-quality subjective question that:
             - Tests {blooms_level.value} level of Bloom's taxonomy
@@ -199,112 +408,127 @@ class QuestionGeneratorGraph:
             Topic: {request.topic}
             Syllabus: {request.syllabus_content[:500]}...
             Difficulty: {difficulty.value}
-            Bloom's Level: {blooms_level.value}
+            Bloom's Level: {blooms_level.value}{self._focus_line(focus)}
             """)
         ])
         
-        response = await self.llm.ainvoke(prompt.format_messages())
+        response = await self._ainvoke(prompt.format_messages(), QuestionType.SUBJECTIVE, difficulty, blooms_level)
         
-        try:
-            question_data = json.loads(response.content)
-            question = Question(
-                id=str(uuid.uuid4()),
-                question_text=question_data["question_text"],
-                question_type=QuestionType.SUBJECTIVE,
-                difficulty=difficulty,
-                blooms_level=blooms_level,
-                marks=request.marks_per_question.get(QuestionType.SUBJECTIVE, 10),
-                explanation=question_data.get("explanation", ""),
-                correct_answer=question_data.get("suggested_answer_points", [])
-            )
-            return question
-        except:
+        question_data = self.output_parser.parse(response.content, ("question_text",))
+        if question_data is None:
             return self._create_fallback_subjective(request, difficulty, blooms_level)
 
+        question = self.output_parser.validate(
+            Question,
+            id=str(uuid.uuid4()),
+            question_text=question_data["question_text"],
+            question_type=QuestionType.SUBJECTIVE,
+            difficulty=difficulty,
+            blooms_level=blooms_level,
+            marks=request.marks_per_question.get(QuestionType.SUBJECTIVE, 10),
+            explanation=question_data.get("explanation", ""),
+            correct_answer=question_data.get("suggested_answer_points", [])
+        )
+        return question or self._create_fallback_subjective(request, difficulty, blooms_level)
+
     async def _generate_true_false(self, request: QuestionGenerationRequest,
-                                 difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy) -> Question:
+                                 difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy,
+                                 focus: Optional[str] = None) -> Question:
         """Generate a true/false question."""
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _chat_prompt([
             ("system", f"""Create a true/false question that tests {blooms_level.value} level understanding 
             with {difficulty.value} difficulty. Return JSON with: question_text, correct_answer (true/false), explanation"""),
-            ("human", f"""Topic: {request.topic}, Syllabus: {request.syllabus_content[:300]}""")
+            ("human", f"""Topic: {request.topic}, Syllabus: {request.syllabus_content[:300]}{self._focus_line(focus)}""")
         ])
         
-        response = await self.llm.ainvoke(prompt.format_messages())
+        response = await self._ainvoke(prompt.format_messages(), QuestionType.TRUE_FALSE, difficulty, blooms_level)
         
-        try:
-            question_data = json.loads(response.content)
-            return Question(
-                id=str(uuid.uuid4()),
-                question_text=question_data["question_text"],
-                question_type=QuestionType.TRUE_FALSE,
-                difficulty=difficulty,
-                blooms_level=blooms_level,
-                marks=request.marks_per_question.get(QuestionType.TRUE_FALSE, 1),
-                correct_answer=str(question_data["correct_answer"]).lower(),
-                explanation=question_data.get("explanation", "")
-            )
-        except:
+        question_data = self.output_parser.parse(response.content, ("question_text", "correct_answer"))
+        if question_data is None:
+            return self._create_fallback_true_false(request, difficulty, blooms_level)
+
+        correct_answer = str(question_data["correct_answer"]).strip().lower()
+        if correct_answer not in ("true", "false"):
+            self.output_parser.record_failure("schema")
             return self._create_fallback_true_false(request, difficulty, blooms_level)
 
+        question = self.output_parser.validate(
+            Question,
+            id=str(uuid.uuid4()),
+            question_text=question_data["question_text"],
+            question_type=QuestionType.TRUE_FALSE,
+            difficulty=difficulty,
+            blooms_level=blooms_level,
+            marks=request.marks_per_question.get(QuestionType.TRUE_FALSE, 1),
+            correct_answer=correct_answer,
+            explanation=question_data.get("explanation", "")
+        )
+        return question or self._create_fallback_true_false(request, difficulty, blooms_level)
+
     async def _generate_short_answer(self, request: QuestionGenerationRequest,
-                                   difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy) -> Question:
+                                   difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy,
+                                   focus: Optional[str] = None) -> Question:
         """Generate a short answer question."""
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _chat_prompt([
             ("system", f"""Create a short answer question (2-3 sentences expected) that tests {blooms_level.value} 
             level with {difficulty.value} difficulty. Return JSON with: question_text, key_points, explanation"""),
-            ("human", f"""Topic: {request.topic}, Syllabus: {request.syllabus_content[:300]}""")
+            ("human", f"""Topic: {request.topic}, Syllabus: {request.syllabus_content[:300]}{self._focus_line(focus)}""")
         ])
         
-        response = await self.llm.ainvoke(prompt.format_messages())
+        response = await self._ainvoke(prompt.format_messages(), QuestionType.SHORT_ANSWER, difficulty, blooms_level)
         
-        try:
-            question_data = json.loads(response.content)
-            return Question(
-                id=str(uuid.uuid4()),
-                question_text=question_data["question_text"],
-                question_type=QuestionType.SHORT_ANSWER,
-                difficulty=difficulty,
-                blooms_level=blooms_level,
-                marks=request.marks_per_question.get(QuestionType.SHORT_ANSWER, 5),
-                correct_answer=question_data.get("key_points", []),
-                explanation=question_data.get("explanation", "")
-            )
-        except:
+        question_data = self.output_parser.parse(response.content, ("question_text",))
+        if question_data is None:
             return self._create_fallback_short_answer(request, difficulty, blooms_level)
 
+        question = self.output_parser.validate(
+            Question,
+            id=str(uuid.uuid4()),
+            question_text=question_data["question_text"],
+            question_type=QuestionType.SHORT_ANSWER,
+            difficulty=difficulty,
+            blooms_level=blooms_level,
+            marks=request.marks_per_question.get(QuestionType.SHORT_ANSWER, 5),
+            correct_answer=question_data.get("key_points", []),
+            explanation=question_data.get("explanation", "")
+        )
+        return question or self._create_fallback_short_answer(request, difficulty, blooms_level)
+
     async def _generate_long_answer(self, request: QuestionGenerationRequest,
-                                  difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy) -> Question:
+                                  difficulty: DifficultyLevel, blooms_level: BloomsTaxonomy,
+                                  focus: Optional[str] = None) -> Question:
         """Generate a long answer question."""
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _chat_prompt([
             ("system", f"""Create a comprehensive long answer question that tests {blooms_level.value} 
             level with {difficulty.value} difficulty. Return JSON with: question_text, answer_structure, explanation"""),
-            ("human", f"""Topic: {request.topic}, Syllabus: {request.syllabus_content[:300]}""")
+            ("human", f"""Topic: {request.topic}, Syllabus: {request.syllabus_content[:300]}{self._focus_line(focus)}""")
         ])
         
-        response = await self.llm.ainvoke(prompt.format_messages())
+        response = await self._ainvoke(prompt.format_messages(), QuestionType.LONG_ANSWER, difficulty, blooms_level)
         
-        try:
-            question_data = json.loads(response.content)
-            return Question(
-                id=str(uuid.uuid4()),
-                question_text=question_data["question_text"],
-                question_type=QuestionType.LONG_ANSWER,
-                difficulty=difficulty,
-                blooms_level=blooms_level,
-                marks=request.marks_per_question.get(QuestionType.LONG_ANSWER, 15),
-                correct_answer=question_data.get("answer_structure", []),
-                explanation=question_data.get("explanation", "")
-            )
-        except:
+        question_data = self.output_parser.parse(response.content, ("question_text",))
+        if question_data is None:
             return self._create_fallback_long_answer(request, difficulty, blooms_level)
 
-    async def _validate_question(self, state: QuestionGeneratorState) -> QuestionGeneratorState:
+        question = self.output_parser.validate(
+            Question,
+            id=str(uuid.uuid4()),
+            question_text=question_data["question_text"],
+            question_type=QuestionType.LONG_ANSWER,
+            difficulty=difficulty,
+            blooms_level=blooms_level,
+            marks=request.marks_per_question.get(QuestionType.LONG_ANSWER, 15),
+            correct_answer=question_data.get("answer_structure", []),
+            explanation=question_data.get("explanation", "")
+        )
+        return question or self._create_fallback_long_answer(request, difficulty, blooms_level)
+
+    async def _validate_question(self, state: QuestionTaskState) -> QuestionTaskState:
         """Validate the generated question for quality and requirements."""
-        if not state.generated_questions:
+        if state.candidate is None:
             return state
             
-        current_question = state.generated_questions[-1]
+        current_question = state.candidate
         
         # Basic validation
         validation_score = 0
@@ -337,57 +561,162 @@ class QuestionGeneratorGraph:
         else:
             issues.append("Poor or missing explanation")
         
-        state.validation_results[current_question.id] = {
+        state.validation = {
             "score": validation_score,
             "issues": issues,
             "passed": validation_score >= 75
         }
+        await self._checkpoint(state.paper_id, "validation", {
+            "index": state.spec.index,
+            "validation": state.validation
+        })
         
         return state
 
-    async def _check_similarity(self, state: QuestionGeneratorState) -> QuestionGeneratorState:
+    async def _check_similarity(self, state: QuestionTaskState) -> QuestionTaskState:
         """Check similarity with previous papers and existing questions."""
-        if not state.generated_questions:
+        if state.candidate is None:
             return state
         
-        current_question = state.generated_questions[-1]
-        
-        # Check similarity with previous papers
-        if state.request.previous_papers:
-            similarity_score = await self.similarity_analyzer.calculate_similarity(
-                current_question.question_text,
-                state.request.previous_papers
+        tracker = self._paper_trackers.get(state.paper_id)
+        if tracker is not None:
+            # Previous papers and this paper's accepted questions in one product
+            state.similarity_score, state.duplicate_score = await asyncio.to_thread(
+                tracker.check, state.candidate.question_text
             )
-            state.similarity_scores[current_question.id] = similarity_score
+        elif state.request.previous_papers:
+            state.similarity_score = await self.similarity_analyzer.calculate_similarity(
+                state.candidate.question_text,
+                state.request.previous_papers,
+                state.request.similarity_engine.value
+            )
+        await self._checkpoint(state.paper_id, "similarity", {
+            "index": state.spec.index,
+            "score": state.similarity_score,
+            "duplicate": state.duplicate_score
+        })
         
         return state
 
-    def _should_regenerate(self, state: QuestionGeneratorState) -> str:
+    def _should_regenerate(self, state: QuestionTaskState) -> str:
         """Determine if question should be regenerated based on validation and similarity."""
-        if not state.generated_questions:
-            return "next_question"
-        
-        current_question = state.generated_questions[-1]
+        if state.attempts >= self.max_question_attempts:
+            # Out of attempts: keep the last candidate rather than fail the paper
+            return "accept"
         
-        # Check validation results
-        validation = state.validation_results.get(current_question.id, {})
-        if not validation.get("passed", False):
-            # Remove the failed question and regenerate
-            state.generated_questions.pop()
+        if state.candidate is None or not state.validation.get("passed", False):
             return "regenerate"
         
-        # Check similarity threshold
-        similarity_score = state.similarity_scores.get(current_question.id, 0)
-        if similarity_score > state.request.similarity_threshold:
-            # Remove the similar question and regenerate
-            state.generated_questions.pop()
+        # Check similarity thresholds, against previous papers and this paper
+        if state.similarity_score > state.request.similarity_threshold:
+            return "regenerate"
+        if state.duplicate_score > self._duplicate_threshold(state.request):
             return "regenerate"
         
-        # Check if we need more questions
-        if len(state.generated_questions) < state.request.total_questions:
-            return "next_question"
+        return "accept"
+
+    async def _run_question(self, state: QuestionGeneratorState, index: int) -> QuestionTaskState:
+        """Run the per-question sub-graph for one scheduled index."""
+        if index in state.resumed_tasks:
+            return state.resumed_tasks.pop(index)
+        
+        task = QuestionTaskState(
+            request=state.request,
+            spec=state.question_specs[index],
+            paper_id=state.paper_id
+        )
+        result = await self.question_graph.ainvoke(
+            task,
+            {"recursion_limit": self._question_recursion_limit}
+        )
+        return QuestionTaskState(**result)
+
+    async def _duplicates_accepted(self, state: QuestionGeneratorState, task: QuestionTaskState) -> bool:
+        """Whether a finished candidate is too close to a question accepted after it was checked."""
+        tracker = self._paper_trackers.get(state.paper_id)
+        if tracker is None or task.attempts >= self.max_question_attempts:
+            return False
+        _, duplicate = await asyncio.to_thread(tracker.check, task.candidate.question_text)
+        return duplicate > self._duplicate_threshold(state.request)
+
+    def _solve_equation(self, question: Question, solutions: Dict[str, asyncio.Task]):
+        """Start computing the answer to a question's equation in the background."""
+        if self.solve_equations and question.has_equations and question.equation_latex:
+            solutions[question.id] = asyncio.create_task(self.equation_solver.solve(question.equation_latex))
+
+    async def _fill_equation_answers(self, state: QuestionGeneratorState, solutions: Dict[str, asyncio.Task]):
+        """Add the computed equation answers to the answer key."""
+        if not solutions:
+            return
+        from equation_handler import equation_answer_update
+        
+        answers = dict(zip(solutions, await asyncio.gather(*solutions.values())))
+        for question in state.generated_questions:
+            answer = answers.get(question.id)
+            if not answer:
+                continue
+            for field, value in equation_answer_update(question, answer).items():
+                setattr(question, field, value)
+
+    async def _accept_question(self, state: QuestionGeneratorState, task: QuestionTaskState):
+        """Record a finished sub-graph run on the paper state."""
+        question = task.candidate
+        state.generated_questions.append(question)
+        tracker = self._paper_trackers.get(state.paper_id)
+        if tracker is not None:
+            tracker.add(question.question_text)
+        state.validation_results[question.id] = task.validation
+        if state.request.previous_papers or (tracker is not None and tracker.corpus is not None):
+            state.similarity_scores[question.id] = task.similarity_score
+        await self._checkpoint(state.paper_id, "accepted", {
+            "index": state.current_question_index,
+            "question_id": question.id
+        })
+        state.current_question_index += 1
+
+    async def _generate_questions(self, state: QuestionGeneratorState) -> QuestionGeneratorState:
+        """Drive the sub-graph over every scheduled index, a batch at a time."""
+        total = state.request.total_questions
+        batch_size = max(1, self.generation_batch_size)
+        
+        corpus = await asyncio.to_thread(self.corpus_store.open, state.request.course_code)
+        tracker = await asyncio.to_thread(
+            PaperSimilarityTracker, state.request.previous_papers, state.request.similarity_engine.value, corpus
+        )
+        # Questions restored from a checkpoint count as already accepted
+        for question in state.generated_questions:
+            tracker.add(question.question_text)
+        self._paper_trackers[state.paper_id] = tracker
+        # Equation answers are solved while the remaining questions are generated
+        solutions: Dict[str, asyncio.Task] = {}
+        for question in state.generated_questions:
+            self._solve_equation(question, solutions)
+        
+        try:
+            while state.current_question_index < total:
+                start = state.current_question_index
+                indices = range(start, min(start + batch_size, total))
+                # Let the whole batch settle so finished questions are checkpointed
+                # even when one of them fails
+                tasks = await asyncio.gather(*(
+                    self._run_question(state, index) for index in indices
+                ), return_exceptions=True)
+                # gather preserves order, so questions keep their scheduled positions
+                for index, task in zip(indices, tasks):
+                    if isinstance(task, BaseException):
+                        raise task
+                    if await self._duplicates_accepted(state, task):
+                        # Generated concurrently with a near-identical question of this batch
+                        task = await self._run_question(state, index)
+                    await self._accept_question(state, task)
+                    self._solve_equation(task.candidate, solutions)
+            await self._fill_equation_answers(state, solutions)
+        finally:
+            self._paper_trackers.pop(state.paper_id, None)
+            for solution in solutions.values():
+                solution.cancel()
         
-        return "continue"
+        return state
 
     async def _finalize_paper(self, state: QuestionGeneratorState) -> QuestionGeneratorState:
         """Create the final question paper."""
@@ -405,7 +734,7 @@ class QuestionGeneratorGraph:
         }
         
         question_paper = QuestionPaper(
-            id=str(uuid.uuid4()),
+            id=state.paper_id,
             title=f"{state.request.course_name} - {state.request.subject}",
             header_info=header_info,
             questions=state.generated_questions,
@@ -418,33 +747,12 @@ class QuestionGeneratorGraph:
         return state
 
     # Utility methods
-    def _get_next_question_type(self, request: QuestionGenerationRequest, index: int) -> QuestionType:
-        """Determine the question type for the current index."""
-        # Simple round-robin distribution
-        types = request.question_types
-        return types[index % len(types)]
-
-    def _get_next_difficulty(self, request: QuestionGenerationRequest, index: int) -> DifficultyLevel:
-        """Determine the difficulty for the current index."""
-        # Distribute based on difficulty_distribution
-        difficulties = []
-        for difficulty, count in request.difficulty_distribution.items():
-            difficulties.extend([difficulty] * count)
-        
-        if index < len(difficulties):
-            return difficulties[index]
-        return DifficultyLevel.MEDIUM
-
-    def _get_next_blooms_level(self, request: QuestionGenerationRequest, index: int) -> BloomsTaxonomy:
-        """Determine the Bloom's level for the current index."""
-        # Distribute based on blooms_distribution
-        blooms_levels = []
-        for level, count in request.blooms_distribution.items():
-            blooms_levels.extend([level] * count)
-        
-        if index < len(blooms_levels):
-            return blooms_levels[index]
-        return BloomsTaxonomy.UNDERSTAND
+    def _focus_line(self, focus: Optional[str]) -> str:
+        """Prompt line pointing the question at a planned sub-topic."""
+        if not focus:
+            return ""
+        # Escape braces so the text is not read as a prompt template variable
+        return "\n            Focus: " + focus.replace("{", "{{").replace("}", "}}")
 
     def _should_include_equation(self, question_type: QuestionType, difficulty: DifficultyLevel) -> bool:
         """Determine if equation should be included based on question type and difficulty."""
@@ -518,16 +826,121 @@ class QuestionGeneratorGraph:
 
     # Public API methods
     async def generate_question_paper(self, request: QuestionGenerationRequest) -> QuestionPaper:
-        """Generate a complete question paper using the LangGraph workflow."""
-        initial_state = QuestionGeneratorState(request=request)
+        """Generate a complete question paper: plan, per-question sub-graphs, finalize."""
+        # The full per-index schedule is computed once, up front
+        state = QuestionGeneratorState(
+            request=request,
+            question_specs=build_question_schedule(request)
+        )
+        if self.checkpoints is not None:
+            await asyncio.to_thread(self.checkpoints.start, state.paper_id, request)
         
-        # Run the graph
-        final_state = await self.graph.ainvoke(initial_state)
+        try:
+            state = await self._plan_generation(state)
+        except Exception as e:
+            await self._mark_failed(state.paper_id)
+            raise PaperGenerationError(state.paper_id, str(e)) from e
+        await self._checkpoint(state.paper_id, "plan", {
+            "specs": [spec.model_dump(mode="json") for spec in state.question_specs],
+            "plan": state.validation_results.get("plan")
+        })
+        
+        return await self._complete_paper(state)
+
+    async def resume_question_paper(self, paper_id: str) -> QuestionPaper:
+        """Continue a checkpointed paper, reusing every question already generated."""
+        if self.checkpoints is None:
+            raise KeyError(paper_id)
+        loaded = await asyncio.to_thread(self.checkpoints.load, paper_id)
+        if loaded is None:
+            raise KeyError(paper_id)
+        
+        request, status, events = loaded
+        state = self._restore_state(paper_id, request, events)
+        if status != "complete":
+            await asyncio.to_thread(self.checkpoints.set_status, paper_id, "running")
+        return await self._complete_paper(state)
+
+    async def _complete_paper(self, state: QuestionGeneratorState) -> QuestionPaper:
+        """Generate the remaining questions and finalize, checkpointing the outcome."""
+        try:
+            state = await self._generate_questions(state)
+            final_state = await self._finalize_paper(state)
+        except Exception as e:
+            await self._mark_failed(state.paper_id)
+            raise PaperGenerationError(state.paper_id, str(e)) from e
         
         if final_state.final_paper:
+            if self.checkpoints is not None:
+                await asyncio.to_thread(self.checkpoints.set_status, state.paper_id, "complete")
             return final_state.final_paper
         else:
-            raise Exception("Failed to generate question paper")
+            raise PaperGenerationError(state.paper_id, "Failed to generate question paper")
+
+    async def _mark_failed(self, paper_id: str):
+        if self.checkpoints is not None:
+            await asyncio.to_thread(self.checkpoints.set_status, paper_id, "failed")
+
+    def _restore_state(self, paper_id: str, request: QuestionGenerationRequest,
+                       events: List[Any]) -> QuestionGeneratorState:
+        """Rebuild paper state by replaying its checkpoint events."""
+        state = QuestionGeneratorState(request=request, paper_id=paper_id)
+        candidates: Dict[int, Question] = {}
+        validations: Dict[int, Dict[str, Any]] = {}
+        scores: Dict[int, float] = {}
+        duplicates: Dict[int, float] = {}
+        accepted: List[int] = []
+        
+        for kind, payload in events:
+            if kind == "plan":
+                state.question_specs = [QuestionSpec(**spec) for spec in payload["specs"]]
+                state.validation_results["plan"] = payload.get("plan")
+            elif kind == "candidate":
+                index = payload["index"]
+                candidates[index] = Question(**payload["question"])
+                # A new candidate starts over: earlier checks were for another question
+                validations.pop(index, None)
+                scores.pop(index, None)
+                duplicates.pop(index, None)
+            elif kind == "validation":
+                validations[payload["index"]] = payload["validation"]
+            elif kind == "similarity":
+                scores[payload["index"]] = payload["score"]
+                duplicates[payload["index"]] = payload.get("duplicate", 0.0)
+            elif kind == "accepted":
+                accepted.append(payload["index"])
+        
+        if not state.question_specs:
+            state.question_specs = build_question_schedule(request)
+        
+        for index in accepted:
+            question = candidates[index]
+            state.generated_questions.append(question)
+            state.validation_results[question.id] = validations.get(index, {})
+            if request.previous_papers:
+                state.similarity_scores[question.id] = scores.get(index, 0.0)
+        state.current_question_index = len(accepted)
+        
+        # In-flight candidates that already passed every check need no new LLM call
+        for index, question in candidates.items():
+            if index in accepted or not validations.get(index, {}).get("passed"):
+                continue
+            if index not in scores and request.previous_papers:
+                continue
+            if scores.get(index, 0.0) <= request.similarity_threshold and \
+                    duplicates.get(index, 0.0) <= self._duplicate_threshold(request):
+                state.resumed_tasks[index] = QuestionTaskState(
+                    request=request,
+                    spec=state.question_specs[index],
+                    candidate=question,
+                    attempts=1,
+                    validation=validations[index],
+                    similarity_score=scores.get(index, 0.0),
+                    duplicate_score=duplicates.get(index, 0.0),
+                    paper_id=paper_id
+                )
+        
+        return state
 
     async def generate_alternative_question(self, request: AlternativeQuestionRequest) -> Question:
         """Generate an alternative for a specific question."""
@@ -582,6 +995,7 @@ class QuestionGeneratorGraph:
         
         return alternative
 
-    async def calculate_similarity(self, question: str, previous_papers: List[str]) -> float:
+    async def calculate_similarity(self, question: str, previous_papers: List[str],
+                                   engine: str = "tfidf") -> float:
         """Calculate similarity between a question and previous papers."""
-        return await self.similarity_analyzer.calculate_similarity(question, previous_papers)
+        return await self.similarity_analyzer.calculate_similarity(question, previous_papers, engine)
@@ -0,0 +1,139 @@
+from collections import Counter
+from typing import Dict, List, Sequence, TypeVar
+
+from models import (
+    QuestionGenerationRequest, QuestionSpec, QuestionType, DifficultyLevel, BloomsTaxonomy
+)
+
+K = TypeVar("K")
+
+DIFFICULTY_ORDER = [DifficultyLevel.EASY, DifficultyLevel.MEDIUM, DifficultyLevel.HARD]
+BLOOMS_ORDER = [
+    BloomsTaxonomy.REMEMBER,
+    BloomsTaxonomy.UNDERSTAND,
+    BloomsTaxonomy.APPLY,
+    BloomsTaxonomy.ANALYZE,
+    BloomsTaxonomy.EVALUATE,
+    BloomsTaxonomy.CREATE,
+]
+
+def apportion(weights: Dict[K, int], total: int, order: Sequence[K]) -> Dict[K, int]:
+    """
+    Split ``total`` slots across keys in proportion to ``weights``.
+
+    Counts are kept exactly when they already add up to ``total``; otherwise
+    they are scaled with the largest-remainder method, ties going to the key
+    that comes first in ``order``.
+    """
+    positive = {key: count for key, count in weights.items() if count > 0}
+    weight_sum = sum(positive.values())
+    if weight_sum == 0:
+        return {}
+    if weight_sum == total:
+        return dict(positive)
+
+    quotas = {key: count * total / weight_sum for key, count in positive.items()}
+    counts = {key: int(quota) for key, quota in quotas.items()}
+    rank = {key: i for i, key in enumerate(order)}
+    by_remainder = sorted(positive, key=lambda key: (-(quotas[key] - counts[key]), rank.get(key, len(rank))))
+    for key in by_remainder[:total - sum(counts.values())]:
+        counts[key] += 1
+    return counts
+
+def _expand(counts: Dict[K, int], order: Sequence[K], total: int, default: K) -> List[K]:
+    """Expand counts into a list sorted by ``order``, padded with ``default``."""
+    values = []
+    for key in order:
+        values.extend([key] * counts.get(key, 0))
+    values.extend([default] * (total - len(values)))
+    return sorted(values, key=order.index)
+
+def _blooms_by_difficulty(difficulties: List[DifficultyLevel],
+                          blooms_levels: List[BloomsTaxonomy]) -> List[BloomsTaxonomy]:
+    """
+    Spread Bloom's levels across the difficulty bands in proportion.
+
+    Each band (run of one difficulty) takes its share of every level still
+    unassigned, so an easy band gets as many analyse questions, relatively,
+    as a hard one; the last band takes exactly what is left, so the overall
+    Bloom's counts are unchanged. Levels run from remember to create within
+    each band.
+    """
+    remaining = Counter(blooms_levels)
+    assigned: List[BloomsTaxonomy] = []
+    for difficulty in DIFFICULTY_ORDER:
+        band = difficulties.count(difficulty)
+        if not band:
+            continue
+        # A band's quota of a level never exceeds what is left of it
+        counts = apportion(dict(remaining), band, BLOOMS_ORDER)
+        remaining.subtract(counts)
+        assigned.extend(_expand(counts, BLOOMS_ORDER, band, BloomsTaxonomy.UNDERSTAND))
+    return assigned
+
+def _interleave_types(question_types: List[QuestionType], total: int) -> List[QuestionType]:
+    """
+    Smooth weighted round-robin over the requested types.
+
+    Each type is spread evenly along the schedule, so when the schedule runs
+    from easy to hard every type receives its share of each difficulty.
+    """
+    weights: Dict[QuestionType, int] = {}
+    for question_type in question_types:
+        weights[question_type] = weights.get(question_type, 0) + 1
+    counts = apportion(weights, total, list(weights))
+
+    assigned = {question_type: 0 for question_type in counts}
+    sequence = []
+    for position in range(1, total + 1):
+        # Pick the type furthest behind its target share at this position
+        question_type = max(
+            counts,
+            key=lambda t: (counts[t] * position / total - assigned[t], counts[t])
+        )
+        assigned[question_type] += 1
+        sequence.append(question_type)
+    return sequence
+
+def build_question_schedule(request: QuestionGenerationRequest) -> List[QuestionSpec]:
+    """
+    Assign a question type, difficulty, Bloom's level and CO/PO to every index.
+
+    The schedule satisfies each requested distribution: difficulties run from
+    easy to hard, every difficulty band gets a proportional share of each
+    Bloom's level, question types are interleaved across that progression, and
+    outcomes rotate so each one is covered as evenly as possible.
+    """
+    total = request.total_questions
+
+    difficulty_counts = apportion(request.difficulty_distribution, total, DIFFICULTY_ORDER)
+    blooms_counts = apportion(request.blooms_distribution, total, BLOOMS_ORDER)
+
+    difficulties = _expand(difficulty_counts, DIFFICULTY_ORDER, total, DifficultyLevel.MEDIUM)
+    blooms_levels = _blooms_by_difficulty(
+        difficulties, _expand(blooms_counts, BLOOMS_ORDER, total, BloomsTaxonomy.UNDERSTAND)
+    )
+    question_types = _interleave_types(request.question_types or [QuestionType.SUBJECTIVE], total)
+
+    course_outcomes = request.course_outcomes
+    program_outcomes = request.program_outcomes
+
+    # Rotate outcomes per type, offset by the type's position, so every type
+    # also covers every outcome instead of locking to one in lockstep
+    type_positions = {question_type: i for i, question_type in enumerate(dict.fromkeys(question_types))}
+    occurrences: Dict[QuestionType, int] = {}
+
+    schedule = []
+    for index in range(total):
+        question_type = question_types[index]
+        slot = occurrences.get(question_type, 0) + type_positions[question_type]
+        occurrences[question_type] = occurrences.get(question_type, 0) + 1
+        schedule.append(QuestionSpec(
+            index=index,
+            question_type=question_type,
+            difficulty=difficulties[index],
+            blooms_level=blooms_levels[index],
+            course_outcome=course_outcomes[slot % len(course_outcomes)] if course_outcomes else None,
+            program_outcome=program_outcomes[slot % len(program_outcomes)] if program_outcomes else None,
+        ))
+    return schedule
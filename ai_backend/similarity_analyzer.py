@@ -1,109 +1,712 @@
 import asyncio
+import hashlib
+import itertools
+import os
 import re
-from typing import List, Dict, Tuple
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import PorterStemmer
 
-class SimilarityAnalyzer:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(
+# scikit-learn and NLTK take around a second to import, so they are loaded on
+# first use rather than when the AI backend starts.
+#
+# Shared state is immutable or internally synchronised (the stemmer and its
+# lru_cache); everything fitted to a request is created per call, so
+# similarity checks can run concurrently in threads or worker processes
+# without locks.
+
+STEM_CACHE_SIZE = 65536
+
+@lru_cache(maxsize=1)
+def _porter_stemmer():
+    try:
+        # The Porter stemmer is rule based and needs no downloaded NLTK data
+        from nltk.stem import PorterStemmer
+        return PorterStemmer()
+    except ImportError:
+        return None
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def _stem(token: str) -> str:
+    stemmer = _porter_stemmer()
+    # Fallback if NLTK is not available
+    return stemmer.stem(token) if stemmer else token
+
+def preprocess_text(text: str) -> str:
+    """Preprocess text for similarity analysis."""
+    # Convert to lowercase
+    text = text.lower()
+    
+    # Remove special characters except spaces
+    text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text)
+    
+    # Tokenize on whitespace: only letters, digits and spaces remain, so this
+    # matches word_tokenize without needing the punkt model
+    return ' '.join(_stem(token) for token in text.split())
+
+# Documents below this count are preprocessed inline; a pool round trip costs more
+PARALLEL_PREPROCESS_MIN_DOCUMENTS = 256
+
+_preprocess_pool = None
+_preprocess_pool_lock = threading.Lock()
+
+def _preprocess_chunk(texts: List[str]) -> List[str]:
+    return [preprocess_text(text) for text in texts]
+
+def preprocess_workers() -> int:
+    return int(os.getenv("PREPROCESS_WORKERS", "0")) or os.cpu_count() or 1
+
+def process_pool_context():
+    """
+    The multiprocessing context for the backend's worker pools: forkserver,
+    or spawn where it is unavailable (Windows, macOS builds without it), so
+    workers never inherit the API's threads, locks or event loop.
+    """
+    import multiprocessing
+
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def create_preprocess_pool(workers: int):
+    """A process pool for preprocessing, started with process_pool_context()."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context())
+
+def get_preprocess_pool():
+    """The shared preprocessing pool (PREPROCESS_WORKERS processes), created on first use."""
+    global _preprocess_pool
+    with _preprocess_pool_lock:
+        if _preprocess_pool is None:
+            _preprocess_pool = create_preprocess_pool(preprocess_workers())
+        return _preprocess_pool
+
+def shutdown_preprocess_pool():
+    global _preprocess_pool
+    with _preprocess_pool_lock:
+        pool, _preprocess_pool = _preprocess_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+def _chunks(texts: List[str], workers: int) -> List[List[str]]:
+    # A few chunks per worker keeps them busy when documents vary in length
+    size = max(1, -(-len(texts) // (workers * 4)))
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+def preprocess_documents(texts: List[str], pool: Optional[Any] = None,
+                         workers: Optional[int] = None) -> List[str]:
+    """
+    preprocess_text over many documents, fanned out to a process pool in
+    chunks when there are enough of them. Results keep the input order.
+
+    Blocking: the async API reaches it through asyncio.to_thread (see
+    SimilarityAnalyzer.calculate_similarity), so the wait on the pool happens
+    in a worker thread, never on the event loop.
+    """
+    workers = workers or preprocess_workers()
+    if workers <= 1 or len(texts) < PARALLEL_PREPROCESS_MIN_DOCUMENTS:
+        return _preprocess_chunk(texts)
+    pool = pool or get_preprocess_pool()
+    return [text for chunk in pool.map(_preprocess_chunk, _chunks(texts, workers)) for text in chunk]
+
+def create_vectorizer():
+    """A fresh, unfitted TF-IDF vectorizer for one similarity computation."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(
+        stop_words='english',
+        max_features=1000,
+        ngram_range=(1, 2)
+    )
+
+def word_overlap_similarity(question: str, previous_papers: List[str]) -> float:
+    """Fallback similarity using word overlap."""
+    question_words = set(preprocess_text(question).split())
+    
+    max_overlap = 0.0
+    for paper in previous_papers:
+        paper_words = set(preprocess_text(paper).split())
+        
+        if len(question_words) == 0:
+            continue
+            
+        overlap = len(question_words.intersection(paper_words))
+        overlap_percentage = (overlap / len(question_words)) * 100
+        max_overlap = max(max_overlap, overlap_percentage)
+    
+    return min(max_overlap, 100.0)
+
+class HashingSimilarityEngine:
+    """
+    Similarity via feature hashing: fixed-width sparse vectors, no vocabulary fit.
+
+    Documents are vectorised independently of each other, so previous papers
+    can be vectorised once, stored with save_vectors() and reused, and large
+    corpora are scored in chunks with memory bounded by ``chunk_size`` rather
+    than by the corpus. An optional IDF table learned offline with learn_idf()
+    weights the hashed terms; without it, plain term counts are used.
+    """
+
+    def __init__(self, n_features: Optional[int] = None, idf_path: Optional[str] = None,
+                 chunk_size: int = 512, cache_size: Optional[int] = None):
+        self.n_features = n_features or int(os.getenv("SIMILARITY_HASH_FEATURES", str(2 ** 18)))
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size if cache_size is not None else int(
+            os.getenv("SIMILARITY_VECTOR_CACHE_SIZE", "10000")
+        )
+        idf_path = idf_path if idf_path is not None else os.getenv("SIMILARITY_IDF_PATH")
+        self.idf = load_idf(idf_path, self.n_features) if idf_path else None
+        # Identifies the weighting stored vectors were built with
+        self.idf_digest = hashlib.sha256(np.asarray(self.idf).tobytes()).hexdigest() \
+            if self.idf is not None else "none"
+
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self._hasher = HashingVectorizer(
+            n_features=self.n_features,
             stop_words='english',
-            max_features=1000,
-            ngram_range=(1, 2)
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm=None
         )
-        self.stemmer = PorterStemmer()
-        self._download_nltk_data()
-
-    def _download_nltk_data(self):
-        """Download required NLTK data."""
-        try:
-            import nltk
-            nltk.download('punkt', quiet=True)
-            nltk.download('stopwords', quiet=True)
-        except:
-            pass  # Handle if NLTK is not available
+        # Document vectors keyed by a digest of the text, least recently used first
+        self._cache: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"hits": 0, "misses": 0}
+
+    def transform(self, texts: List[str]):
+        """L2-normalised hashed (and IDF-weighted) vectors for raw texts, as CSR rows."""
+        from sklearn.preprocessing import normalize
+
+        counts = self._hasher.transform(preprocess_documents(texts))
+        if self.idf is not None:
+            counts = counts.multiply(self.idf).tocsr()
+        return normalize(counts, copy=False)
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def document_vectors(self, texts: List[str]):
+        """Vectors for previous papers, reusing cached or preloaded ones."""
+        import scipy.sparse as sp
+
+        keys = [self._key(text) for text in texts]
+        rows: List[Any] = [None] * len(texts)
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                row = self._cache.get(key)
+                if row is not None:
+                    self._cache.move_to_end(key)
+                    rows[i] = row
+            missing = [i for i, row in enumerate(rows) if row is None]
+            self.cache_stats["hits"] += len(texts) - len(missing)
+            self.cache_stats["misses"] += len(missing)
+        if missing:
+            vectors = self.transform([texts[i] for i in missing])
+            for position, i in enumerate(missing):
+                rows[i] = vectors[position]
+            self._remember(((keys[i], rows[i]) for i in missing))
+        return sp.vstack(rows, format="csr")
+
+    def _remember(self, items):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            for key, row in items:
+                self._cache[key] = row
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def top_k(self, question: str, texts: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (positions in ``texts``, cosine scores) of the k best matches, best first.
+
+        Documents are scored ``chunk_size`` at a time and merged into a running
+        top k, so memory is bounded by the chunk, not by ``texts``.
+        """
+        question_vector = self.transform([question])
+        ids = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float64)
+        for start in range(0, len(texts), self.chunk_size):
+            vectors = self.document_vectors(texts[start:start + self.chunk_size])
+            ids = np.concatenate([ids, np.arange(start, start + vectors.shape[0])])
+            scores = np.concatenate([scores, (vectors @ question_vector.T).toarray().ravel()])
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+                ids, scores = ids[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+    def max_similarity(self, question: str, previous_papers: List[str]) -> float:
+        """Similarity percentage between a question and the most similar previous paper."""
+        if not previous_papers:
+            return 0.0
+        _, scores = self.top_k(question, previous_papers, 1)
+        return min(float(scores[0]) * 100, 100.0) if len(scores) else 0.0
+
+    def save_vectors(self, path: str, texts: List[str]):
+        """
+        Vectorise documents and store them (with their digests) in an .npz file.
+
+        Vectors are looked up by the exact text they were built from. The
+        question index compares individual questions, so to reuse stored
+        vectors there, save the question segments of each paper (see
+        save_paper_vectors), not the whole papers.
+        """
+        matrix = self.transform(texts)
+        np.savez_compressed(
+            path,
+            keys=np.array([self._key(text) for text in texts], dtype="S20"),
+            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+            n_features=np.array(self.n_features), idf_digest=np.array(self.idf_digest)
+        )
+
+    def save_paper_vectors(self, path: str, papers: List[str]):
+        """Store vectors for every question of the papers, as the question index looks them up."""
+        self.save_vectors(path, [body for paper in papers for _, body in segment_paper(paper)])
+
+    def load_vectors(self, path: str) -> int:
+        """Preload stored document vectors into the cache. Returns the number loaded."""
+        import scipy.sparse as sp
+
+        with np.load(path) as stored:
+            if int(stored["n_features"]) != self.n_features:
+                raise ValueError(f"{path} was built with {int(stored['n_features'])} features, "
+                                 f"not {self.n_features}")
+            # Vectors weighted with another IDF table (or none) would score wrongly
+            if "idf_digest" not in stored or str(stored["idf_digest"]) != self.idf_digest:
+                raise ValueError(f"{path} was built with a different IDF table; re-save the vectors")
+            keys = [bytes(key) for key in stored["keys"]]
+            matrix = sp.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]),
+                shape=(len(keys), self.n_features)
+            )
+        self._remember((key, matrix[i]) for i, key in enumerate(keys))
+        return len(keys)
+
+def learn_idf(texts: Iterable[str], path: str, n_features: Optional[int] = None, chunk_size: int = 1024):
+    """
+    Learn an IDF table in the hashed feature space from a corpus and save it as .npy.
+
+    Uses scikit-learn's smoothed IDF, idf = ln((1 + n) / (1 + df)) + 1, and
+    streams the corpus in chunks so it can be run offline over years of papers.
+    """
+    engine = HashingSimilarityEngine(n_features=n_features, idf_path="", cache_size=0)
+    document_frequency = np.zeros(engine.n_features, dtype=np.int64)
+    documents = 0
+    chunk: List[str] = []
+    for text in itertools.chain(texts, [None]):
+        if text is not None:
+            chunk.append(text)
+        if chunk and (text is None or len(chunk) >= chunk_size):
+            counts = engine._hasher.transform(preprocess_documents(chunk))
+            counts.sum_duplicates()
+            document_frequency += np.bincount(counts.indices, minlength=engine.n_features)
+            documents += len(chunk)
+            chunk = []
+
+    idf = np.log((1 + documents) / (1 + document_frequency)) + 1
+    np.save(path, idf.astype(np.float32))
+    return idf
+
+def load_idf(path: str, n_features: int):
+    """Load an IDF table saved by learn_idf(), memory mapped."""
+    idf = np.load(path, mmap_mode="r")
+    if idf.shape != (n_features,):
+        raise ValueError(f"IDF table {path} has {idf.shape[0]} features, expected {n_features}")
+    return idf
+
+@lru_cache(maxsize=1)
+def get_hashing_engine() -> HashingSimilarityEngine:
+    """Process-wide hashing engine configured from the environment."""
+    return HashingSimilarityEngine()
+
+class InvertedIndex:
+    """
+    Term -> postings index over L2-normalised document vectors with MaxScore top-k.
+
+    Postings are the CSC form of the document matrix (documents sorted per
+    term) plus each term's largest weight, which bounds how much the term can
+    add to any document's cosine score. Query terms are visited from the
+    highest bound down; once the bounds of the remaining terms cannot lift an
+    unseen document past the current k-th score, only existing candidates are
+    updated (by binary search into the postings) and candidates that can no
+    longer reach the top k are dropped. Common, low-weight terms with long
+    postings therefore cost O(candidates log postings) instead of O(corpus).
+    """
+
+    def __init__(self, indptr: np.ndarray, documents: np.ndarray, weights: np.ndarray,
+                 term_max: np.ndarray):
+        self.indptr = indptr
+        self.documents = documents
+        self.weights = weights
+        self.term_max = term_max
+
+    @staticmethod
+    def postings_arrays(matrix) -> Dict[str, np.ndarray]:
+        """Postings arrays for a CSR document matrix, suitable for np.save."""
+        csc = matrix.tocsc()
+        csc.sort_indices()
+        term_max = np.zeros(csc.shape[1], dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(csc.indptr))
+        if len(nonempty):
+            term_max[nonempty] = np.maximum.reduceat(csc.data, csc.indptr[nonempty])
+        return {
+            "indptr": csc.indptr,
+            "documents": csc.indices,
+            "weights": csc.data.astype(np.float32),
+            "term_max": term_max,
+        }
+
+    @classmethod
+    def from_matrix(cls, matrix) -> "InvertedIndex":
+        arrays = cls.postings_arrays(matrix)
+        return cls(arrays["indptr"], arrays["documents"], arrays["weights"], arrays["term_max"])
+
+    def top_k(self, query, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(document ids, cosine scores) of the k best matches for a 1-row query vector."""
+        terms = query.indices
+        query_weights = query.data.astype(np.float64)
+        bounds = query_weights * self.term_max[terms]
+        keep = bounds > 0
+        terms, query_weights, bounds = terms[keep], query_weights[keep], bounds[keep]
+        order = np.argsort(-bounds, kind="stable")
+        terms, query_weights, bounds = terms[order], query_weights[order], bounds[order]
+        # remaining[i]: the most terms i.. can add to any document
+        remaining = np.append(np.cumsum(bounds[::-1])[::-1], 0.0)
+
+        candidates = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float64)
+        threshold = 0.0
+        for i, (term, weight) in enumerate(zip(terms, query_weights)):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            documents = self.documents[start:end]
+            contributions = self.weights[start:end] * weight
+
+            if len(candidates) < k or remaining[i] > threshold:
+                # Unseen documents can still make the top k: merge the postings
+                merged, inverse = np.unique(np.concatenate([candidates, documents]), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, contributions]),
+                                     minlength=len(merged))
+                candidates = merged
+            else:
+                positions = np.searchsorted(documents, candidates)
+                positions[positions == len(documents)] = 0
+                hit = documents[positions] == candidates
+                scores[hit] += contributions[positions[hit]]
+
+            if len(scores) >= k:
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+                # Drop candidates that cannot reach the k-th score any more
+                alive = scores + remaining[i + 1] >= threshold
+                candidates, scores = candidates[alive], scores[alive]
+
+        best = np.argsort(-scores, kind="stable")[:k]
+        return candidates[best], scores[best]
+
+# "Q1.", "Q.1", "Question 1:" anywhere after whitespace; "1.", "1)", "(1)" at line start
+_QUESTION_MARKER_RE = re.compile(
+    r"(?:^|(?<=\s))Q(?:uestion|UESTION)?\s*\.?\s*(?P<q>\d+)\s*[.):\-]?\s+"
+    r"|^[ \t]*\(?(?P<n>\d+)[.)][ \t]+",
+    re.MULTILINE
+)
+
+def segment_paper(text: str) -> List[Tuple[Optional[str], str]]:
+    """
+    Split a previous paper into (question number, question text) pairs.
+
+    Text before the first numbered question (headers, instructions) is dropped.
+    A paper without recognisable numbering is kept as a single unit.
+    """
+    markers = list(_QUESTION_MARKER_RE.finditer(text))
+    if not markers:
+        return [(None, text.strip())] if text.strip() else []
+
+    segments = []
+    for marker, following in zip(markers, markers[1:] + [None]):
+        body = text[marker.end():following.start() if following else len(text)].strip()
+        if body:
+            segments.append((marker.group("q") or marker.group("n"), body))
+    return segments
+
+class QuestionIndex:
+    """
+    Question-level index over a set of previous papers.
+
+    Each paper is segmented into questions, so a generated question is
+    compared with individual prior questions rather than whole papers. The
+    TF-IDF engine fits and keeps one matrix per paper set; the hashing engine
+    keeps no matrix and scores the questions in chunks through the shared
+    engine (whose vector cache is bounded), so memory does not grow with the
+    corpus. Built indexes are immutable and shared through get_question_index(),
+    keyed by a hash of the paper contents.
+    """
+
+    def __init__(self, previous_papers: List[str], engine: str = "tfidf"):
+        self.engine = engine
+        # (paper index, question number, question text) per indexed question
+        self.entries: List[Tuple[int, Optional[str], str]] = [
+            (paper_index, number, body)
+            for paper_index, paper in enumerate(previous_papers)
+            for number, body in segment_paper(paper)
+        ]
+        self.texts = [body for _, _, body in self.entries]
+        if engine == "hashing":
+            self._vectorizer = None
+            self.matrix = None
+        else:
+            self._vectorizer = create_vectorizer()
+            self.matrix = self._vectorizer.fit_transform(preprocess_documents(self.texts))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def vectorize(self, question: str):
+        """The question as a normalised row in this index's vector space."""
+        if self._vectorizer is None:
+            return get_hashing_engine().transform([question])
+        return self._vectorizer.transform([preprocess_text(question)])
+
+    def search(self, question: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(entry ids, cosine scores) of the k best matches, best first."""
+        if self.matrix is None:
+            return get_hashing_engine().top_k(question, self.texts, k)
+        scores = (self.matrix @ self.vectorize(question).T).toarray().ravel()
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return best, scores[best]
+
+    def max_similarity(self, question: str) -> float:
+        """Similarity percentage to the closest indexed question."""
+        if not self.entries:
+            return 0.0
+        _, scores = self.search(question, 1)
+        return min(float(scores[0]) * 100, 100.0) if len(scores) else 0.0
+
+    def top_k(self, question: str, k: int = 5) -> List[Dict[str, Any]]:
+        """The k most similar prior questions with their similarity percentages."""
+        if not self.entries or k <= 0:
+            return []
+        matches = []
+        for i, score in zip(*self.search(question, k)):
+            paper_index, number, text = self.entries[i]
+            matches.append({
+                "paper_index": paper_index,
+                "question_number": number,
+                "question_text": text,
+                "similarity_percentage": min(float(score) * 100, 100.0),
+            })
+        return matches
+
+_index_cache: "OrderedDict[str, QuestionIndex]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def get_question_index(previous_papers: List[str], engine: str = "tfidf") -> QuestionIndex:
+    """Return the question index for a paper set, building it once per content hash."""
+    digest = hashlib.sha256(engine.encode("utf-8"))
+    for paper in previous_papers:
+        digest.update(hashlib.sha256(paper.encode("utf-8")).digest())
+    key = digest.hexdigest()
+
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    # Built outside the lock; a concurrent duplicate build is harmless
+    index = QuestionIndex(previous_papers, engine)
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > int(os.getenv("QUESTION_INDEX_CACHE_SIZE", "16")):
+            _index_cache.popitem(last=False)
+    return index
+
+class PaperSimilarityTracker:
+    """
+    Scores candidates against previous papers and the paper's accepted questions at once.
+
+    The tracker keeps one CSR matrix of the questions accepted so far,
+    appended incrementally in the fixed-width hashing space. With a TF-IDF
+    index, its previous-paper rows come first and the two spaces are laid side
+    by side (index columns first, hashed columns after), so a single sparse
+    product scores a candidate against both without refitting anything. A
+    hashing index has no matrix to share: it is scored in chunks on its own,
+    like a course corpus, so the tracker never holds the whole corpus.
+    """
+
+    def __init__(self, previous_papers: List[str], engine: str = "tfidf", corpus: Optional[Any] = None):
+        papers = [paper for paper in previous_papers if paper.strip()]
+        self.index = None
+        # Papers TF-IDF cannot index (only stop words) are scored by word overlap, as in compute_similarity
+        self._overlap_papers: List[str] = []
+        if papers:
+            try:
+                self.index = get_question_index(papers, engine)
+            except ValueError:
+                self._overlap_papers = papers
+        # Optional persisted course corpus (corpus_store.CourseCorpus), scored separately
+        # so its memory-mapped rows are never copied into this matrix
+        self.corpus = corpus
+        self._hashing = get_hashing_engine()
+        # Only a TF-IDF index has rows to merge; its columns come first
+        base = self.index.matrix.tocsr() if self.index is not None and self.index.matrix is not None else None
+        self.n_previous = base.shape[0] if base is not None else 0
+        self._offset = base.shape[1] if base is not None else 0
+        self.width = self._offset + self._hashing.n_features
+
+        capacity = max(1024, 2 * base.nnz) if base is not None else 1024
+        self._data = np.zeros(capacity, dtype=np.float64)
+        self._indices = np.zeros(capacity, dtype=np.int32)
+        self._indptr = np.zeros(self.n_previous + 65, dtype=np.int64)
+        self._rows = self.n_previous
+        self._nnz = 0
+        if base is not None:
+            self._nnz = base.nnz
+            self._data[:base.nnz] = base.data
+            self._indices[:base.nnz] = base.indices
+            self._indptr[:self.n_previous + 1] = base.indptr
+        self._lock = threading.Lock()
+
+    @property
+    def accepted(self) -> int:
+        return self._rows - self.n_previous
+
+    def vectorize(self, question: str):
+        """The question in the combined (index + hashing) space."""
+        import scipy.sparse as sp
+
+        hashed = self._hashing.transform([question])
+        if not self._offset:
+            return hashed
+        return sp.hstack([self.index.vectorize(question), hashed], format="csr")
+
+    def check(self, question: str) -> Tuple[float, float]:
+        """Return (previous-paper similarity, duplicate similarity) percentages."""
+        import scipy.sparse as sp
+
+        with self._lock:
+            # Views of the filled part; later appends never write inside it
+            rows, nnz = self._rows, self._nnz
+            matrix = sp.csr_matrix(
+                (self._data[:nnz], self._indices[:nnz], self._indptr[:rows + 1]),
+                shape=(rows, self.width), copy=False
+            )
+        # Previous-paper sources scored on their own: the course corpus and a hashing index
+        separate = self.corpus.max_similarity(question) if self.corpus is not None else 0.0
+        if self._overlap_papers:
+            separate = max(separate, word_overlap_similarity(question, self._overlap_papers))
+        if self.index is not None and self.index.matrix is None:
+            separate = max(separate, self.index.max_similarity(question))
+        if rows == 0:
+            return separate, 0.0
+        scores = (matrix @ self.vectorize(question).T).toarray().ravel()
+        previous = float(scores[:self.n_previous].max()) if self.n_previous else 0.0
+        duplicate = float(scores[self.n_previous:].max()) if rows > self.n_previous else 0.0
+        return max(min(previous * 100, 100.0), separate), min(duplicate * 100, 100.0)
+
+    def add(self, question: str):
+        """Append an accepted question to the matrix."""
+        row = self._hashing.transform([question])
+        with self._lock:
+            end = self._nnz + row.nnz
+            if end > len(self._data):
+                capacity = max(2 * len(self._data), end)
+                # New arrays, so snapshots taken by check() stay valid
+                self._data = np.concatenate([self._data[:self._nnz], np.zeros(capacity - self._nnz)])
+                self._indices = np.concatenate([
+                    self._indices[:self._nnz], np.zeros(capacity - self._nnz, dtype=np.int32)
+                ])
+            if self._rows + 2 > len(self._indptr):
+                self._indptr = np.concatenate([self._indptr, np.zeros(len(self._indptr), dtype=np.int64)])
+            self._data[self._nnz:end] = row.data
+            self._indices[self._nnz:end] = row.indices + self._offset
+            self._rows += 1
+            self._indptr[self._rows] = end
+            self._nnz = end
+
+def compute_similarity(question: str, previous_papers: List[str], engine: str = "tfidf") -> float:
+    """
+    Similarity percentage to the closest question in the previous papers,
+    with the selected engine ("tfidf" or "hashing").
+    """
+    if not previous_papers:
+        return 0.0
+    try:
+        return get_question_index(previous_papers, engine).max_similarity(question)
+    except Exception:
+        # Fallback to simple word overlap, e.g. if every question is stop words
+        return word_overlap_similarity(question, previous_papers)
+
+def find_similar_questions(question: str, previous_papers: List[str], k: int = 5,
+                           engine: str = "tfidf") -> List[Dict[str, Any]]:
+    """Top-k prior questions most similar to ``question``."""
+    if not previous_papers:
+        return []
+    return get_question_index(previous_papers, engine).top_k(question, k)
+
+class SimilarityAnalyzer:
+    def __init__(self, corpus_store: Optional[Any] = None):
+        if corpus_store is None:
+            # Imported here: corpus_store builds on this module
+            from corpus_store import CorpusStore
+            corpus_store = CorpusStore()
+        self.corpus_store = corpus_store
+
+    @property
+    def stemmer(self):
+        return _porter_stemmer()
+
+    def create_vectorizer(self):
+        return create_vectorizer()
+
+    def warm_up(self):
+        """Import the heavy dependencies ahead of the first request."""
+        from sklearn.metrics.pairwise import cosine_similarity  # noqa: F401
+        return create_vectorizer(), self.stemmer
 
     def preprocess_text(self, text: str) -> str:
         """Preprocess text for similarity analysis."""
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove special characters except spaces
-        text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text)
-        
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-        
-        # Tokenize and stem
-        try:
-            tokens = word_tokenize(text)
-            stemmed_tokens = [self.stemmer.stem(token) for token in tokens]
-            return ' '.join(stemmed_tokens)
-        except:
-            # Fallback if NLTK is not available
-            return text
-
-    async def calculate_similarity(self, question: str, previous_papers: List[str]) -> float:
+        return preprocess_text(text)
+
+    async def calculate_similarity(self, question: str, previous_papers: List[str],
+                                   engine: str = "tfidf") -> float:
         """Calculate similarity percentage between a question and previous papers."""
         if not previous_papers:
             return 0.0
-        
-        # Preprocess the question
-        processed_question = self.preprocess_text(question)
-        
-        # Preprocess all previous papers
-        processed_papers = [self.preprocess_text(paper) for paper in previous_papers]
-        
-        # Combine all texts for vectorization
-        all_texts = [processed_question] + processed_papers
-        
-        try:
-            # Create TF-IDF vectors
-            tfidf_matrix = self.vectorizer.fit_transform(all_texts)
-            
-            # Calculate cosine similarity between question and each paper
-            question_vector = tfidf_matrix[0:1]
-            paper_vectors = tfidf_matrix[1:]
-            
-            similarities = cosine_similarity(question_vector, paper_vectors)[0]
-            
-            # Return the maximum similarity as percentage
-            max_similarity = float(np.max(similarities)) * 100
-            return min(max_similarity, 100.0)
-            
-        except Exception as e:
-            # Fallback to simple word overlap if TF-IDF fails
-            return self._calculate_word_overlap_similarity(question, previous_papers)
+        # Vectorising is CPU bound; run it off the event loop
+        return await asyncio.to_thread(compute_similarity, question, previous_papers, engine)
+
+    async def find_similar_questions(self, question: str, previous_papers: List[str], k: int = 5,
+                                     engine: str = "tfidf") -> List[Dict[str, Any]]:
+        """Top-k most similar questions from previous papers, with scores."""
+        return await asyncio.to_thread(find_similar_questions, question, previous_papers, k, engine)
+
+    async def top_k_similar(self, question: str, k: int = 5,
+                            course_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k most similar questions in a course's persisted corpus.
+
+        Uses the corpus' inverted index, so only questions sharing high-weight
+        terms with ``question`` are scored.
+        """
+        corpus = await asyncio.to_thread(self.corpus_store.open, course_code) if course_code else None
+        if corpus is None:
+            return []
+        return await asyncio.to_thread(corpus.top_k, question, k)
 
     def _calculate_word_overlap_similarity(self, question: str, previous_papers: List[str]) -> float:
         """Fallback method using word overlap similarity."""
-        question_words = set(self.preprocess_text(question).split())
-        
-        max_overlap = 0.0
-        for paper in previous_papers:
-            paper_words = set(self.preprocess_text(paper).split())
-            
-            if len(question_words) == 0:
-                continue
-                
-            overlap = len(question_words.intersection(paper_words))
-            overlap_percentage = (overlap / len(question_words)) * 100
-            max_overlap = max(max_overlap, overlap_percentage)
-        
-        return min(max_overlap, 100.0)
+        return word_overlap_similarity(question, previous_papers)
 
     async def analyze_question_uniqueness(self, question: str, existing_questions: List[str]) -> Dict:
         """Analyze how unique a question is compared to existing questions."""
-        similarities = []
-        
-        for existing in existing_questions:
-            similarity = await self.calculate_similarity(question, [existing])
-            similarities.append(similarity)
+        similarities = list(await asyncio.gather(*(
+            self.calculate_similarity(question, [existing]) for existing in existing_questions
+        )))
         
         if not similarities:
             return {
@@ -143,10 +746,7 @@ class SimilarityAnalyzer:
     async def batch_similarity_analysis(self, questions: List[str], 
                                       previous_papers: List[str]) -> Dict[int, float]:
         """Analyze similarity for multiple questions in batch."""
-        results = {}
-        
-        for i, question in enumerate(questions):
-            similarity = await self.calculate_similarity(question, previous_papers)
-            results[i] = similarity
-        
-        return results
+        similarities = await asyncio.gather(*(
+            self.calculate_similarity(question, previous_papers) for question in questions
+        ))
+        return dict(enumerate(similarities))
@@ -69,6 +69,256 @@ def test_similarity_analyzer():
         print(f"❌ Similarity analyzer test failed: {e}")
         return False
 
+def test_concurrent_similarity():
+    """Test that parallel similarity checks give the same results as sequential ones."""
+    try:
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+        from similarity_analyzer import SimilarityAnalyzer, compute_similarity
+
+        papers = [
+            "Explain the working of a stack and its push and pop operations.",
+            "Describe binary search trees and their traversal algorithms.",
+            "What is normalization in relational databases? Explain 3NF.",
+            "Compare TCP and UDP protocols with examples.",
+        ]
+        questions = [
+            "Explain push and pop operations on a stack.",
+            "Describe inorder traversal of a binary search tree.",
+            "What is third normal form in databases?",
+            "Differentiate between TCP and UDP.",
+            "Define an operating system process.",
+        ] * 8
+        # Each question is compared with a different slice of papers, so the
+        # vocabularies fitted by concurrent calls differ
+        jobs = [(question, papers[i % 4:] + papers[:i % 4 + 1]) for i, question in enumerate(questions)]
+        expected = [compute_similarity(question, previous) for question, previous in jobs]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            threaded = list(pool.map(lambda job: compute_similarity(*job), jobs))
+        assert threaded == expected, "thread pool results differ"
+
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            processed = list(pool.map(compute_similarity, *zip(*jobs)))
+        assert processed == expected, "process pool results differ"
+
+        analyzer = SimilarityAnalyzer()
+
+        async def gather_all():
+            return await asyncio.gather(*(
+                analyzer.calculate_similarity(question, previous) for question, previous in jobs
+            ))
+
+        assert list(asyncio.run(gather_all())) == expected, "concurrent async results differ"
+
+        print("✅ Similarity checks are consistent under parallel load")
+        print(f"   {len(jobs)} checks across threads, processes and asyncio")
+        return True
+    except Exception as e:
+        print(f"❌ Concurrent similarity test failed: {e}")
+        return False
+
+def test_hashing_similarity():
+    """Test the feature-hashing similarity engine with stored vectors and an IDF table."""
+    try:
+        import os
+        import tempfile
+        from similarity_analyzer import HashingSimilarityEngine, learn_idf
+
+        papers = [
+            "Explain the working of a stack and its push and pop operations.",
+            "Describe binary search trees and their traversal algorithms.",
+            "What is normalization in relational databases? Explain 3NF.",
+        ] * 300
+        engine = HashingSimilarityEngine(n_features=2 ** 16, idf_path="", chunk_size=128)
+
+        exact = engine.max_similarity(papers[1], papers)
+        unrelated = engine.max_similarity("Define photosynthesis in plants.", papers)
+        assert exact > 99.9 and unrelated == 0.0, (exact, unrelated)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            vectors_path = os.path.join(tmp, "vectors.npz")
+            idf_path = os.path.join(tmp, "idf.npy")
+
+            engine.save_vectors(vectors_path, papers[:3])
+            stored = HashingSimilarityEngine(n_features=2 ** 16, idf_path="")
+            assert stored.load_vectors(vectors_path) == 3
+            question = "Explain push and pop on a stack."
+            assert abs(stored.max_similarity(question, papers[:3]) - engine.max_similarity(question, papers[:3])) < 1e-6
+            # Scored from the loaded vectors, not re-vectorised
+            assert stored.cache_stats == {"hits": 3, "misses": 0}, stored.cache_stats
+
+            learn_idf(papers[:3], idf_path, n_features=2 ** 16)
+            weighted = HashingSimilarityEngine(n_features=2 ** 16, idf_path=idf_path)
+            assert 0 < weighted.max_similarity(question, papers[:3]) <= 100
+            # Unweighted vectors must not load into an IDF-weighted engine
+            try:
+                weighted.load_vectors(vectors_path)
+                assert False, "vectors with a different IDF table were loaded"
+            except ValueError:
+                pass
+
+        print("✅ Hashing similarity engine works with stored vectors and IDF")
+        print(f"   Exact match: {exact:.1f}%, unrelated: {unrelated:.1f}%")
+        return True
+    except Exception as e:
+        print(f"❌ Hashing similarity test failed: {e}")
+        return False
+
+def test_question_index():
+    """Test segmenting previous papers into questions and top-k matching."""
+    try:
+        from similarity_analyzer import segment_paper, get_question_index
+
+        paper = """Semester Examination 2023
+        Answer all questions.
+        Q1. Explain the working of a stack with push and pop operations.
+        Q2. Describe binary search trees and their traversals.
+        Q.3 What is third normal form?
+        """
+        segments = segment_paper(paper)
+        assert [number for number, _ in segments] == ["1", "2", "3"], segments
+        assert segment_paper("1) What is a queue?\n2) Define a heap.")[1] == ("2", "Define a heap.")
+
+        papers = [paper, "1) What is a queue?\n2) Define a heap and its operations."]
+        index = get_question_index(papers)
+        assert len(index) == 5
+        assert get_question_index(list(papers)) is index, "index not cached by content"
+
+        matches = index.top_k("Explain push and pop on a stack", k=2)
+        assert matches[0]["question_number"] == "1" and matches[0]["paper_index"] == 0
+        assert matches[0]["similarity_percentage"] >= matches[1]["similarity_percentage"]
+
+        # The hashing index keeps no matrix; a running top-k over small chunks finds the same match
+        from similarity_analyzer import get_hashing_engine
+        hashing = get_question_index(papers * 40, engine="hashing")
+        assert hashing.matrix is None
+        chunk_size, get_hashing_engine().chunk_size = get_hashing_engine().chunk_size, 7
+        try:
+            hashed = hashing.top_k("Explain push and pop on a stack", k=3)
+        finally:
+            get_hashing_engine().chunk_size = chunk_size
+        assert hashed[0]["question_number"] == "1" and len(hashed) == 3
+
+        print("✅ Previous papers are indexed at question level")
+        print(f"   Best match: Q{matches[0]['question_number']} ({matches[0]['similarity_percentage']:.1f}%)")
+        return True
+    except Exception as e:
+        print(f"❌ Question index test failed: {e}")
+        return False
+
+def test_corpus_store():
+    """Test publishing and memory-mapping a per-course similarity corpus."""
+    try:
+        import os
+        import numpy as np
+        import tempfile
+        from corpus_store import CorpusStore
+
+        store = CorpusStore(tempfile.mkdtemp(), check_interval=60)
+        assert store.open("CS201") is None
+
+        first = store.publish_papers("CS201", [
+            "Q1. Explain the working of a stack with push and pop operations. Q2. Describe binary search trees.",
+            "1) What is a heap?",
+        ])
+        corpus = store.open("CS201")
+        assert len(corpus) == 3 and corpus.version == first
+        # Zero-copy: the CSR arrays are views of the files on disk
+        assert isinstance(corpus.matrix.indptr.base, np.memmap)
+        best = corpus.top_k("Explain push and pop on a stack", k=1)[0]
+        assert best["question_text"].startswith("Explain the working of a stack")
+
+        second = store.add_papers("CS201", ["Q1. Define normalization in databases."])
+        updated = store.open("CS201")
+        assert updated.version == second and len(updated) == 4
+        # Readers holding the previous version keep working after the swap
+        assert corpus.max_similarity("What is a heap?") > 99
+
+        # Back-to-back additions each build on the last, despite the cached open()
+        store.add_papers("CS201", ["Q1. Define a binary heap."])
+        third = store.add_papers("CS201", ["Q1. Explain hashing with chaining."])
+        assert store.stats("CS201") == {"version": third, "questions": 6, "n_features": corpus.n_features}
+
+        # Codes naming the root or its parent are rejected before touching the disk
+        for course in ["", ".", ".."]:
+            try:
+                store.publish_papers(course, ["Q1. What is a stack?"])
+                assert False, f"course code {course!r} accepted"
+            except ValueError:
+                pass
+            assert store.open(course) is None
+        # Nothing to publish, or a publish that fails midway, leaves no version behind
+        listing = sorted(os.listdir(os.path.join(store.root, "CS201")))
+        for questions, n_features in (([], None), (["What is a queue?"], -1)):
+            try:
+                store.publish("CS201", questions, n_features)
+                assert False, "publish should have failed"
+            except ValueError:
+                pass
+        assert sorted(os.listdir(os.path.join(store.root, "CS201"))) == listing
+        assert store.open("CS201").version == third
+
+        print("✅ Course corpus is published atomically and memory mapped")
+        print(f"   Versions: {first} -> {second}")
+        return True
+    except Exception as e:
+        print(f"❌ Corpus store test failed: {e}")
+        return False
+
+def test_inverted_index():
+    """Test that inverted-index top-k retrieval matches a full scan."""
+    try:
+        import numpy as np
+        import tempfile
+        from corpus_store import CorpusStore
+        from similarity_analyzer import SimilarityAnalyzer
+        from benchmarks import synthetic_questions
+
+        questions = synthetic_questions(5000)
+        store = CorpusStore(tempfile.mkdtemp())
+        store.publish("CS201", questions)
+        corpus = store.open("CS201")
+
+        for i in range(0, 5000, 250):
+            probe = questions[i].split(" and ")[0] + " in distributed systems"
+            _, scores = corpus.search(probe, 5)
+            full = np.sort(corpus.scores(probe))[::-1][:len(scores)]
+            assert np.allclose(scores, full, atol=1e-5), (probe, scores, full)
+
+        analyzer = SimilarityAnalyzer(corpus_store=store)
+        matches = asyncio.run(analyzer.top_k_similar(questions[42], k=3, course_code="CS201"))
+        assert matches[0]["question_index"] == 42 and matches[0]["similarity_percentage"] > 99
+
+        print("✅ Inverted-index top-k matches a full corpus scan")
+        return True
+    except Exception as e:
+        print(f"❌ Inverted index test failed: {e}")
+        return False
+
+def test_parallel_preprocessing():
+    """Test that process-pool preprocessing matches inline preprocessing."""
+    try:
+        from similarity_analyzer import (
+            create_preprocess_pool, preprocess_documents, preprocess_text
+        )
+        from benchmarks import synthetic_questions
+
+        questions = synthetic_questions(3000)
+        papers = [" ".join(questions[i:i + 10]) for i in range(0, len(questions), 10)]
+        expected = [preprocess_text(paper) for paper in papers]
+
+        pool = create_preprocess_pool(2)
+        try:
+            assert preprocess_documents(papers, pool=pool, workers=2) == expected
+        finally:
+            pool.shutdown()
+
+        print("✅ Parallel preprocessing keeps results and order")
+        return True
+    except Exception as e:
+        print(f"❌ Parallel preprocessing test failed: {e}")
+        return False
+
 def test_equation_handler():
     """Test the equation handler."""
     try:
@@ -86,6 +336,509 @@ def test_equation_handler():
         print(f"❌ Equation handler test failed: {e}")
         return False
 
+def test_equation_classifier():
+    """Test the keyword classifier that picks an equation type."""
+    try:
+        from equation_handler import EquationHandler, equation_type_classifier
+        
+        texts = [
+            "Sketch the graph of the given function.",
+            "Find the pH of a 0.01 M HCl solution.",
+            "Compute the derivatives and find the mean value.",
+            "Find the mean and standard deviation of the sample.",
+        ]
+        expected = ['linear', 'chemistry', 'calculus', 'statistics']
+        
+        # "ph" inside "graph" no longer counts as chemistry
+        assert equation_type_classifier.scores(texts[0]) == {}
+        assert [equation_type_classifier.classify(text) for text in texts] == expected
+        assert EquationHandler().determine_equation_types(texts) == expected
+        
+        print("✅ Equation type classifier works correctly")
+        print(f"   {expected}")
+        return True
+    except Exception as e:
+        print(f"❌ Equation type classifier test failed: {e}")
+        return False
+
+def test_paper_variants():
+    """Test per-student variants built from parameterized equation templates."""
+    try:
+        import re
+        from equation_handler import EquationHandler, EQUATION_TEMPLATES, equation_latex, _latex_formatter
+        from models import Question, QuestionType, DifficultyLevel, BloomsTaxonomy
+        
+        # Templates lay out coefficients exactly as sympy does for the pooled equations
+        quadratic = EQUATION_TEMPLATES[('quadratic', 'medium')]
+        for a, b, c in [(1, -2, -2), (2, 1, 0), (3, 0, -1), (1, 0, 0)]:
+            latex = _latex_formatter.format(quadratic.latex, a=a, b=b, c=c)
+            assert latex == equation_latex('quadratic', a, b, c), latex
+        
+        def question(i, text, **kwargs):
+            return Question(
+                id=f"q{i}", question_text=text, question_type=QuestionType.SHORT_ANSWER,
+                difficulty=DifficultyLevel.EASY, blooms_level=BloomsTaxonomy.APPLY, marks=5, **kwargs
+            )
+        
+        paper = [
+            question(1, "Solve $3 x + 6 = 0$ for x.", has_equations=True,
+                     equation_latex="3 x + 6 = 0", equation_type="linear"),
+            question(2, "Explain Newton's first law."),
+        ]
+        variants = EquationHandler().instantiate_variants(paper, 200, seed=1)
+        
+        assert len(variants) == 200 and all(len(variant) == 2 for variant in variants)
+        texts = set()
+        for variant in variants:
+            solved, unchanged = variant
+            assert unchanged is paper[1]
+            a, b = re.search(r"\$(\d*) ?x \+ (\d+) = 0\$", solved.question_text).groups()
+            a, b = int(a or 1), int(b)
+            assert 1 <= a <= 5 and 1 <= b <= 10
+            assert abs(float(solved.correct_answer.split("=")[1]) + b / a) < 1e-3
+            texts.add(solved.question_text)
+        assert len(texts) > 10
+        
+        # An MCQ keeps its option index; a list answer keeps its key points
+        mcq = question(3, "Solve $3 x + 6 = 0$ for x.", has_equations=True, equation_latex="3 x + 6 = 0",
+                       equation_type="linear", options=["x = 1", "x = 2", "x = 3", "x = 4"],
+                       correct_answer="1", explanation="Isolate x.\nEquation: x = -2")
+        mcq.question_type = QuestionType.MULTIPLE_CHOICE
+        listed = question(4, "Solve $3 x + 6 = 0$ for x.", has_equations=True, equation_latex="3 x + 6 = 0",
+                          equation_type="linear", correct_answer=["Equation: x = -2", "Isolate x"])
+        for mcq_variant, listed_variant in EquationHandler().instantiate_variants([mcq, listed], 20, seed=2):
+            assert mcq_variant.correct_answer == "1" and 0 <= int(mcq_variant.correct_answer) < len(mcq.options)
+            assert mcq_variant.explanation.startswith("Isolate x.\nEquation: x = ")
+            assert mcq_variant.explanation.count("Equation:") == 1
+            assert listed_variant.correct_answer[0].startswith("Equation: x = ")
+            assert listed_variant.correct_answer[1:] == ["Isolate x"]
+        
+        # The same seed reproduces the same set of papers
+        again = EquationHandler().instantiate_variants(paper, 200, seed=1)
+        assert [v[0].question_text for v in again] == [v[0].question_text for v in variants]
+        
+        print("✅ Paper variants work correctly")
+        print(f"   {len(texts)} distinct versions of the equation question in 200 variants")
+        return True
+    except Exception as e:
+        print(f"❌ Paper variants test failed: {e}")
+        return False
+
+def test_equation_pool():
+    """Test the pre-rendered equation pool."""
+    try:
+        import os
+        import tempfile
+        from equation_handler import EquationPool
+        
+        calls = []
+        def generate(equation_type, difficulty):
+            calls.append((equation_type, difficulty))
+            return f"{equation_type}-{difficulty}-{len(calls)}"
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = os.path.join(tmp, "pool.json")
+            pool = EquationPool(generate, size=4, cache_path=cache)
+            pool.fill_all()
+            rendered = len(calls)
+            
+            # Draws come from the pool in order and are never handed out twice
+            drawn = [pool.draw("linear", "easy") for _ in range(2)]
+            assert drawn == ["linear-easy-1", "linear-easy-2"]
+            
+            # Unused entries survive a restart, and the cache file is claimed once
+            pool._refilling.add(("linear", "easy"))
+            pool.save()
+            reloaded = EquationPool(generate, size=4, cache_path=cache)
+            assert reloaded.load() == rendered - 2
+            assert reloaded.draw("linear", "easy") == "linear-easy-3"
+            assert EquationPool(generate, size=4, cache_path=cache).load() == 0
+            
+            # An empty pool renders inline instead of failing
+            empty = EquationPool(generate, size=0, cache_path="")
+            assert empty.draw("quadratic", "hard").startswith("quadratic-hard-")
+        
+        print("✅ Equation pool works correctly")
+        print(f"   {rendered} equations pre-rendered, cache round-trip ok")
+        return True
+    except Exception as e:
+        print(f"❌ Equation pool test failed: {e}")
+        return False
+
+def test_output_parser():
+    """Test tolerant parsing of LLM JSON responses and its repair counters."""
+    try:
+        from output_parser import LLMOutputParser, OutputParseError
+        
+        parser = LLMOutputParser()
+        fenced = parser.parse_json('Here you go:\n```json\n{"question_text": "What is a stack?"}\n```')
+        assert fenced == {"question_text": "What is a stack?"}
+        assert parser.parse_json('{"options": ["a", "b",], "marks": 2,}') == {"options": ["a", "b"], "marks": 2}
+        # Truncated mid-array and mid-string
+        truncated = parser.parse_json('{"question_text": "Define a heap", "options": ["min", "max", "bin')
+        assert truncated == {"question_text": "Define a heap", "options": ["min", "max", "bin"]}
+        # Cut off inside a key, or after a key with no value: the dangling key is dropped
+        assert parser.parse_json('{"questions": [{"question_te') == {"questions": [{}]}
+        assert parser.parse_json('{"question_text": "Q1", "explanation":') == {"question_text": "Q1"}
+        
+        assert parser.parse("") is None and parser.parse("no json here") is None
+        assert parser.parse('{"question_text": "Q1"}', required_fields=["options"]) is None
+        try:
+            parser.parse_json('{"a": tru')
+            assert False, "invalid JSON accepted"
+        except OutputParseError as e:
+            assert e.kind == "invalid_json"
+        
+        stats = parser.get_stats()
+        assert stats["repairs"] == {"code_fence": 1, "trailing_comma": 1, "truncated": 3}, stats
+        assert stats["failures"] == {"empty": 1, "no_json": 1, "missing_fields": 1}, stats
+        
+        print("✅ Output parser repairs fenced, trailing-comma and truncated JSON")
+        return True
+    except Exception as e:
+        print(f"❌ Output parser test failed: {e}")
+        return False
+
+def test_model_router():
+    """Test the model routing table."""
+    try:
+        from model_router import ModelRouter
+        from models import QuestionType, DifficultyLevel, BloomsTaxonomy
+        
+        router = ModelRouter()
+        tf_route = router.route(QuestionType.TRUE_FALSE, DifficultyLevel.EASY, BloomsTaxonomy.REMEMBER)
+        long_route = router.route(QuestionType.LONG_ANSWER, DifficultyLevel.HARD, BloomsTaxonomy.CREATE)
+        
+        assert tf_route.max_tokens < long_route.max_tokens
+        
+        print("✅ Model router works correctly")
+        print(f"   true/false -> {tf_route.name}, long answer/create -> {long_route.name}")
+        return True
+    except Exception as e:
+        print(f"❌ Model router test failed: {e}")
+        return False
+
+def test_question_schedule():
+    """Test the per-index question schedule."""
+    try:
+        from collections import Counter
+        from models import QuestionGenerationRequest, DifficultyLevel
+        from question_schedule import build_question_schedule
+        
+        request = QuestionGenerationRequest(
+            subject="Computer Science",
+            topic="Data Structures",
+            syllabus_content="Arrays, Linked Lists, Stacks, Queues",
+            total_questions=10,
+            question_types=["multiple_choice", "short_answer", "long_answer"],
+            difficulty_distribution={"easy": 3, "medium": 4, "hard": 3},
+            blooms_distribution={"remember": 2, "understand": 3, "apply": 3, "analyze": 2},
+            course_outcomes=["CO1", "CO2"],
+            university_name="Test University",
+            department="Computer Science",
+            course_name="Data Structures",
+            course_code="CS201",
+            exam_duration="3 Hours",
+            max_marks=100
+        )
+        schedule = build_question_schedule(request)
+        
+        difficulties = Counter(spec.difficulty for spec in schedule)
+        assert len(schedule) == 10
+        assert difficulties[DifficultyLevel.MEDIUM] == 4
+        assert len({spec.question_type for spec in schedule}) == 3
+        blooms = Counter(spec.blooms_level for spec in schedule)
+        assert blooms == Counter({"remember": 2, "understand": 3, "apply": 3, "analyze": 2})
+        
+        # Bloom's levels are shared out within each difficulty, not paired off in order
+        request.total_questions = 12
+        request.difficulty_distribution = {"easy": 6, "hard": 6}
+        request.blooms_distribution = {"remember": 6, "create": 6}
+        pairs = Counter((spec.difficulty, spec.blooms_level) for spec in build_question_schedule(request))
+        assert set(pairs.values()) == {3} and len(pairs) == 4
+        
+        print("✅ Question schedule satisfies the distributions")
+        return True
+    except Exception as e:
+        print(f"❌ Question schedule test failed: {e}")
+        return False
+
+class FakeChatResponse:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 50, "output_tokens": 50}
+
+class FakeLLM:
+    """Offline stand-in for the chat backend returning well-formed question JSON."""
+    
+    def __init__(self, fail_after: int = None):
+        self.calls = 0
+        self.fail_after = fail_after
+    
+    async def ainvoke(self, messages, **kwargs):
+        import json
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise RuntimeError("Simulated provider outage")
+        self.calls += 1
+        system_prompt = messages[0].content if messages else ""
+        is_true_false = "true/false" in system_prompt
+        return FakeChatResponse(json.dumps({
+            "question_text": self.question_text(),
+            "options": ["Stack", "Queue", "Tree", "Graph"],
+            "correct_answer": "true" if is_true_false else 0,
+            "explanation": "A detailed explanation of the expected answer.",
+            "key_points": ["point one", "point two"],
+            "answer_structure": ["introduction", "analysis", "conclusion"]
+        }))
+
+    def question_text(self):
+        # Distinct terms per call keep fake questions below the duplicate threshold
+        n = self.calls
+        return f"Explain how structure{n} differs from structure{n}x in practice?"
+
+class RepeatingLLM(FakeLLM):
+    """Returns the same question for the first two calls."""
+    
+    def question_text(self):
+        if self.calls <= 2:
+            return "Explain how a stack differs from a queue in practice?"
+        return super().question_text()
+
+def _temporary_checkpoint_store():
+    import os
+    import tempfile
+    from paper_checkpoint import PaperCheckpointStore
+    return PaperCheckpointStore(os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite3"))
+
+def test_max_paper_generation():
+    """Stress test: generate the largest allowed paper with a fake LLM."""
+    try:
+        from models import QuestionGenerationRequest
+        from question_generator import QuestionGeneratorGraph
+        
+        request = QuestionGenerationRequest(
+            subject="Computer Science",
+            topic="Data Structures",
+            syllabus_content="Arrays, Linked Lists, Stacks, Queues, Trees, Graphs",
+            total_questions=50,
+            question_types=["multiple_choice", "true_false", "short_answer", "long_answer", "subjective"],
+            difficulty_distribution={"easy": 15, "medium": 20, "hard": 15},
+            blooms_distribution={"remember": 10, "understand": 10, "apply": 10, "analyze": 10, "create": 10},
+            university_name="Test University",
+            department="Computer Science",
+            course_name="Data Structures",
+            course_code="CS201",
+            exam_duration="3 Hours",
+            max_marks=200
+        )
+        
+        fake_llm = FakeLLM()
+        generator = QuestionGeneratorGraph(llm=fake_llm, checkpoint_store=_temporary_checkpoint_store())
+        paper = asyncio.run(generator.generate_question_paper(request))
+        
+        assert len(paper.questions) == 50
+        assert fake_llm.calls == 50
+        
+        print("✅ Generated a 50-question paper within the recursion limit")
+        print(f"   LLM calls: {fake_llm.calls}, total marks: {paper.total_marks}")
+        return True
+    except Exception as e:
+        print(f"❌ Max paper generation test failed: {e}")
+        return False
+
+class EquationLLM(FakeLLM):
+    """Asks for linear equations, so every question gets a solvable one."""
+    
+    def question_text(self):
+        return f"Solve the linear model for case {self.calls}."
+
+def test_equation_answers():
+    """Test that equation answers are computed in the solver pool and filled in."""
+    try:
+        from equation_solver import EquationSolver
+        from models import QuestionGenerationRequest
+        from question_generator import QuestionGeneratorGraph
+        
+        async def solve_all():
+            solver = EquationSolver(workers=1, timeout=10)
+            try:
+                answers = await asyncio.gather(
+                    solver.solve("3 x + 6 = 0"),
+                    solver.solve(r"\frac{d}{dx}(x^{2} + 3 x + 1)"),
+                    solver.solve(r"\int x e^{x} dx"),
+                    solver.solve(r"F = ma"),
+                )
+                # A solve that overruns its timeout kills the worker; the next one still works
+                solver.timeout = 0.001
+                timed_out = await solver.solve(r"\int x^{7} \sin{\left(x^{3} \right)} dx")
+                solver.timeout = 10
+                recovered = await solver.solve("2 x = 5")
+                cached = await solver.solve("3x+6=0")
+                return answers, timed_out, recovered, cached, solver.stats
+            finally:
+                solver.shutdown()
+        
+        answers, timed_out, recovered, cached, stats = asyncio.run(solve_all())
+        assert answers == ["x = -2", "d/dx = 2*x + 3", "(x - 1)*exp(x) + C", None]
+        assert timed_out is None and stats["timeouts"] == 1
+        assert recovered == "x = 5/2"
+        assert cached == "x = -2" and stats["cache_hits"] == 1
+        
+        # A pool that cannot be started gives no answer instead of raising
+        broken = EquationSolver(workers=-1)
+        assert asyncio.run(broken.solve("3 x + 6 = 0")) is None and broken.stats["failed"] == 1
+        
+        request = QuestionGenerationRequest(
+            subject="Mathematics",
+            topic="Algebra",
+            syllabus_content="Linear equations",
+            total_questions=3,
+            question_types=["short_answer"],
+            difficulty_distribution={"medium": 3},
+            blooms_distribution={"apply": 3},
+            include_equations=True,
+            university_name="Test University",
+            department="Mathematics",
+            course_name="Algebra",
+            course_code="MA101",
+            exam_duration="1 Hour",
+            max_marks=15
+        )
+        generator = QuestionGeneratorGraph(llm=EquationLLM(), checkpoint_store=_temporary_checkpoint_store())
+        generator.solve_equations = True
+        generator.equation_handler.pool.cache_path = ""
+        
+        async def generate():
+            try:
+                return await generator.generate_question_paper(request)
+            finally:
+                await generator.aclose()
+        
+        paper = asyncio.run(generate())
+        for question in paper.questions:
+            assert question.has_equations and question.equation_type == "linear"
+            assert question.correct_answer[0].startswith("Equation: x = "), question.correct_answer
+        
+        print("✅ Equation answers are computed and added to the answer key")
+        print(f"   {paper.questions[0].equation_latex} -> {paper.questions[0].correct_answer[0]}")
+        return True
+    except Exception as e:
+        print(f"❌ Equation answer test failed: {e}")
+        return False
+
+def test_duplicate_detection():
+    """Test that a paper does not accept two near-identical questions."""
+    try:
+        from models import QuestionGenerationRequest
+        from question_generator import QuestionGeneratorGraph
+        
+        request = QuestionGenerationRequest(
+            subject="Computer Science",
+            topic="Data Structures",
+            syllabus_content="Arrays, Linked Lists, Stacks, Queues",
+            total_questions=6,
+            question_types=["short_answer"],
+            difficulty_distribution={"easy": 3, "medium": 3},
+            blooms_distribution={"remember": 3, "understand": 3},
+            previous_papers=["Q1. Define an array. Q2. What is a linked list?"],
+            university_name="Test University",
+            department="Computer Science",
+            course_name="Data Structures",
+            course_code="CS201",
+            exam_duration="1 Hour",
+            max_marks=30
+        )
+        
+        llm = RepeatingLLM()
+        generator = QuestionGeneratorGraph(llm=llm, checkpoint_store=_temporary_checkpoint_store())
+        paper = asyncio.run(generator.generate_question_paper(request))
+        
+        texts = [question.question_text for question in paper.questions]
+        assert len(texts) == 6 and len(set(texts)) == 6, texts
+        # The repeated question in the first batch is regenerated once
+        assert llm.calls == 7, llm.calls
+        
+        # Duplicates have their own threshold, separate from similarity_threshold
+        request.duplicate_threshold = 100
+        llm = RepeatingLLM()
+        generator = QuestionGeneratorGraph(llm=llm, checkpoint_store=_temporary_checkpoint_store())
+        asyncio.run(generator.generate_question_paper(request))
+        assert llm.calls == 6, llm.calls
+        
+        # Blank or stop-word-only previous papers leave nothing for TF-IDF; the paper still generates
+        for previous_papers in ([""], ["Q1. The and of."]):
+            request.previous_papers = previous_papers
+            generator = QuestionGeneratorGraph(llm=RepeatingLLM(), checkpoint_store=_temporary_checkpoint_store())
+            assert len(asyncio.run(generator.generate_question_paper(request)).questions) == 6
+        
+        print("✅ Near-identical questions within a paper are regenerated")
+        print(f"   LLM calls: {llm.calls} for {len(texts)} questions")
+        return True
+    except Exception as e:
+        print(f"❌ Duplicate detection test failed: {e}")
+        return False
+
+def test_resume_generation():
+    """Test resuming a paper from its checkpoint after a provider outage."""
+    try:
+        from models import QuestionGenerationRequest
+        from question_generator import QuestionGeneratorGraph, PaperGenerationError
+        
+        request = QuestionGenerationRequest(
+            subject="Computer Science",
+            topic="Data Structures",
+            syllabus_content="Arrays, Linked Lists, Stacks, Queues",
+            total_questions=10,
+            question_types=["multiple_choice", "short_answer"],
+            difficulty_distribution={"easy": 5, "hard": 5},
+            blooms_distribution={"remember": 5, "apply": 5},
+            university_name="Test University",
+            department="Computer Science",
+            course_name="Data Structures",
+            course_code="CS201",
+            exam_duration="3 Hours",
+            max_marks=100
+        )
+        store = _temporary_checkpoint_store()
+        
+        failing_llm = FakeLLM(fail_after=6)
+        generator = QuestionGeneratorGraph(llm=failing_llm, checkpoint_store=store)
+        try:
+            asyncio.run(generator.generate_question_paper(request))
+            raise AssertionError("Expected the simulated outage to fail the paper")
+        except PaperGenerationError as e:
+            paper_id = e.paper_id
+        
+        resumed_llm = FakeLLM()
+        # Continue the numbering so new questions differ from the checkpointed ones
+        resumed_llm.calls = failing_llm.calls
+        generator = QuestionGeneratorGraph(llm=resumed_llm, checkpoint_store=store)
+        paper = asyncio.run(generator.resume_question_paper(paper_id))
+        
+        assert paper.id == paper_id
+        assert len(paper.questions) == 10
+        assert resumed_llm.calls == 10
+        
+        # A candidate replaced after a duplicate check does not inherit that check's score
+        question = paper.questions[0].model_dump(mode="json")
+        passed = {"score": 100, "issues": [], "passed": True}
+        events = [
+            ("candidate", {"index": 0, "question": question}),
+            ("validation", {"index": 0, "validation": passed}),
+            ("similarity", {"index": 0, "score": 0.0, "duplicate": 99.0}),
+            ("candidate", {"index": 0, "question": dict(question, question_text="A different question")}),
+            ("validation", {"index": 0, "validation": passed}),
+        ]
+        restored = generator._restore_state("restored-paper", request, events)
+        assert restored.resumed_tasks[0].duplicate_score == 0.0
+        
+        print("✅ Resumed paper from checkpoint")
+        print(f"   Reused {failing_llm.calls} questions, generated {resumed_llm.calls - failing_llm.calls} more")
+        return True
+    except Exception as e:
+        print(f"❌ Resume generation test failed: {e}")
+        return False
+
 async def test_question_generator():
     """Test the question generator (basic initialization)."""
     try:
@@ -141,6 +894,236 @@ def test_pdf_exporter():
         print(f"❌ PDF exporter test failed: {e}")
         return False
 
+def _sample_mcq_paper(questions: int = 8):
+    from models import QuestionPaper, Question, QuestionType, DifficultyLevel, BloomsTaxonomy
+    return QuestionPaper(
+        id="sets-paper",
+        title="Sets Paper",
+        header_info={"university_name": "Test University", "department": "Computer Science"},
+        questions=[
+            Question(
+                id=f"q{i}", question_text=f"Which structure is number {i}?",
+                question_type=QuestionType.MULTIPLE_CHOICE, difficulty=DifficultyLevel.EASY,
+                blooms_level=BloomsTaxonomy.REMEMBER, marks=1,
+                options=[f"option {i}-{j}" for j in range(4)], correct_answer=str(i % 4)
+            )
+            for i in range(questions)
+        ],
+        total_marks=questions,
+        generated_at="2026-01-01T00:00:00"
+    )
+
+def test_exam_sets():
+    """Test shuffled multi-set export with remapped answer keys."""
+    try:
+        import io
+        import json
+        import os
+        import zipfile
+        from pdf_exporter import PDFExporter, shuffle_question_paper, shutdown_export_pool
+        
+        paper = _sample_mcq_paper()
+        original = {q.id: q.options[int(q.correct_answer)] for q in paper.questions}
+        
+        set_a = shuffle_question_paper(paper, 11, "A")
+        set_b = shuffle_question_paper(paper, 12, "B")
+        assert [q.id for q in set_a.questions] != [q.id for q in set_b.questions]
+        assert [q.id for q in shuffle_question_paper(paper, 11, "A").questions] == [q.id for q in set_a.questions]
+        # Options move, but the remapped answer still points at the same option text
+        for question in set_a.questions + set_b.questions:
+            assert question.options[int(question.correct_answer)] == original[question.id]
+        
+        async def export():
+            chunks = []
+            async for chunk in await PDFExporter().export_sets(paper, [11, 12, 13], include_answers=True):
+                chunks.append(chunk)
+            return chunks
+        
+        try:
+            chunks = asyncio.run(export())
+        finally:
+            shutdown_export_pool()
+        
+        # A pool that cannot start fails the call itself, before anything is streamed
+        workers = os.environ.get("EXPORT_WORKERS")
+        os.environ["EXPORT_WORKERS"] = "-1"
+        try:
+            asyncio.run(PDFExporter().export_sets(paper, [11]))
+            assert False, "export_sets should fail without a pool"
+        except ValueError:
+            pass
+        finally:
+            if workers is None:
+                del os.environ["EXPORT_WORKERS"]
+            else:
+                os.environ["EXPORT_WORKERS"] = workers
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+        assert archive.namelist() == ["set_A.pdf", "set_B.pdf", "set_C.pdf", "manifest.json"]
+        assert all(archive.read(f"set_{label}.pdf").startswith(b"%PDF") for label in "ABC")
+        manifest = json.loads(archive.read("manifest.json"))
+        assert manifest["sets"][0]["question_ids"] == [q.id for q in set_a.questions]
+        assert len(chunks) > 1
+        
+        print("✅ Exam sets export with shuffled questions and remapped answers")
+        print(f"   {len(archive.namelist()) - 1} sets streamed in {len(chunks)} chunks")
+        return True
+    except Exception as e:
+        print(f"❌ Exam sets test failed: {e}")
+        return False
+
+def test_paper_layout():
+    """Test the cached layout and its PDF, HTML and DOCX renderers."""
+    try:
+        import importlib.util
+        from paper_layout import DocxRenderer, HTMLRenderer, MissingDependencyError, get_layout
+        from pdf_exporter import PDFExporter
+        
+        paper = _sample_mcq_paper(questions=3)
+        paper.questions[0].question_text = "Is a < b & c?"
+        layout = get_layout(paper, include_answers=True)
+        assert get_layout(paper, include_answers=True) is layout
+        assert get_layout(paper, include_answers=False) is not layout
+        assert len(layout.questions) == 3 and len(layout.answer_key) == 3
+        
+        html = HTMLRenderer().render(layout).decode("utf-8")
+        assert "Is a &lt; b &amp; c?" in html
+        assert '<li class="correct">B) option 1-1 &larr; CORRECT</li>' in html
+        assert PDFExporter().render(layout).startswith(b"%PDF")
+        try:
+            assert DocxRenderer().render(layout).startswith(b"PK")
+        except MissingDependencyError:
+            assert not importlib.util.find_spec("docx")
+        
+        print("✅ Paper layout working correctly")
+        return True
+    except Exception as e:
+        print(f"❌ Paper layout test failed: {e}")
+        return False
+
+def test_question_flowable_cache():
+    """Test that re-exporting a paper only rebuilds the questions that changed."""
+    try:
+        from paper_layout import build_layout
+        from pdf_exporter import PDFExporter
+        
+        paper = _sample_mcq_paper(questions=6)
+        paper.questions[2].question_text = "A long question that spills over several lines. " * 200
+        exporter = PDFExporter()
+        first = exporter.render(build_layout(paper, include_answers=True))
+        assert exporter.question_cache_stats == {"hits": 0, "misses": 6}
+        
+        # Same paper again: identical output from reused (and once split) flowables
+        again = exporter.render(build_layout(paper, include_answers=True))
+        assert exporter.question_cache_stats == {"hits": 6, "misses": 6}
+        assert again.count(b"/Type /Page\n") == first.count(b"/Type /Page\n") > 1
+        
+        paper.questions[4].question_text = "Which structure replaced number 4?"
+        exporter.render(build_layout(paper, include_answers=True))
+        assert exporter.question_cache_stats == {"hits": 11, "misses": 7}
+        
+        print("✅ Question flowable cache working correctly")
+        return True
+    except Exception as e:
+        print(f"❌ Question flowable cache test failed: {e}")
+        return False
+
+def test_page_preview():
+    """Test first-page-only layout and the PNG page preview."""
+    try:
+        import importlib.util
+        from paper_layout import build_layout
+        from pdf_exporter import PDFExporter
+        
+        paper = _sample_mcq_paper(questions=60)
+        layout = build_layout(paper, include_answers=True)
+        exporter = PDFExporter()
+        full_pages = exporter.render(layout).count(b"/Type /Page\n")
+        # Layout stops on the page after the preview, which stays empty
+        assert full_pages > 3
+        assert exporter.render(layout, max_pages=1).count(b"/Type /Page\n") <= 2
+        
+        if importlib.util.find_spec("pypdfium2"):
+            png = exporter.render_preview(layout)
+            assert png.startswith(b"\x89PNG") and exporter.render_preview(layout) is png
+            assert exporter.render_preview(layout, 2, 3) != png
+            try:
+                exporter.render_preview(layout, full_pages + 1)
+                assert False, "page past the end accepted"
+            except ValueError:
+                pass
+        
+        print("✅ Page preview working correctly")
+        return True
+    except Exception as e:
+        print(f"❌ Page preview test failed: {e}")
+        return False
+
+def test_pdf_streaming():
+    """Test spooling a PDF to a temporary file and streaming it in chunks."""
+    try:
+        import os
+        from paper_layout import build_layout
+        from pdf_exporter import PDFExporter, iter_file_chunks
+        
+        layout = build_layout(_sample_mcq_paper(questions=40), include_answers=True)
+        exporter = PDFExporter()
+        size = len(exporter.render(layout))
+        
+        old = os.environ.get("PDF_SPOOL_MAX_MB")
+        try:
+            for max_mb, on_disk in (("8", False), ("0.001", True)):
+                os.environ["PDF_SPOOL_MAX_MB"] = max_mb
+                spool = exporter.spool(layout)
+                assert spool._rolled == on_disk
+                chunks = list(iter_file_chunks(spool, chunk_size=4096))
+                assert spool.closed and len(chunks) > 1
+                assert chunks[0].startswith(b"%PDF") and len(b"".join(chunks)) == size
+        finally:
+            if old is None:
+                os.environ.pop("PDF_SPOOL_MAX_MB", None)
+            else:
+                os.environ["PDF_SPOOL_MAX_MB"] = old
+        
+        print("✅ PDF streaming working correctly")
+        return True
+    except Exception as e:
+        print(f"❌ PDF streaming test failed: {e}")
+        return False
+
+def test_lazy_startup():
+    """Test that importing the API does not load the heavy dependencies."""
+    try:
+        import subprocess
+
+        script = (
+            "import sys, main; "
+            "print(','.join(m for m in ('sklearn', 'nltk', 'sympy', 'langgraph', 'langchain_openai', 'reportlab') "
+            "if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        loaded = result.stdout.strip()
+        assert not loaded, f"loaded at import: {loaded}"
+
+        # sympy waits for the first equation, not the equation handler
+        script = (
+            "import os, sys; os.environ['EQUATION_POOL_CACHE'] = ''; "
+            "from equation_handler import EquationHandler; "
+            "EquationHandler()._determine_equation_type('Solve the quadratic'); "
+            "print('sympy' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        assert result.stdout.strip() == "False", "sympy loaded before the first equation"
+
+        print("✅ API starts without loading heavy dependencies")
+        return True
+    except Exception as e:
+        print(f"❌ Lazy startup test failed: {e}")
+        return False
+
 async def run_all_tests():
     """Run all tests."""
     print("🚀 Starting IntelliExam AI Backend Tests")
@@ -150,9 +1133,31 @@ async def run_all_tests():
         test_imports,
         test_models,
         test_similarity_analyzer,
+        test_concurrent_similarity,
+        test_hashing_similarity,
+        test_question_index,
+        test_corpus_store,
+        test_inverted_index,
+        test_parallel_preprocessing,
         test_equation_handler,
+        test_equation_classifier,
+        test_equation_pool,
+        test_paper_variants,
+        test_output_parser,
+        test_model_router,
+        test_question_schedule,
+        test_max_paper_generation,
+        test_equation_answers,
+        test_duplicate_detection,
+        test_resume_generation,
         test_question_generator,
         test_pdf_exporter,
+        test_exam_sets,
+        test_paper_layout,
+        test_question_flowable_cache,
+        test_page_preview,
+        test_pdf_streaming,
+        test_lazy_startup,
     ]
     
     passed = 0
@@ -163,7 +1168,8 @@ async def run_all_tests():
             if asyncio.iscoroutinefunction(test):
                 result = await test()
             else:
-                result = test()
+                # Off the event loop, so tests can drive their own asyncio.run()
+                result = await asyncio.to_thread(test)
             if result:
                 passed += 1
         except Exception as e: